@@ -25,9 +25,9 @@ import shutil
 import filecmp
 import atg_execution.merge_display_attributes as atg_merge_attrs
 import atg_execution.strip_unchanged_attributes as atg_proc_unchanged
+import atg_execution.log_store as atg_log_store
 import atg_execution.misc as atg_misc
 
-
 FILE_BL = "bl.tst"
 FILE_ATG = "atg.tst"
 FILE_MERGED = "merged.tst"
@@ -37,22 +37,72 @@ FILE_INTERMEDIATE = "intermediate.tst"
 FILE_STRIPPED = "stripped.tst"
 FILE_FINAL = "final.tst"
 
+# Prefix of the lines with which clicast echoes each command of a command file
+COMMAND_ECHO = ">> "
+
 SCRIPTS_HOME_DIR = os.path.dirname(__file__)
 ENV_EXT = ".env"
 VC_PATH = os.getenv("VECTORCAST_DIR")
 
 
+def command_line(args):
+    """
+    A line of a clicast command file -- arguments with spaces (or quotes) are
+    double-quoted, so that clicast reads them as one
+    """
+    quoted = []
+    for arg in args:
+        if not arg or any(char.isspace() or char == '"' for char in arg):
+            arg = '"{:s}"'.format(arg.replace('"', '\\"'))
+        quoted.append(arg)
+    return " ".join(quoted)
+
+
+def split_echoed_output(out, commands):
+    """
+    Splits the output of a clicast command file into a section per command,
+    on the lines where clicast echoes each command. Output before the first
+    echo (all of it, if nothing is echoed) goes to the first command
+    """
+    sections = [[] for _ in commands]
+    current = 0
+    next_command = 0
+    for line in out.splitlines(True):
+        if (
+            next_command < len(commands)
+            and line.startswith(COMMAND_ECHO)
+            and line[len(COMMAND_ECHO) :].strip() == commands[next_command]
+        ):
+            current = next_command
+            next_command += 1
+            continue
+        sections[current].append(line)
+    return ["".join(section) for section in sections]
+
+
 @atg_misc.for_all_methods(
     atg_misc.log_entry_exit, exclude_methods=["get_incr_call_count"]
 )
 class Baseline:
-    def __init__(self, env_file, verbose=True, disable_failures=False):
+    def __init__(
+        self,
+        env_file,
+        verbose=True,
+        disable_failures=False,
+        memory_limit_kb=None,
+        batch_clicast=False,
+    ):
         self.env_file = os.path.basename(env_file)
         self.env_dir = os.path.splitext(self.env_file)[0]
         self.workdir = os.path.dirname(os.path.abspath(env_file))
         self.call_count = dict()
         self.verbose = verbose
         self.disable_failures = disable_failures
+        self.memory_limit_kb = memory_limit_kb
+
+        # Do we queue clicast commands and run them from a command file?
+        self.batch_clicast = batch_clicast
+        self.clicast_queue = []
 
     def __repr__(self):
         return str({"env_file": self.env_file})
@@ -95,8 +145,17 @@ class Baseline:
         )
 
         # Run the command
-        atg_misc.run_cmd(
-            cmd, cwd=self.workdir, log_file_prefix=log_file_prefix, shell=False
+        return atg_misc.run_cmd(
+            cmd,
+            cwd=self.workdir,
+            log_file_prefix=log_file_prefix,
+            shell=False,
+            context={
+                "stage": "baseline",
+                "environment": os.path.join(self.workdir, self.env_dir),
+                "step": "{:s}_{:d}".format(label, ccount),
+            },
+            memory_limit_kb=self.memory_limit_kb,
         )
 
     def merge_attributes(self, atg_file):
@@ -119,9 +178,67 @@ class Baseline:
         self.run_cmd([vpython, strip_fail_script, file_1, file_2, disable_failures_str])
 
     def run_clicast(self, args, label="clicast"):
+        if self.batch_clicast:
+            self.clicast_queue.append((args, label))
+            return
+
         clicast = os.path.join(VC_PATH, "clicast")
         self.run_cmd([clicast] + args, label=label)
 
+    def flush_clicast(self):
+        """
+        Runs the queued clicast commands from one command file, then splits
+        clicast's output into a log per command (named as if each had been
+        run on its own)
+        """
+        if not self.clicast_queue:
+            return
+
+        queued = self.clicast_queue
+        self.clicast_queue = []
+
+        # Write the command file (next to the log that run_cmd will write)
+        ccount = self.call_count.get("clicast_batch", 0) + 1
+        command_file = "clicast_batch_out_{:d}.cmd".format(ccount)
+        commands = [command_line(args) for args, _ in queued]
+        with open(os.path.join(self.workdir, command_file), "w") as command_fd:
+            command_fd.write("\n".join(commands) + "\n")
+
+        # One clicast for the lot
+        clicast = os.path.join(VC_PATH, "clicast")
+        out, err, returncode = self.run_cmd(
+            [clicast, "-lc", "tools", "execute", command_file, "true"],
+            label="clicast_batch",
+        )
+
+        # If clicast didn't echo the commands, we can't tell which output is
+        # whose, so run the rest of this environment's commands one by one
+        echoed = any(line.startswith(COMMAND_ECHO) for line in out.splitlines())
+        if not echoed and len(commands) > 1:
+            atg_misc.print_warn(
+                "clicast did not echo the commands of {:s}: its output is all in the first command's log, and the remaining commands are run one by one".format(
+                    os.path.join(self.workdir, command_file)
+                )
+            )
+            self.batch_clicast = False
+
+        # Which output belongs to which command?
+        sections = split_echoed_output(out, commands)
+        for (args, label), command, section in zip(queued, commands, sections):
+            step_count = self.get_incr_call_count(label)
+            step_log = os.path.join(
+                self.workdir, "{:s}_out_{:d}.out".format(label, step_count)
+            )
+            atg_log_store.write_log(
+                step_log,
+                "## {:s} (from {:s})\n{:s}".format(command, command_file, section),
+                {
+                    "stage": "baseline",
+                    "environment": os.path.join(self.workdir, self.env_dir),
+                    "step": "{:s}_{:d}".format(label, step_count),
+                },
+            )
+
     def run(
         self,
         run_atg=True,
@@ -150,6 +267,8 @@ class Baseline:
         if run_atg:
             self.run_clicast(["-e", self.env_dir, "tools", "auto_atg_test", atg_file])
 
+        self.flush_clicast()
+
         if parallel_object:
             parallel_object.move_progress_bar()
 
@@ -169,6 +288,7 @@ class Baseline:
         self.run_clicast(
             ["-e", self.env_dir, "test", "script", "create", FILE_EXPECTEDS]
         )
+        self.flush_clicast()
 
         if parallel_object:
             parallel_object.move_progress_bar()
@@ -198,6 +318,7 @@ class Baseline:
         self.run_clicast(
             ["-e", self.env_dir, "test", "script", "create", FILE_INTERMEDIATE]
         )
+        self.flush_clicast()
 
         self.copyfile(FILE_INTERMEDIATE, "stripped_1.tst")
 
@@ -234,6 +355,7 @@ class Baseline:
             self.run_clicast(
                 ["-e", self.env_dir, "test", "script", "create", next_file]
             )
+            self.flush_clicast()
 
             if parallel_object:
                 parallel_object.move_progress_bar()
@@ -24,8 +24,60 @@ import os
 import shutil
 import tempfile
 
+import atg_execution.journal as atg_journal
+import atg_execution.manage_cli as atg_manage_cli
 import atg_execution.misc as atg_misc
 
+# How much of the end of a builder log we read first
+BUILD_LOG_TAIL_BYTES = 64 * 1024
+
+
+def find_build_dirs(root):
+    """
+    Yields (build directory, names of its '.env' files) for each folder
+    under 'root' that has a CCAST_.CFG. A build directory's sub-folders
+    (the built environments, with all of their harness files) are not
+    entered
+    """
+    pending = [root]
+    while pending:
+        folder = pending.pop()
+        sub_folders = []
+        env_files = []
+        is_build_dir = False
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    sub_folders.append(entry.path)
+                elif entry.name == "CCAST_.CFG":
+                    is_build_dir = True
+                elif entry.name.lower().endswith(".env"):
+                    env_files.append(entry.name)
+        if is_build_dir:
+            yield folder, env_files
+        else:
+            pending.extend(sub_folders)
+
+
+def file_contains(path, needle, tail_bytes=BUILD_LOG_TAIL_BYTES):
+    """
+    Does the file at 'path' contain 'needle'? The end of the file is read
+    first, then (if need be) the rest of it
+    """
+    needle = needle.encode()
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        tail_start = max(0, size - tail_bytes)
+        f.seek(tail_start)
+        if needle in f.read():
+            return True
+        if tail_start == 0:
+            return False
+
+        # Read the rest, overlapping the tail so that nothing is split
+        f.seek(0)
+        return needle in f.read(tail_start + len(needle) - 1)
+
 
 @atg_misc.for_all_methods(atg_misc.log_entry_exit)
 class ManageBuilder(atg_misc.ParallelExecutor):
@@ -69,6 +121,12 @@ class ManageBuilder(atg_misc.ParallelExecutor):
         # Do we allow for broken environments?
         self.allow_broken_environments = configuration.options.allow_broken_environments
 
+        # If an earlier run built the project, re-use it
+        if atg_journal.journal.completed("build_manage") is not None:
+            atg_misc.print_warn("Re-using the Manage project built by an earlier run")
+            self.skip_build = True
+            self.clean_up = False
+
         if self.skip_build:
             assert not self.clean_up
             assert os.path.isdir(self.build_folder)
@@ -91,8 +149,16 @@ class ManageBuilder(atg_misc.ParallelExecutor):
         # Where are we going to run commands?
         self.cwd = os.path.dirname(self.manage_root_dir)
 
-        # What's the name of the Manage executable?
-        self.manage_exe = os.path.expandvars(os.path.join("$VECTORCAST_DIR", "manage"))
+        # Where do we keep populated build folders? (None if we don't)
+        if configuration.options.manage_cache_dir:
+            self.skeleton_cache = atg_manage_cli.SkeletonCache(
+                configuration.options.manage_cache_dir
+            )
+        else:
+            self.skeleton_cache = None
+
+        # What the populated build folder depends on (if it is cached)
+        self.skeleton_key = None
 
         # What's the name of the clicast executable?
         self.clicast_exe = os.path.expandvars(
@@ -108,36 +174,15 @@ class ManageBuilder(atg_misc.ParallelExecutor):
     def __repr__(self):
         return str({"manage_vcm_path": self.manage_vcm_path})
 
-    def run_manage_command(self, cmd_suffix):
+    def run_manage_command(self, operation):
         """
-        Helper to run part of a Manage command
+        Helper to run (or, in a batch, queue) part of a Manage command (a
+        list of arguments)
         """
+        atg_manage_cli.manage_cli.command(self.project_name, operation, self.cwd)
 
-        # Build-up the full command
-        full_cmd = "{manage:s} -p {project:s} {cmd_suffix:s}".format(
-            manage=self.manage_exe, project=self.project_name, cmd_suffix=cmd_suffix
-        )
-
-        # Run it
-        out, _, returncode = atg_misc.run_cmd(full_cmd, self.cwd)
-
-        # Did we get a non-zero return code?
-        if returncode:
-
-            # string that suggests there's a licensing failure
-            license_string = "icens"
-
-            # What's our base message?
-            base_error = "Command '{:s}' failed".format(full_cmd)
-
-            # What's our suffix?
-            if license_string in out:
-                suffix = " -- missing license?"
-            else:
-                suffix = ""
-
-            # Raise an error
-            raise RuntimeError("{:s}{:s}".format(base_error, suffix))
+    def manage_batch(self):
+        return atg_manage_cli.manage_cli.batch(self.project_name, self.cwd)
 
     def add_script(self, script_path, script_name):
         """
@@ -145,12 +190,10 @@ class ManageBuilder(atg_misc.ParallelExecutor):
         """
 
         # Add the script to the Python repository
-        add_script = "--python-repository --add {script:s}".format(script=script_path)
-        self.run_manage_command(add_script)
+        self.run_manage_command(["--python-repository", "--add", script_path])
 
         # Set it as the build script
-        build_script = "--build-script {script:s}".format(script=script_name)
-        self.run_manage_command(build_script)
+        self.run_manage_command(["--build-script", script_name])
 
     def populate_build_folder(self):
         """
@@ -159,63 +202,69 @@ class ManageBuilder(atg_misc.ParallelExecutor):
 
         # Build the project
         if self.compiler_node:
-            build_project = "--level {:s}".format(self.compiler_node)
+            build_project = ["--level", self.compiler_node]
         else:
-            build_project = ""
+            build_project = []
 
-        build_project = "{:s} --build".format(build_project)
+        build_project.append("--build")
 
         self.run_manage_command(build_project)
 
-        # Make sure we now have a build folder!
-        assert os.path.isdir(self.build_folder)
-
     def remove_script(self, script_name):
         """
         Remove our tempoary build script
         """
 
         # Set the build script to be nothing (removes the option)
-        build_script = "--build-script {script:s}".format(script='""')
-        self.run_manage_command(build_script)
+        self.run_manage_command(["--build-script", ""])
 
         # Remove our temporary script
-        delete_script = "--python-repository --remove {script:s}".format(
-            script=script_name
+        self.run_manage_command(["--python-repository", "--remove", script_name])
+
+    def restore_build_folder(self):
+        """
+        Re-uses the populated build folder of an earlier run, if the project
+        hasn't changed since
+        """
+        if self.skeleton_cache is None:
+            return False
+
+        self.skeleton_key = atg_manage_cli.skeleton_key(
+            self.manage_vcm_path, self.compiler_node
         )
-        self.run_manage_command(delete_script)
+        if not self.skeleton_cache.restore(self.skeleton_key, self.build_folder):
+            return False
+
+        atg_misc.print_warn("Re-using the populated build folder of an earlier run")
+        return True
+
+    def store_build_folder(self):
+        if self.skeleton_cache is not None:
+            self.skeleton_cache.store(self.skeleton_key, self.build_folder)
 
     def discover_environments(self):
         """
         Walk the Manage build folder and discover the VectorCAST environments
         """
 
-        # Walk the root
-        for root, _, files in os.walk(self.build_folder):
+        #
+        # We only want to process environments that have a CCAST_.CFG next
+        # to them.
+        #
+        # For example, the 'environment' folder in Manage _does not_ have
+        # this.
+        #
+        for root, env_files in find_build_dirs(self.build_folder):
 
-            # For each file
-            for fname in files:
+            # What's the build folder?
+            build_dir = os.path.abspath(root)
 
-                # If the file ends with '.env'
-                if fname.lower().endswith(".env"):
+            for fname in env_files:
 
-                    # What's the environment name?
-                    env_name = os.path.splitext(fname)[0]
+                # What's the environment name?
+                env_name = os.path.splitext(fname)[0]
 
-                    # What's the build folder?
-                    build_dir = os.path.abspath(root)
-
-                    #
-                    # We only want to process environments that have a
-                    # CCAST_.CFG next to them.
-                    #
-                    # For example, the 'environment' folder in Manage _does
-                    # not_ have this.
-                    #
-                    if os.path.exists(os.path.join(build_dir, "CCAST_.CFG")):
-
-                        # If we have 'CCAST_.CFG', store this folder
-                        self.all_environments.add((env_name, build_dir))
+                self.all_environments.add((env_name, build_dir))
 
     def build_environments(self):
         # Build the environments in parallel
@@ -224,7 +273,11 @@ class ManageBuilder(atg_misc.ParallelExecutor):
 
     def check_built_environments(self):
         # Build the environments in parallel
-        self.run_routine_parallel(self.check_env, self.all_environments)
+        self.run_routine_parallel(
+            self.check_env,
+            self.all_environments,
+            concurrency_class=atg_misc.CONCURRENCY_IO,
+        )
 
     def process(self):
         """
@@ -232,7 +285,7 @@ class ManageBuilder(atg_misc.ParallelExecutor):
         """
         atg_misc.print_msg("Processing Manage project")
 
-        if not self.skip_build:
+        if not self.skip_build and not self.restore_build_folder():
             # Get a temporary file with a Python suffix
             with tempfile.NamedTemporaryFile(suffix=".py") as temp_file:
 
@@ -242,14 +295,24 @@ class ManageBuilder(atg_misc.ParallelExecutor):
                 # Basename
                 basename = os.path.basename(full_temp_file)
 
-                # Add the script
-                self.add_script(full_temp_file, basename)
+                with self.manage_batch():
 
-                # Populate Manage's build folder
-                self.populate_build_folder()
+                    # Add the script
+                    self.add_script(full_temp_file, basename)
 
-                # Remove the script
-                self.remove_script(basename)
+                    # Populate Manage's build folder
+                    self.populate_build_folder()
+
+                # Make sure we now have a build folder!
+                assert os.path.isdir(self.build_folder)
+
+                with self.manage_batch():
+
+                    # Remove the script
+                    self.remove_script(basename)
+
+            # Keep it for the next run
+            self.store_build_folder()
 
         # Find all of the build environments (starting from our Manage project root)
         self.discover_environments()
@@ -261,6 +324,10 @@ class ManageBuilder(atg_misc.ParallelExecutor):
             # Find those that have already built
             self.check_built_environments()
 
+        # Record that we're done with the build
+        if atg_journal.journal.completed("build_manage") is None:
+            atg_journal.journal.record("build_manage", ())
+
         atg_misc.print_msg("Manage project processed")
 
     def check_env(self, env_name, env_location, returncode=False):
@@ -299,17 +366,22 @@ class ManageBuilder(atg_misc.ParallelExecutor):
         assert not os.path.exists(built_env)
 
         # Clicast command to build on environment
-        cmd = "{clicast:s} -lc environment script run {env_script:s}".format(
-            clicast=self.clicast_exe, env_script=env_script
-        )
+        cmd = [self.clicast_exe, "-lc", "environment", "script", "run", env_script]
 
         # Log to the file 'rebuild'
         output_prefix = os.path.join(env_location, "rebuild")
 
-        # Run our command
-        _, _, returncode = atg_misc.run_cmd(
-            cmd, env_location, log_file_prefix=output_prefix
-        )
+        # Wait until we have the memory to run clicast
+        with self.memory_admission("build_env", built_env):
+
+            # Run our command
+            _, _, returncode = atg_misc.run_cmd(
+                cmd,
+                env_location,
+                log_file_prefix=output_prefix,
+                context={"stage": "build_env", "environment": built_env},
+                memory_limit_kb=self.memory_limit_kb,
+            )
 
         success = self.check_env(env_name, env_location, returncode=returncode)
 
@@ -338,8 +410,8 @@ class ManageBuilder(atg_misc.ParallelExecutor):
 
         build_log = os.path.join(built_env, "environment_builder.log")
         if os.path.exists(build_log):
-            build_log_content = open(build_log).read()
-            build_success = "Environment built Successfully" in build_log_content
+            # The success line is at the end, so read that first
+            build_success = file_contains(build_log, "Environment built Successfully")
         else:
             build_success = False
 
@@ -32,7 +32,9 @@ configuration = namedtuple(
         "env_vars",
         "final_tst_path",
         "find_unchanged_files",
+        "find_all_files",
         "store_updated_tests",
+        "store_updated_batch",
         "options",
     ],
 )
@@ -62,8 +64,12 @@ def parse_configuration(configuration_dict, options):
     else:
         store_updated_tests = configuration_dict["store_updated_tests"]
 
+    store_updated_batch = configuration_dict.get("store_updated_batch", None)
+
     find_unchanged_files = configuration_dict.get("find_unchanged_files", None)
 
+    find_all_files = configuration_dict.get("find_all_files", None)
+
     env_vars = configuration_dict.get("env_vars", None)
 
     return configuration(
@@ -73,7 +79,9 @@ def parse_configuration(configuration_dict, options):
         env_vars,
         final_tst_path,
         find_unchanged_files,
+        find_all_files,
         store_updated_tests,
+        store_updated_batch,
         options,
     )
 
@@ -21,29 +21,36 @@
 # THE SOFTWARE.
 
 import os
+import csv
+import json
 from terminaltables import AsciiTable
 from textwrap import wrap
 
 
-def find_all_files_from_root(root, exts=[]):
+def find_all_files_from_root(root, exts=()):
+    """
+    All of the files under 'root', relative to it (only those ending with
+    one of 'exts', if given). Nothing starting with '.git' is entered
+    """
 
+    exts = tuple(ext.lower() for ext in exts)
     all_files = set()
 
-    for root, _, files in os.walk(root):
-        if root.startswith(".git"):
-            continue
-
-        for fname in files:
-            if fname.startswith(".git"):
-                continue
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as entries:
+            for entry in entries:
+                if entry.name.startswith(".git"):
+                    continue
 
-            for ext in exts:
-                if fname.lower().endswith(ext):
-                    all_files.add(os.path.join(root, fname))
-            else:
-                all_files.add(os.path.join(root, fname))
+                rel_path = os.path.join(rel_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(rel_path)
+                elif not exts or entry.name.lower().endswith(exts):
+                    all_files.add(rel_path)
 
-    return set(sorted(all_files))
+    return all_files
 
 
 def join_wrap_list(alist, max_width=20):
@@ -56,19 +63,70 @@ def join_wrap_list(alist, max_width=20):
     return wrapped
 
 
-def files_report(configuration, unchanged_files, environment_dependencies):
+def write_rows(path, report_format, fields, rows):
+    """
+    Streams 'rows' (dicts keyed on 'fields') to 'path', as JSON Lines or as
+    CSV (where lists are joined with ';')
+    """
+    with open(path, "w", newline="") as report_file:
+        if report_format == "jsonl":
+            for row in rows:
+                report_file.write(json.dumps(row) + "\n")
+        else:
+            writer = csv.DictWriter(report_file, fieldnames=fields)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(
+                    {
+                        field: ";".join(value) if isinstance(value, list) else value
+                        for field, value in row.items()
+                    }
+                )
+    print("Details written to {:s}".format(path))
+
+
+def report_path(report_file, name, report_format):
+    return "{:s}_{:s}.{:s}".format(report_file, name, report_format)
+
+
+FILE_FIELDS = ["file", "needs_processing", "used_by"]
+
+
+def file_rows(all_files, changed_files, environment_dependencies):
+    """
+    A row for each file that an environment uses
+    """
+    fnames_to_envs = environment_dependencies.fnames_to_envs
+    for rel_fname in sorted(all_files.intersection(fnames_to_envs)):
+        used_by = fnames_to_envs[rel_fname]
+        if not used_by:
+            continue
+        yield {
+            "file": rel_fname,
+            "needs_processing": rel_fname in changed_files,
+            "used_by": sorted(os.path.basename(env) for env in used_by),
+        }
+
+
+def files_report(
+    configuration,
+    unchanged_files,
+    environment_dependencies,
+    report_format="table",
+    report_file=None,
+):
     print("*" * 10 + " Files report " + "*" * 10)
     repository_path = configuration.repository_path
-    all_files = find_all_files_from_root(repository_path)
-    rel_all_files = set(
-        [os.path.relpath(fname, repository_path) for fname in all_files]
-    )
+
+    # Ask the configuration (e.g., its SCM) first, and only walk if we must
+    if configuration.find_all_files is not None:
+        rel_all_files = set(configuration.find_all_files())
+    else:
+        rel_all_files = find_all_files_from_root(repository_path)
     changed_files = rel_all_files - unchanged_files
 
-    exts = [".c", ".h"]
-    src_files = [
-        fname for fname in rel_all_files if any([fname.endswith(ext) for ext in exts])
-    ]
+    exts = (".c", ".h")
+    src_files = {fname for fname in rel_all_files if fname.endswith(exts)}
 
     changed_src_files = changed_files.intersection(src_files)
     unchanged_src_files = unchanged_files.intersection(src_files)
@@ -87,28 +145,75 @@ def files_report(configuration, unchanged_files, environment_dependencies):
     ]
     print(AsciiTable(environment_stats_data).table)
 
+    rows = file_rows(rel_all_files, changed_files, environment_dependencies)
+
+    if report_format != "table":
+        path = report_path(report_file, "files", report_format)
+        write_rows(path, report_format, FILE_FIELDS, rows)
+        return
+
     environment_details_data = [
         ["Filename", "Needs\nprocessing?", "Used by\n(count)", "Used by"],
     ]
-    for rel_fname in sorted(rel_all_files):
-        impacted = rel_fname in changed_files
-        used_by = environment_dependencies.fnames_to_envs.get(rel_fname, [])
-        if not used_by:
-            continue
-        used_by_count = len(used_by)
-        used_by_str = join_wrap_list([os.path.basename(env) for env in used_by])
+    for row in rows:
         environment_details_data.append(
-            [rel_fname, impacted, used_by_count, used_by_str]
+            [
+                row["file"],
+                row["needs_processing"],
+                len(row["used_by"]),
+                join_wrap_list(row["used_by"]),
+            ]
         )
     print(AsciiTable(environment_details_data).table)
 
 
+ENVIRONMENT_FIELDS = [
+    "environment",
+    "path",
+    "built",
+    "needs_processing",
+    "units",
+    "routines",
+    "dependencies",
+    "impacted_dependencies",
+]
+
+
+def environment_rows(
+    unchanged_files, manage_builder, environment_dependencies, impacted_envs
+):
+    """
+    A row for each environment in the Manage project
+    """
+    for env, path in sorted(manage_builder.all_environments):
+        env_path = os.path.join(path, env)
+        used_files = environment_dependencies.envs_to_fnames.get(env_path, set())
+        units = environment_dependencies.envs_to_units.get(env_path, {})
+
+        rout_count = 0
+        for _, functions in units.items():
+            rout_count += len(functions)
+
+        yield {
+            "environment": env,
+            "path": path,
+            "built": (env, path) in manage_builder.built_environments,
+            "needs_processing": env_path in impacted_envs,
+            "units": len(units),
+            "routines": rout_count,
+            "dependencies": sorted(used_files),
+            "impacted_dependencies": sorted(used_files.difference(unchanged_files)),
+        }
+
+
 def environments_report(
     configuration,
     unchanged_files,
     manage_builder,
     environment_dependencies,
     impacted_envs,
+    report_format="table",
+    report_file=None,
 ):
     print("*" * 10 + " Environments report " + "*" * 10)
     failed_envs = manage_builder.all_environments - manage_builder.built_environments
@@ -127,6 +232,15 @@ def environments_report(
     ]
     print(AsciiTable(file_stat_data).table)
 
+    rows = environment_rows(
+        unchanged_files, manage_builder, environment_dependencies, impacted_envs
+    )
+
+    if report_format != "table":
+        path = report_path(report_file, "environments", report_format)
+        write_rows(path, report_format, ENVIRONMENT_FIELDS, rows)
+        return
+
     file_details_data = [
         [
             "Environment",
@@ -140,40 +254,188 @@ def environments_report(
             "Impacted\ndependencies",
         ],
     ]
-    for env, path in sorted(manage_builder.all_environments):
-        env_path = os.path.join(path, env)
-        needs_processing = env_path in impacted_envs
-        used_files = environment_dependencies.envs_to_fnames.get(env_path, set())
-        used_files_count = len(used_files)
-        units = environment_dependencies.envs_to_units.get(env_path, {})
+    for row in rows:
+        file_details_data.append(
+            [
+                row["environment"],
+                join_wrap_list([row["path"]]),
+                row["built"],
+                row["needs_processing"],
+                row["units"],
+                row["routines"],
+                len(row["dependencies"]),
+                join_wrap_list(row["dependencies"]),
+                join_wrap_list(row["impacted_dependencies"]),
+            ]
+        )
 
-        built = (env, path) in manage_builder.built_environments
+    print(AsciiTable(file_details_data).table)
 
-        path = join_wrap_list([path])
-        deps = join_wrap_list(used_files)
 
-        used_changed = used_files.difference(unchanged_files)
-        used_changed_str = join_wrap_list(used_changed)
+def resource_report(usage_table, tools=("pyedg", "clicast"), count=10):
+    print("*" * 10 + " Resource usage report " + "*" * 10)
 
-        rout_count = 0
-        for _, functions in units.items():
-            rout_count += len(functions)
+    tool_stats_data = [
+        [
+            "Tool",
+            "Invocations",
+            "CPU seconds\n(user+sys)",
+            "Wall seconds",
+            "Largest peak\nRSS (MiB)",
+        ],
+    ]
+    for tool in tools:
+        records = usage_table.for_tool(tool)
+        if not records:
+            continue
+        cpu_seconds = sum(
+            [
+                record.user_seconds + record.sys_seconds
+                for record in records
+                if record.user_seconds is not None
+            ]
+        )
+        wall_seconds = sum([record.wall_seconds for record in records])
+        max_rss = max([record.max_rss_kb or 0 for record in records])
+        tool_stats_data.append(
+            [
+                tool,
+                len(records),
+                "{:.1f}".format(cpu_seconds),
+                "{:.1f}".format(wall_seconds),
+                "{:.1f}".format(max_rss / 1024.0),
+            ]
+        )
+    print(AsciiTable(tool_stats_data).table)
 
-        file_details_data.append(
+    stage_stats_data = [
+        [
+            "Stage",
+            "Concurrency\nclass",
+            "Workers",
+            "Wall\nseconds",
+            "Children",
+            "Running\nchildren",
+            "Busy\nCPUs",
+            "Over-\nsubscription",
+            "CPU\nutilisation",
+        ],
+    ]
+    for stage in usage_table.stages:
+        stage_stats_data.append(
             [
-                env,
-                path,
-                built,
-                needs_processing,
-                len(units),
-                rout_count,
-                used_files_count,
-                deps,
-                used_changed_str,
+                stage.stage,
+                stage.concurrency_class,
+                stage.workers,
+                "{:.1f}".format(stage.wall_seconds),
+                stage.children,
+                "{:.1f}".format(stage.running_children),
+                "{:.1f}".format(stage.busy_cpus),
+                "{:.2f}".format(stage.oversubscription),
+                "{:.0%}".format(stage.cpu_utilisation),
             ]
         )
+    print(AsciiTable(stage_stats_data).table)
 
-    print(AsciiTable(file_details_data).table)
+    for tool in tools:
+        heaviest = usage_table.heaviest(tool, "max_rss_kb", count=count)
+        if not heaviest:
+            continue
+
+        print("Heaviest {:s} invocations (by peak RSS)".format(tool))
+        tool_details_data = [
+            [
+                "Stage",
+                "Environment",
+                "Routine\n(or step)",
+                "Peak RSS\n(MiB)",
+                "CPU seconds\n(user/sys)",
+                "Wall\nseconds",
+                "Block I/O\n(in/out)",
+                "Return\ncode",
+            ],
+        ]
+        for record in heaviest:
+            routine = record.routine or record.step
+            tool_details_data.append(
+                [
+                    record.stage,
+                    join_wrap_list([os.path.basename(record.environment)]),
+                    join_wrap_list([routine], max_width=30),
+                    "{:.1f}".format(record.max_rss_kb / 1024.0),
+                    "{:.1f}/{:.1f}".format(record.user_seconds, record.sys_seconds),
+                    "{:.1f}".format(record.wall_seconds),
+                    "{:d}/{:d}".format(record.block_in, record.block_out),
+                    "timeout" if record.timeout_exceeded else record.returncode,
+                ]
+            )
+        print(AsciiTable(tool_details_data).table)
+
+
+def failure_report(failure_skips):
+    if not failure_skips:
+        return
+
+    print("*" * 10 + " Skipped failing routines report " + "*" * 10)
+
+    failure_data = [
+        ["Environment", "Unit", "Routine", "Failures", "Last outcome"],
+    ]
+    for environment, unit, routine, entry in sorted(
+        failure_skips, key=lambda skip: skip[:3]
+    ):
+        failure_data.append(
+            [
+                join_wrap_list([os.path.basename(environment)]),
+                join_wrap_list([unit]),
+                join_wrap_list([routine], max_width=30),
+                entry["failures"],
+                entry["outcome"],
+            ]
+        )
+    print(AsciiTable(failure_data).table)
+
+
+def manage_report(manage_cli):
+    print("*" * 10 + " Manage report " + "*" * 10)
+    manage_data = [
+        ["Manage invocations", "Operations"],
+        [manage_cli.invocations, manage_cli.operations],
+    ]
+    print(AsciiTable(manage_data).table)
+
+
+def plan_report(plan, timeout_policy, workers):
+    print("*" * 10 + " Execution plan report " + "*" * 10)
+
+    plan_data = [
+        ["Environment", "Unit", "Routines", "Expected\nseconds"],
+    ]
+    guessed_routines = 0
+    for invocation in plan.invocations:
+        cost, guessed = plan.expected_cost(invocation, timeout_policy)
+        if guessed:
+            guessed_routines += 1
+        plan_data.append(
+            [
+                join_wrap_list([os.path.basename(invocation["environment"])]),
+                join_wrap_list([invocation["unit"]]),
+                join_wrap_list(invocation["routines"], max_width=30),
+                "{:.1f}{:s}".format(cost, " *" if guessed else ""),
+            ]
+        )
+    print(AsciiTable(plan_data).table)
+
+    print(
+        "{invocations:d} PyEDG invocations ({guessed:d} with no history, marked "
+        "with *, use their timeout)".format(
+            invocations=len(plan.invocations), guessed=guessed_routines
+        )
+    )
+    print(
+        "Predicted ATG wall-clock with {workers:d} workers: {seconds:.0f} "
+        "seconds".format(workers=workers, seconds=plan.predict(workers, timeout_policy))
+    )
 
 
 def debug_report(
@@ -182,9 +444,17 @@ def debug_report(
     manage_builder,
     environment_dependencies,
     impacted_envs,
+    report_format="table",
+    report_file=None,
 ):
 
-    files_report(configuration, unchanged_files, environment_dependencies)
+    files_report(
+        configuration,
+        unchanged_files,
+        environment_dependencies,
+        report_format,
+        report_file,
+    )
 
     environments_report(
         configuration,
@@ -192,6 +462,8 @@ def debug_report(
         manage_builder,
         environment_dependencies,
         impacted_envs,
+        report_format,
+        report_file,
     )
 
 
@@ -42,7 +42,50 @@ def get_default_parser():
         "-p", "--config_py", required=True, help="Python configuration object", type=str
     )
     parser.add("-t", "--timeout", required=True, help="timeout", type=int)
+    parser.add(
+        "--adaptive_timeout",
+        required=False,
+        help="learn timeouts from the durations in the history file",
+        type=boolean_string,
+    )
+    parser.add(
+        "--timeout_percentile",
+        required=False,
+        help="percentile of earlier durations used for learned timeouts",
+        type=int,
+    )
+    parser.add(
+        "--timeout_slack",
+        required=False,
+        help="learned timeouts are the percentile multiplied by this",
+        type=float,
+    )
+    parser.add(
+        "--max_timeout",
+        required=False,
+        help="upper bound on learned timeouts (None for no bound)",
+        type=nullable_int,
+    )
+    parser.add(
+        "--time_budget",
+        required=False,
+        help="seconds the whole run must fit in (None for no budget)",
+        type=nullable_int,
+    )
     parser.add("-r", "--report", required=True, help="report", type=boolean_string)
+    parser.add(
+        "--report_format",
+        required=False,
+        help="table (summary and details on the terminal), or jsonl/csv (summary "
+        "on the terminal, details streamed to files)",
+        choices=["table", "jsonl", "csv"],
+    )
+    parser.add(
+        "--report_file",
+        required=False,
+        help="prefix of the detailed report files (for jsonl/csv)",
+        type=str,
+    )
     parser.add("-dr", "--dry_run", required=True, help="dry-run", type=boolean_string)
     parser.add(
         "-bli",
@@ -57,6 +100,19 @@ def get_default_parser():
     )
     parser.add("--limit_unchanged", required=True, help="limit unchanged", type=int)
     parser.add("--allow_moves", required=True, help="allow moves", type=boolean_string)
+    parser.add(
+        "--manage_coalesce",
+        required=False,
+        help="run compatible Manage operations in one invocation",
+        type=boolean_string,
+    )
+    parser.add(
+        "--manage_cache_dir",
+        required=False,
+        help="keep populated Manage build folders here, to re-use them while the "
+        "project is unchanged (None to not keep them)",
+        type=nullable_string,
+    )
     parser.add(
         "--allow_broken_environments",
         required=True,
@@ -75,24 +131,182 @@ def get_default_parser():
         type=boolean_string,
     )
     parser.add("-j", "--workers", required=False, help="workers", type=nullable_int)
+    parser.add(
+        "--workers_compile",
+        required=False,
+        help="workers for environment builds/baselining (None for --workers)",
+        type=nullable_int,
+    )
+    parser.add(
+        "--workers_atg",
+        required=False,
+        help="workers for running ATG (None for --workers)",
+        type=nullable_int,
+    )
+    parser.add(
+        "--workers_io",
+        required=False,
+        help="workers for file-processing stages (None for 4x --workers)",
+        type=nullable_int,
+    )
+    parser.add(
+        "--pin_cpus",
+        required=False,
+        help="comma-separated concurrency classes (compile,atg,io) whose "
+        "children are each pinned to one CPU",
+        type=nullable_string,
+    )
     parser.add(
         "--atg_work_dir",
         required=False,
         help="set the ATG working directory",
         type=nullable_string,
     )
+    parser.add(
+        "--resume",
+        required=False,
+        help="resume an interrupted run from the journal in the ATG working directory",
+        type=boolean_string,
+    )
     parser.add(
         "--gen_fptrs",
         required=False,
         help="Generate function pointers",
         type=boolean_string,
     )
+    parser.add(
+        "--skip_covered",
+        required=False,
+        help="skip routines that the existing tests already fully cover",
+        type=boolean_string,
+    )
+    parser.add(
+        "--atg_batch_seconds",
+        required=False,
+        help="expected seconds of routines to run in one PyEDG (None for no batching)",
+        type=nullable_int,
+    )
+    parser.add(
+        "--atg_max_batch",
+        required=False,
+        help="most routines to run in one PyEDG",
+        type=int,
+    )
+    parser.add(
+        "--plan_file",
+        required=False,
+        help="file to save the plan of PyEDG invocations to",
+        type=nullable_string,
+    )
+    parser.add(
+        "--publish_batch_files",
+        required=False,
+        help="finished files handed to 'store_updated_batch' at once",
+        type=int,
+    )
+    parser.add(
+        "--publish_batch_seconds",
+        required=False,
+        help="longest a finished file waits for 'store_updated_batch'",
+        type=int,
+    )
+    parser.add(
+        "--validate_tsts",
+        required=False,
+        help="check each generated tst, quarantining those that are invalid",
+        type=boolean_string,
+    )
+    parser.add(
+        "--salvage_partial",
+        required=False,
+        help="keep the complete tests of routines that time-out",
+        type=boolean_string,
+    )
+    parser.add(
+        "--dedup_tests",
+        required=False,
+        help="drop duplicate ATG tests before baselining",
+        type=boolean_string,
+    )
+    parser.add(
+        "--minimise_tests",
+        required=False,
+        help="only keep the ATG tests that add coverage to the final tsts",
+        type=boolean_string,
+    )
+    parser.add(
+        "--batch_clicast",
+        required=False,
+        help="baseline with one clicast per group of commands (a command file)",
+        type=boolean_string,
+    )
     parser.add(
         "--disable_failures",
         required=False,
         help="disable_failures",
         type=boolean_string,
     )
+    parser.add(
+        "--trace_file",
+        required=False,
+        help="write a Chrome trace (and an HTML timeline) of the run",
+        type=nullable_string,
+    )
+    parser.add(
+        "--resource_usage_file",
+        required=False,
+        help="write the resource usage of every subprocess to this CSV file",
+        type=nullable_string,
+    )
+    parser.add(
+        "--log_store",
+        required=False,
+        help="keep the logs of the run in this one indexed, compressed file "
+        "(None to write each log to its own file)",
+        type=nullable_string,
+    )
+    parser.add(
+        "--history_file",
+        required=False,
+        help="file used to learn from the subprocesses of earlier runs",
+        type=nullable_string,
+    )
+    parser.add(
+        "--failure_cache_file",
+        required=False,
+        help="file used to remember the routines ATG keeps failing on",
+        type=nullable_string,
+    )
+    parser.add(
+        "--failure_threshold",
+        required=False,
+        help="failures on unchanged inputs before a routine is skipped",
+        type=int,
+    )
+    parser.add(
+        "--failure_ttl",
+        required=False,
+        help="hours a failing routine is skipped for before it is retried",
+        type=int,
+    )
+    parser.add(
+        "--memory_budget",
+        required=False,
+        help="MiB that concurrent jobs may use in total (None for no limit)",
+        type=nullable_int,
+    )
+    parser.add(
+        "--memory_default",
+        required=False,
+        help="MiB assumed for jobs that are not in the history",
+        type=int,
+    )
+    parser.add(
+        "--memory_limit",
+        required=False,
+        help="MiB of address space any one child can use (None for no limit)",
+        type=nullable_int,
+    )
 
     return parser
 
@@ -148,6 +362,18 @@ def validate_options(options):
         msg = "Generating report and being quiet are not compatible"
         options_are_valid = False
 
+    if options.report_format not in (None, "table") and not options.report_file:
+        msg = "Streaming the report needs a report file"
+        options_are_valid = False
+
+    if options.adaptive_timeout and not options.history_file:
+        msg = "Learning timeouts needs a history file"
+        options_are_valid = False
+
+    if options.resume and not options.atg_work_dir:
+        msg = "Resuming needs an ATG working directory"
+        options_are_valid = False
+
     if not options_are_valid:
         assert msg is not None
         print("INVALID CONFIGURATION -- {:s}".format(msg))
@@ -194,7 +194,11 @@ FROM   functions
 
             execution_context.append([env_path])
 
-        self.run_routine_parallel(self.process_env, execution_context)
+        self.run_routine_parallel(
+            self.process_env,
+            execution_context,
+            concurrency_class=atg_misc.CONCURRENCY_IO,
+        )
 
         atg_misc.print_msg("Environment dependencies discovered")
 
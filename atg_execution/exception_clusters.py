@@ -0,0 +1,173 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import re
+import zlib
+import operator
+import random
+import collections
+
+# A Mersenne prime above every 32-bit hash
+MERSENNE_PRIME = (1 << 61) - 1
+
+token_split_re = re.compile(r"\W+")
+digits_re = re.compile(r"[0-9]+")
+
+
+def tokenise(signature):
+    """
+    Splits an exception signature into words, with numbers replaced by '#'
+    """
+    return [
+        digits_re.sub("#", token) for token in token_split_re.split(signature) if token
+    ]
+
+
+def shingles(tokens, width=2):
+    """
+    The set of runs of 'width' consecutive tokens
+    """
+    if len(tokens) <= width:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i : i + width]) for i in range(len(tokens) - width + 1)}
+
+
+def choose_bands(num_perm, threshold):
+    """
+    Splits 'num_perm' MinHash values into bands of rows, so that two
+    signatures start to share a bucket at about 'threshold' similarity
+    """
+    best = None
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """
+    MinHash signatures of shingle sets
+
+    Each shingle is hashed once, so corpora with many repeated shingles
+    only pay for the permutations of the distinct ones
+    """
+
+    def __init__(self, num_perm=64, seed=1):
+        rng = random.Random(seed)
+        self.perms = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self.shingle_hashes = {}
+
+    def hashes(self, shingle):
+        values = self.shingle_hashes.get(shingle)
+        if values is None:
+            base = zlib.crc32(shingle.encode("utf-8"))
+            values = tuple((a * base + b) % MERSENNE_PRIME for a, b in self.perms)
+            self.shingle_hashes[shingle] = values
+        return values
+
+    def signature(self, shingle_set):
+        return tuple(map(min, zip(*(self.hashes(s) for s in shingle_set))))
+
+
+def similarity(sig_a, sig_b):
+    """
+    Estimated Jaccard similarity of two MinHash signatures
+    """
+    return sum(map(operator.eq, sig_a, sig_b)) / len(sig_a)
+
+
+def cluster_signatures(exception_counts, threshold=0.5, num_perm=64, examples=3):
+    """
+    Groups the keys of 'exception_counts' (signature -> count) that look
+    alike, using MinHash and LSH banding rather than comparing every pair
+
+    Signatures are taken most frequent first: each joins the most similar
+    representative that it shares an LSH bucket with, or becomes a new
+    representative. Every member is therefore similar to its representative
+    (no chaining), and only representatives are compared against
+
+    Returns a list of clusters, most frequent first, each with its
+    representative, its total count, its size and a few example members
+    """
+
+    keys = sorted(exception_counts, key=lambda key: -exception_counts[key])
+    hasher = MinHasher(num_perm)
+    bands, rows = choose_bands(num_perm, threshold)
+
+    # Representatives, bucketed on each band of their signature
+    buckets = collections.defaultdict(list)
+    representatives = []
+    clusters = []
+
+    for key in keys:
+        sig = hasher.signature(shingles(tokenise(key)))
+        band_keys = [
+            (band, sig[band * rows : (band + 1) * rows]) for band in range(bands)
+        ]
+
+        # Which representatives share a bucket with us?
+        candidates = set()
+        for band_key in band_keys:
+            candidates.update(buckets.get(band_key, ()))
+
+        best = None
+        best_similarity = threshold
+        for candidate in candidates:
+            candidate_similarity = similarity(sig, representatives[candidate])
+            if candidate_similarity >= best_similarity:
+                if best is None or (candidate_similarity, -candidate) > (
+                    best_similarity,
+                    -best,
+                ):
+                    best = candidate
+                    best_similarity = candidate_similarity
+
+        if best is None:
+            best = len(representatives)
+            representatives.append(sig)
+            for band_key in band_keys:
+                buckets[band_key].append(best)
+            clusters.append(
+                {"representative": key, "count": 0, "members": 0, "examples": []}
+            )
+
+        cluster = clusters[best]
+        cluster["count"] += exception_counts[key]
+        cluster["members"] += 1
+        if key != cluster["representative"] and len(cluster["examples"]) < examples:
+            cluster["examples"].append(
+                {"signature": key, "count": exception_counts[key]}
+            )
+
+    clusters.sort(key=lambda cluster: -cluster["count"])
+    return clusters
+
+
+# EOF
@@ -2,11 +2,16 @@
 
 import os
 import json
+import hashlib
 import operator
+import argparse
 import collections
+import multiprocessing
 import tqdm
 import re
 
+import atg_execution.exception_clusters as atg_exception_clusters
+import atg_execution.exception_index as atg_exception_index
 
 ALT_EXC_PREFIX = "## --- "
 EXC_PREFIX = "## "
@@ -28,6 +33,25 @@ def find_files_with_ext(dirpath, extension):
 last_line_re = re.compile(r"^## [A-z_]*:")
 
 
+# Tokens that differ between otherwise identical exceptions: a cheap
+# substring that every such token contains, its pattern and its replacement
+VOLATILE_TOKENS = [
+    ("0x", re.compile(r"\b0x[0-9a-fA-F]+\b"), "0x?"),
+    ("size=", re.compile(r"\bsize=-?[0-9]+"), "size=?"),
+    ("region=", re.compile(r"\bregion=\S+"), "region=?"),
+]
+
+
+def normalise_volatile(line):
+    """
+    Replaces the addresses, sizes and region names in 'line'
+    """
+    for marker, token_re, replacement in VOLATILE_TOKENS:
+        if marker in line:
+            line = token_re.sub(replacement, line)
+    return line
+
+
 class LineSanitiser:
 
     ACTIONS = {
@@ -37,7 +61,6 @@ class LineSanitiser:
         "Expecting a fieldpath ending with function pointer": "remove_after_second_arrow",
         "Function pointer has no candidate function mapping": "remove_after_first_arrow",
         "Non-NULL pointer const used": "remove_after_second_arrow",
-        "Trying to overwrite the value": "remove_after_second_arrow",
         "Unable to find a VCAST user global": "remove_after_second_arrow",
         "Unable to get allocation const": "remove_after_second_arrow",
         "Missing memory region": "remove_after_second_arrow",
@@ -46,23 +69,29 @@ class LineSanitiser:
         "Needs-Alloc handling crashed": "remove_after_first_arrow",
     }
 
+    # All the triggers as one pattern: a single search finds the trigger
+    TRIGGER_RE = re.compile("|".join(re.escape(trigger) for trigger in ACTIONS))
+
     def __init__(self, line):
         self.line = line
 
     def proc(self):
+        self.dispatch()
+        self.line = normalise_volatile(self.line)
+        return self.line
 
-        for trigger, action_name in LineSanitiser.ACTIONS.items():
-            if trigger in self.line and False:
-                try:
-                    action_method = getattr(self, "action_" + action_name)
-                except AttributeError as e:
-                    raise RuntimeError(
-                        "Action not handled/installed: {:s}".format(str(e))
-                    )
+    def dispatch(self):
 
-                action_method()
+        # The leftmost trigger in the line wins
+        match = LineSanitiser.TRIGGER_RE.search(self.line)
+        if match is not None:
+            action_name = LineSanitiser.ACTIONS[match.group(0)]
+            try:
+                action_method = getattr(self, "action_" + action_name)
+            except AttributeError as e:
+                raise RuntimeError("Action not handled/installed: {:s}".format(str(e)))
 
-        return self.line
+            action_method()
 
     def action_remove_region_name(self):
         """
@@ -80,7 +109,7 @@ class LineSanitiser:
             self.line = left + right
         except Exception:
             # if failed, fallback to remove_after_second_arrow
-            self.remove_after_second_arrow()
+            self.action_remove_after_second_arrow()
 
     def action_remove_after_first_arrow(self):
         """
@@ -125,7 +154,7 @@ class LineSanitiser:
         OUT:
         ## ATGUnexpected: Invalid TEST.VALUE line (validation failed) value: <<malloc 1>>
         """
-        self.remove_after_second_arrow()
+        self.action_remove_after_second_arrow()
         try:
             left, right = self.line.split(EXC_ARROW, 1)
             right = right.split("value: ", 1)[1]
@@ -166,6 +195,9 @@ class ExceptionData:
         if sanitised_line != last_line:
             self.replace_last_line(sanitised_line)
 
+        # Object reprs in the traceback carry addresses too
+        self.lines[:-1] = [normalise_volatile(line) for line in self.lines[:-1]]
+
     def replace_last_line(self, new_line):
         self.lines.pop()
         self.lines.append(new_line)
@@ -195,32 +227,163 @@ class TstLine:
         return line
 
 
+# Version of the cached per-file results -- bump it when what's cached changes
+# (or the sanitiser changes in a way that its rules don't show)
+CACHE_FORMAT = 2
+
+
+def cache_version():
+    """
+    What the cached signatures depend on: the format of the cache and the
+    sanitiser's rules (a cache written with others is thrown away)
+    """
+    rules = [
+        CACHE_FORMAT,
+        sorted(LineSanitiser.ACTIONS.items()),
+        [[marker, token_re.pattern, rep] for marker, token_re, rep in VOLATILE_TOKENS],
+    ]
+    return hashlib.sha1(json.dumps(rules).encode("utf-8")).hexdigest()
+
+
+def file_stamp(path):
+    """
+    What identifies the contents of 'path' without reading it
+    """
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def scan_tst_file(tst_path):
+    """
+    Counts the exceptions of a single .tst file (pool worker)
+    """
+    tst_stats = TstStats()
+    tst_stats.process_tst_file(tst_path)
+    return (
+        tst_path,
+        {
+            "counts": tst_stats.exception_counts,
+            "occurrences": tst_stats.file_occurrences,
+        },
+    )
+
+
+def environment_of(tst_path):
+    """
+    The environment a .tst is for, from its name ('<env>.tst' or
+    '<env>_atg.tst')
+    """
+    env = os.path.splitext(os.path.basename(tst_path))[0]
+    if env.endswith("_atg"):
+        env = env[: -len("_atg")]
+    return env
+
+
 class TstStats:
-    def __init__(self, root_dir=None):
+    def __init__(self, root_dir=None, workers=1, cache_file=None):
         if root_dir is None:
             self.root_dir = "."
         else:
             self.root_dir = root_dir
 
+        self.workers = workers
+        self.cache_file = cache_file
+        self.rescanned = 0
+
         self.exception_counts = {}
 
+        # What's each exception we saw: (environment, test, signature, last line)
+        self.occurrences = []
+        self.file_occurrences = []
+
     def run(self):
         self.process_all_tst_files()
 
-    def process_all_tst_files(self):
+    def load_cache(self):
+        """
+        Per-file counts from a previous run, keyed on absolute path (none if
+        the cache was written by another version)
+        """
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            # A damaged cache just means a full rescan
+            return {}
+        if not isinstance(cache, dict) or cache.get("version") != cache_version():
+            return {}
+        return cache["files"]
+
+    def save_cache(self, cache):
+        if not self.cache_file:
+            return
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"version": cache_version(), "files": cache}, f)
+        os.replace(tmp_file, self.cache_file)
 
-        tst_files = find_files_with_ext(".", ".tst")
+    def process_all_tst_files(self):
 
-        with tqdm.tqdm(total=len(tst_files)) as pbar:
-            for tst_path in tst_files:
-                self.process_tst_file(tst_path)
-                pbar.update(1)
+        # Sorted, so that ties in the counts always come out in the same order
+        tst_files = sorted(find_files_with_ext(self.root_dir, ".tst"))
+
+        old_cache = self.load_cache()
+        new_cache = {}
+        file_results = {}
+        stale = []
+
+        # What can we reuse from the last run?
+        for tst_path in tst_files:
+            key = os.path.abspath(tst_path)
+            stamp = file_stamp(tst_path)
+            entry = old_cache.get(key)
+            if entry is not None and entry["stamp"] == stamp:
+                file_results[tst_path] = entry["result"]
+            else:
+                stale.append(tst_path)
+            new_cache[key] = {"stamp": stamp}
+
+        self.rescanned = len(stale)
+
+        # Map: count each changed file, in a pool if asked to
+        with tqdm.tqdm(total=len(stale)) as pbar:
+            if self.workers > 1 and len(stale) > 1:
+                chunksize = max(1, len(stale) // (self.workers * 4))
+                with multiprocessing.Pool(self.workers) as pool:
+                    for tst_path, result in pool.imap_unordered(
+                        scan_tst_file, stale, chunksize=chunksize
+                    ):
+                        file_results[tst_path] = result
+                        pbar.update(1)
+            else:
+                for tst_path in stale:
+                    file_results[tst_path] = scan_tst_file(tst_path)[1]
+                    pbar.update(1)
+
+        # Reduce: merge in file order, so the result matches a serial scan
+        for tst_path in tst_files:
+            result = file_results[tst_path]
+            new_cache[os.path.abspath(tst_path)]["result"] = result
+            for exception_key, count in result["counts"].items():
+                self.exception_counts.setdefault(exception_key, 0)
+                self.exception_counts[exception_key] += count
+            env = environment_of(tst_path)
+            for test, exception_key, last_line in result["occurrences"]:
+                self.occurrences.append((env, test, exception_key, last_line))
+
+        # Only files that still exist make it into the new cache
+        self.save_cache(new_cache)
 
     def save_exception(self, exception_data):
         exception_data.sanitise()
         exception_key = exception_data.key_data()
         self.exception_counts.setdefault(exception_key, 0)
         self.exception_counts[exception_key] += 1
+        self.file_occurrences.append(
+            [self.current_test, exception_key, exception_data.last_line]
+        )
 
     def save_current_exception(self):
         if self.current_exception is not None:
@@ -231,11 +394,21 @@ class TstStats:
 
         ex_open = False
         self.current_exception = None
+        self.current_test = None
+        subprogram = ""
 
         for line in open(tst_path):
 
             line = TstLine.normalise(line)
 
+            # Which test are we in?
+            if line.startswith("TEST.SUBPROGRAM:"):
+                subprogram = line[len("TEST.SUBPROGRAM:") :]
+            elif line.startswith("TEST.NAME:"):
+                self.current_test = "{:s}.{:s}".format(
+                    subprogram, line[len("TEST.NAME:") :]
+                )
+
             #
             # If there is no exception marker, then
             # there is nothing to process
@@ -272,12 +445,28 @@ class TstStats:
             print(count)
             print(exception)
 
-    def save_json(self):
-        with open("exceptions.json", "w") as f:
+    def save_json(self, path="exceptions.json"):
+        with open(path, "w") as f:
             json.dump(self.exception_counts, f)
 
-    def save_txt(self):
-        with open("exceptions.txt", "w") as f:
+    def save_clusters(self, path, threshold):
+        clusters = atg_exception_clusters.cluster_signatures(
+            self.exception_counts, threshold=threshold
+        )
+        with open(path, "w") as f:
+            json.dump(clusters, f, indent=2)
+
+    def save_index(self, db_path, label=None):
+        index = atg_exception_index.ExceptionIndex(db_path)
+        try:
+            return index.add_run(
+                self.occurrences, label=label, root_dir=os.path.abspath(self.root_dir)
+            )
+        finally:
+            index.close()
+
+    def save_txt(self, path="exceptions.txt"):
+        with open(path, "w") as f:
             for exception, count in self.exception_counts.items():
                 f.write("=" * 20 + "\n")
                 f.write(str(count) + "\n")
@@ -285,18 +474,71 @@ class TstStats:
                 f.write("=" * 20 + "\n")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Counts the ATG exceptions recorded in .tst files"
+    )
+    parser.add_argument(
+        "root_dir", nargs="?", default=".", help="Directory to search for .tst files"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="Processes used to scan .tst files (1 to scan serially)",
+    )
+    parser.add_argument(
+        "--cache_file",
+        default=None,
+        help="JSON file of per-file counts, so unchanged .tst files are not rescanned",
+    )
+    parser.add_argument("--json", default=None, help="Also write the counts as JSON")
+    parser.add_argument(
+        "--txt", default="exceptions.txt", help="Where to write the text report"
+    )
+    parser.add_argument(
+        "--index",
+        default=None,
+        help="SQLite exception index to append this run to",
+    )
+    parser.add_argument(
+        "--run_label", default=None, help="Label for this run in the index"
+    )
+    parser.add_argument(
+        "--clusters",
+        default=None,
+        help="Also write clusters of similar exceptions as JSON",
+    )
+    parser.add_argument(
+        "--cluster_threshold",
+        type=float,
+        default=0.5,
+        help="How similar (0 to 1) exceptions must be to share a cluster",
+    )
+    return parser.parse_args()
+
+
 def main():
     """
     MAIN
     """
-    tst_stats = TstStats()
+    args = parse_args()
+
+    tst_stats = TstStats(
+        root_dir=args.root_dir, workers=args.workers, cache_file=args.cache_file
+    )
     tst_stats.run()
 
     tst_stats._sort_counts()
 
     # tst_stats.print_exceptions()
-    # tst_stats.save_json()
-    tst_stats.save_txt()
+    if args.json:
+        tst_stats.save_json(args.json)
+    tst_stats.save_txt(args.txt)
+    if args.index:
+        tst_stats.save_index(args.index, args.run_label)
+    if args.clusters:
+        tst_stats.save_clusters(args.clusters, args.cluster_threshold)
 
 
 if __name__ == "__main__":
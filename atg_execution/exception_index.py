@@ -0,0 +1,212 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import collections
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    label TEXT,
+    root_dir TEXT
+);
+CREATE TABLE IF NOT EXISTS signatures (
+    id INTEGER PRIMARY KEY,
+    signature TEXT NOT NULL UNIQUE,
+    last_line TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS signatures_fts USING fts5(
+    signature, last_line, content='signatures', content_rowid='id'
+);
+CREATE TABLE IF NOT EXISTS exceptions (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    environment TEXT NOT NULL,
+    test TEXT,
+    signature_id INTEGER NOT NULL REFERENCES signatures(id),
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS exceptions_by_signature
+    ON exceptions(signature_id, run_id);
+CREATE INDEX IF NOT EXISTS exceptions_by_run ON exceptions(run_id);
+"""
+
+
+def phrase(text):
+    """
+    Quotes 'text' as one FTS5 phrase
+    """
+    return '"{:s}"'.format(text.replace('"', '""'))
+
+
+class ExceptionIndex:
+    """
+    SQLite store of the exceptions of each run, with a full-text index
+    over the signatures, so they can be queried without the .tst files
+    """
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        try:
+            self.conn.executescript(SCHEMA)
+        except sqlite3.OperationalError as e:
+            raise RuntimeError(
+                "Cannot create the exception index (is FTS5 available?): {:s}".format(
+                    str(e)
+                )
+            )
+
+    def close(self):
+        self.conn.close()
+
+    def signature_ids(self, signatures):
+        """
+        Ids for each of 'signatures' (signature -> last line), adding (and
+        indexing) the ones that are new
+        """
+        ids = {}
+        for signature, last_line in signatures.items():
+            row = self.conn.execute(
+                "SELECT id FROM signatures WHERE signature = ?", (signature,)
+            ).fetchone()
+            if row is None:
+                cursor = self.conn.execute(
+                    "INSERT INTO signatures (signature, last_line) VALUES (?, ?)",
+                    (signature, last_line),
+                )
+                row = (cursor.lastrowid,)
+                self.conn.execute(
+                    "INSERT INTO signatures_fts (rowid, signature, last_line) "
+                    "VALUES (?, ?, ?)",
+                    (row[0], signature, last_line),
+                )
+            ids[signature] = row[0]
+        return ids
+
+    def add_run(self, occurrences, label=None, root_dir=None):
+        """
+        Appends a run: 'occurrences' are (environment, test, signature,
+        last line) for each exception seen. Returns the run's id
+        """
+
+        # What did each test hit, and how often?
+        counts = collections.Counter()
+        last_lines = {}
+        for environment, test, signature, last_line in occurrences:
+            counts[(environment, test, signature)] += 1
+            last_lines.setdefault(signature, last_line)
+
+        with self.conn:
+            run_id = self.conn.execute(
+                "INSERT INTO runs (started, label, root_dir) VALUES (?, ?, ?)",
+                (time.time(), label, root_dir),
+            ).lastrowid
+            ids = self.signature_ids(last_lines)
+            self.conn.executemany(
+                "INSERT INTO exceptions "
+                "(run_id, environment, test, signature_id, count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    (run_id, environment, test, ids[signature], count)
+                    for (environment, test, signature), count in counts.items()
+                ),
+            )
+        return run_id
+
+    def runs(self, last_runs):
+        """
+        The last 'last_runs' runs, oldest first
+        """
+        return list(
+            reversed(
+                self.conn.execute(
+                    "SELECT id, started, label FROM runs ORDER BY id DESC LIMIT ?",
+                    (last_runs,),
+                ).fetchall()
+            )
+        )
+
+    def environments(self, query, last_runs=10, raw=False):
+        """
+        For the environments that hit exceptions matching 'query' in the
+        last 'last_runs' runs: how many runs, how many tests and how many
+        exceptions
+        """
+        return self.conn.execute(
+            """
+            SELECT e.environment, COUNT(DISTINCT e.run_id),
+                   COUNT(DISTINCT e.test), SUM(e.count)
+            FROM exceptions AS e
+            WHERE e.signature_id IN (
+                SELECT rowid FROM signatures_fts WHERE signatures_fts MATCH ?
+            )
+            AND e.run_id IN (SELECT id FROM runs ORDER BY id DESC LIMIT ?)
+            GROUP BY e.environment
+            ORDER BY SUM(e.count) DESC, e.environment
+            """,
+            (query if raw else phrase(query), last_runs),
+        ).fetchall()
+
+    def trend(self, query, last_runs=10, raw=False, limit=20):
+        """
+        For the (at most 'limit') signatures matching 'query': their last
+        lines and their counts in each of the last 'last_runs' runs
+        """
+        runs = self.runs(last_runs)
+        run_ids = [run[0] for run in runs]
+        if not run_ids:
+            return runs, []
+
+        rows = self.conn.execute(
+            """
+            SELECT s.id, s.last_line, e.run_id, SUM(e.count)
+            FROM signatures AS s
+            JOIN exceptions AS e ON e.signature_id = s.id
+            WHERE s.id IN (
+                SELECT rowid FROM signatures_fts WHERE signatures_fts MATCH ?
+            )
+            AND e.run_id >= ?
+            GROUP BY s.id, e.run_id
+            """,
+            (query if raw else phrase(query), run_ids[0]),
+        ).fetchall()
+
+        per_signature = collections.OrderedDict()
+        for signature_id, last_line, run_id, count in rows:
+            entry = per_signature.setdefault(
+                signature_id, {"last_line": last_line, "counts": {}}
+            )
+            entry["counts"][run_id] = count
+
+        # Most frequent (over the runs) first
+        trends = sorted(
+            per_signature.values(), key=lambda entry: -sum(entry["counts"].values())
+        )[:limit]
+        return runs, [
+            (entry["last_line"], [entry["counts"].get(run_id, 0) for run_id in run_ids])
+            for entry in trends
+        ]
+
+
+# EOF
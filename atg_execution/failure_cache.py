@@ -0,0 +1,155 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+import atg_execution.run_history as atg_run_history
+
+# Outcome of a routine killed by the run's time budget (and not by its own
+# timeout) -- it says nothing about the routine, so it isn't recorded
+BUDGET_OUTCOME = "time budget"
+
+
+def fingerprint(tu_hash, edg_flags, routine):
+    """
+    Fingerprint of the inputs to ATG for one routine -- if any of them
+    changes, so does the fingerprint
+    """
+    digest = hashlib.sha1()
+    for part in (tu_hash, edg_flags, routine):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class FailureCache(object):
+    """
+    Persists the routines for which ATG keeps failing (timeouts, non-zero
+    return codes or no .tst produced), so that a routine that failed
+    'threshold' times on unchanged inputs is skipped for 'ttl_seconds'
+    """
+
+    def __init__(self):
+
+        # Where is the cache stored? (None if it isn't)
+        self.cache_path = None
+
+        # How many failures before we skip a routine?
+        self.threshold = 3
+
+        # How long do we skip a routine for? (seconds)
+        self.ttl_seconds = 0
+
+        # For each key, the fingerprint, failures and when we last failed
+        self.entries = {}
+
+        # Mutex to allow for threads to query/update the cache
+        self.mutex = threading.Lock()
+
+    def load(self, cache_path, threshold, ttl_seconds):
+        """
+        Loads the cache (if any) from 'cache_path'
+        """
+        self.cache_path = cache_path
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+
+        if os.path.exists(cache_path):
+            with open(cache_path) as cache_fd:
+                self.entries = json.load(cache_fd)
+
+    def save(self):
+        if self.cache_path is None:
+            return
+
+        with self.mutex:
+            with open(self.cache_path, "w") as cache_fd:
+                json.dump(self.entries, cache_fd, indent=1, sort_keys=True)
+
+    def skip(self, environment, unit, routine, inputs):
+        """
+        If this routine should be skipped, returns its cache entry (otherwise
+        returns None)
+        """
+        if self.cache_path is None:
+            return None
+
+        key = atg_run_history.history_key("atg", environment, unit, routine)
+
+        with self.mutex:
+            entry = self.entries.get(key)
+
+            # Never failed
+            if entry is None:
+                return None
+
+            # The inputs changed, so forget the failures
+            if entry["fingerprint"] != inputs:
+                del self.entries[key]
+                return None
+
+            if entry["failures"] < self.threshold:
+                return None
+
+            # Give it another go once the TTL expires
+            if time.time() - entry["last_failure"] > self.ttl_seconds:
+                return None
+
+            return dict(entry)
+
+    def record(self, environment, unit, routine, inputs, outcome):
+        """
+        Records the outcome of ATG for a routine ('outcome' is None if it
+        succeeded, otherwise the reason it failed)
+        """
+        if self.cache_path is None or outcome == BUDGET_OUTCOME:
+            return
+
+        key = atg_run_history.history_key("atg", environment, unit, routine)
+
+        with self.mutex:
+
+            # Success clears the slate
+            if outcome is None:
+                self.entries.pop(key, None)
+                return
+
+            entry = self.entries.get(key)
+            if entry is None or entry["fingerprint"] != inputs:
+                entry = {"fingerprint": inputs, "failures": 0}
+                self.entries[key] = entry
+
+            entry["failures"] += 1
+            entry["outcome"] = outcome
+            entry["last_failure"] = time.time()
+
+
+# The failure cache for this process
+failure_cache = FailureCache()
+
+
+# EOF
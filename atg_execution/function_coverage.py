@@ -0,0 +1,90 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+from __future__ import (
+    absolute_import,
+    print_function,
+    unicode_literals,
+)
+
+import json
+import sys
+from vector.apps.DataAPI.unit_test_api import Api
+
+
+class FunctionCoverage(object):
+    """
+    Uses DataAPI to dump the statement/branch coverage of each function of an
+    environment (as recorded in its cover.db)
+    """
+
+    def __init__(self, env_name, output_json):
+
+        # Environment we're processing
+        self.env_name = env_name
+
+        # Where we write the coverage to
+        self.output_json = output_json
+
+        # API object on our environment
+        self.api = Api(self.env_name)
+
+    def calculate_coverage(self):
+        """
+        For each unit and function, the number of (covered) statements and
+        branches
+        """
+        coverage = {}
+
+        for unit in self.api.Unit.all():
+            unit_coverage = coverage.setdefault(unit.name, {})
+
+            for function in unit.functions:
+                metrics = function.cover_data.metrics
+                unit_coverage[function.name] = {
+                    "statements": metrics.statements,
+                    "covered_statements": metrics.covered_statements,
+                    "branches": metrics.branches,
+                    "covered_branches": metrics.covered_branches,
+                }
+
+        return coverage
+
+    def main(self):
+        """
+        Entry-point for the class
+        """
+        with open(self.output_json, "w") as output_fd:
+            json.dump(self.calculate_coverage(), output_fd)
+
+
+if __name__ == "__main__":
+
+    # Params
+    env_name = sys.argv[1]
+    output_json = sys.argv[2]
+
+    # Run it
+    FunctionCoverage(env_name, output_json).main()
+
+# EOF
@@ -0,0 +1,252 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+# Name of the journal inside of the work directory
+JOURNAL_NAME = "journal.jsonl"
+
+
+def file_hash(path):
+    """
+    SHA-1 of the contents of 'path'
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as path_fd:
+        for chunk in iter(lambda: path_fd.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def journal_key(stage, *parts):
+    """
+    Key for a work item
+    """
+    return "|".join((stage,) + tuple(parts))
+
+
+def journal_header(options):
+    """
+    The options that the results of a run depend on -- a run can only be
+    resumed with the same ones
+    """
+    return {
+        "config_py": os.path.abspath(options.config_py),
+        "timeout": options.timeout,
+        "baseline_iterations": options.baseline_iterations,
+        "atg_batch_seconds": options.atg_batch_seconds,
+        "salvage_partial": options.salvage_partial,
+        "validate_tsts": options.validate_tsts,
+        "skip_covered": options.skip_covered,
+        "dedup_tests": options.dedup_tests,
+        "minimise_tests": options.minimise_tests,
+    }
+
+
+class RunJournal(object):
+    """
+    Append-only record of the completed work items of a run (with the paths
+    and hashes of what they produced), so that an interrupted run can be
+    resumed
+    """
+
+    def __init__(self):
+
+        # Where is the journal? (None if we're not journaling)
+        self.journal_path = None
+
+        # Where is the work directory?
+        self.work_dir = None
+
+        # Has the work directory been cleaned-up (or, when resuming, the
+        # journal repaired)? Until then, nothing is written
+        self.started = False
+
+        # Entries to write once we've started
+        self.pending = []
+
+        # The complete lines of the journal we're resuming (None if we're not)
+        self.resumed_lines = None
+
+        # For each completed work item, its artefacts and data
+        self.entries = {}
+
+        # Mutex to allow for threads to update the journal
+        self.mutex = threading.Lock()
+
+    def open(self, work_dir, header, resume=False):
+        """
+        Journals in 'work_dir' -- when resuming, the existing journal is loaded
+        (and must have been written with the same 'header'), otherwise the work
+        directory will be cleaned-up by start()
+        """
+        self.work_dir = work_dir
+        self.journal_path = os.path.join(work_dir, JOURNAL_NAME)
+
+        if resume and os.path.exists(self.journal_path):
+            self.load(header)
+            return
+
+        self.append({"header": header})
+
+    def start(self):
+        """
+        Starts writing the journal: nothing in the work directory is touched
+        before this (e.g., by a dry-run)
+        """
+        if self.journal_path is None or self.started:
+            return
+
+        if self.resumed_lines is not None:
+            # Drop any torn line, so that we append after a complete one
+            with open(self.journal_path, "w") as journal_fd:
+                for line in self.resumed_lines:
+                    journal_fd.write(line if line.endswith("\n") else line + "\n")
+        else:
+            #  Clean-up
+            if os.path.exists(self.work_dir):
+                shutil.rmtree(self.work_dir)
+
+            # Make it
+            os.mkdir(self.work_dir)
+
+        with self.mutex:
+            self.started = True
+            pending, self.pending = self.pending, []
+
+        for entry in pending:
+            self.append(entry)
+
+    def load(self, header):
+        """
+        Loads the journal, checking that it belongs to this run
+        """
+        with open(self.journal_path) as journal_fd:
+            lines = journal_fd.readlines()
+
+        # How many lines are complete?
+        complete = len(lines)
+
+        for line_number, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line is torn if we died whilst writing it
+                if line_number == len(lines) - 1:
+                    complete = line_number
+                    break
+                raise RuntimeError(
+                    "{:s}:{:d} is corrupt, cannot resume".format(
+                        self.journal_path, line_number + 1
+                    )
+                )
+
+            if "header" in entry:
+                if entry["header"] != header:
+                    raise RuntimeError(
+                        "{:s} was written with different options, "
+                        "cannot resume".format(self.journal_path)
+                    )
+                continue
+
+            self.entries[entry["key"]] = entry
+
+        # Repaired by start()
+        self.resumed_lines = lines[:complete]
+
+    def append(self, entry):
+        """
+        Durably appends an entry to the journal
+        """
+        with self.mutex:
+            if not self.started:
+                self.pending.append(entry)
+                return
+            with open(self.journal_path, "a") as journal_fd:
+                journal_fd.write("{:s}\n".format(json.dumps(entry, sort_keys=True)))
+                journal_fd.flush()
+                os.fsync(journal_fd.fileno())
+
+    def record(self, stage, parts, artefacts=None, data=None):
+        """
+        Records that a work item completed, producing the 'artefacts' (a
+        mapping from names to paths, or None if nothing was produced)
+        """
+        if self.journal_path is None:
+            return
+
+        hashed = {}
+        for name, path in (artefacts or {}).items():
+            hashed[name] = {
+                "path": path,
+                "sha1": file_hash(path) if path is not None else None,
+            }
+
+        entry = {
+            "key": journal_key(stage, *parts),
+            "artefacts": hashed,
+            "data": data,
+        }
+
+        self.append(entry)
+
+        with self.mutex:
+            self.entries[entry["key"]] = entry
+
+    def completed(self, stage, *parts):
+        """
+        If the work item completed and its artefacts are still intact, returns
+        its entry -- otherwise returns None (and the item needs to be re-run)
+        """
+        with self.mutex:
+            entry = self.entries.get(journal_key(stage, *parts))
+
+        if entry is None:
+            return None
+
+        for artefact in entry["artefacts"].values():
+            if artefact["path"] is None:
+                continue
+            if not os.path.isfile(artefact["path"]):
+                return None
+            if file_hash(artefact["path"]) != artefact["sha1"]:
+                return None
+
+        return entry
+
+    def artefact(self, entry, name):
+        """
+        Path of an artefact of a completed entry
+        """
+        return entry["artefacts"][name]["path"]
+
+
+# The journal for this process
+journal = RunJournal()
+
+
+# EOF
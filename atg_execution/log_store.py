@@ -0,0 +1,167 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import json
+import time
+import zlib
+import fnmatch
+import threading
+
+# Fields of the index that say what produced a log
+KEY_FIELDS = ("environment", "unit", "routine", "stage", "step")
+
+
+def index_path(store_path):
+    return "{:s}.idx".format(store_path)
+
+
+class LogStore(object):
+    """
+    Keeps the logs of a run in one append-only file rather than a file each
+
+    Each log is compressed on its own and appended to '<store>'; a line of
+    '<store>.idx' records its name, what produced it (KEY_FIELDS), and its
+    offset and length, so any log can be read back without the others
+    """
+
+    def __init__(self):
+
+        # Where are we writing to? (None if logs go to their own files)
+        self.store_path = None
+
+        # Our open data and index files
+        self.data_fd = None
+        self.index_fd = None
+
+        # Mutex to allow for threads to append
+        self.mutex = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.data_fd is not None
+
+    def open(self, store_path):
+        """
+        Appends this run's logs to 'store_path'
+        """
+        self.store_path = store_path
+        self.data_fd = open(store_path, "ab")
+        self.index_fd = open(index_path(store_path), "a")
+
+    def close(self):
+        if self.enabled:
+            self.data_fd.close()
+            self.index_fd.close()
+            self.data_fd = None
+            self.index_fd = None
+
+    def write(self, path, content, context=None):
+        """
+        Stores 'content', the log that would have been written to 'path'
+        """
+        data = zlib.compress(content.encode("utf-8", "replace"))
+
+        entry = {"name": os.path.basename(path), "time": time.time()}
+        for field in KEY_FIELDS:
+            entry[field] = (context or {}).get(field)
+        entry["size"] = len(content)
+        entry["length"] = len(data)
+
+        with self.mutex:
+            entry["offset"] = self.data_fd.seek(0, os.SEEK_END)
+            self.data_fd.write(data)
+            self.data_fd.flush()
+
+            # Only indexed once the data is there
+            self.index_fd.write(json.dumps(entry, sort_keys=True) + "\n")
+            self.index_fd.flush()
+
+    def ingest(self, path, context=None):
+        """
+        Moves the log file at 'path' (e.g., written by a tool) into the store
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, errors="replace") as log_fd:
+            self.write(path, log_fd.read(), context)
+        os.remove(path)
+
+
+def write_log(path, content, context=None):
+    """
+    Writes a log to 'path', or to the log store if there is one
+    """
+    if log_store.enabled:
+        log_store.write(path, content, context)
+    else:
+        with open(path, "w") as log_fd:
+            log_fd.write(content)
+
+
+def read_index(store_path):
+    """
+    The entries of a store's index, skipping any that were torn by a crash
+    """
+    data_size = os.path.getsize(store_path)
+    entries = []
+    with open(index_path(store_path)) as index_fd:
+        for line in index_fd:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry["offset"] + entry["length"] <= data_size:
+                entries.append(entry)
+    return entries
+
+
+def matches(entry, environment=None, routine=None, stage=None, name=None):
+    """
+    Does 'entry' match all of the given filters? The environment matches on
+    its full path or its name, and the name is a glob
+    """
+    if environment is not None:
+        env_path = entry["environment"] or ""
+        if environment not in (env_path, os.path.basename(env_path)):
+            return False
+    if routine is not None and entry["routine"] != routine:
+        return False
+    if stage is not None and entry["stage"] != stage:
+        return False
+    if name is not None and not fnmatch.fnmatch(entry["name"], name):
+        return False
+    return True
+
+
+def read_entry(store_path, entry):
+    with open(store_path, "rb") as data_fd:
+        data_fd.seek(entry["offset"])
+        data = data_fd.read(entry["length"])
+    return zlib.decompress(data).decode("utf-8")
+
+
+# Global log store
+log_store = LogStore()
+
+# EOF
@@ -0,0 +1,240 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import shlex
+import shutil
+import hashlib
+import threading
+
+import atg_execution.misc as atg_misc
+
+
+class ManageCli(object):
+    """
+    Runs Manage commands against a project and counts the invocations
+
+    Inside 'batch()', operations are queued; when 'coalesce' is set they are
+    then run as one 'manage' invocation (in order), otherwise one each
+    """
+
+    def __init__(self):
+
+        # How many times have we started Manage, and for how many operations?
+        self.invocations = 0
+        self.operations = 0
+
+        # Can Manage take several operations per invocation?
+        self.coalesce = False
+
+        # Operations queued by 'batch()'
+        self.queued = None
+
+        # Mutex to allow for threads to share the counters
+        self.mutex = threading.Lock()
+
+    def manage_exe(self):
+        return os.path.expandvars(os.path.join("$VECTORCAST_DIR", "manage"))
+
+    def run(
+        self, project, operations, cwd, log_file_prefix=None, context=None, check=True
+    ):
+        """
+        Runs 'operations' (each a list of arguments) in one invocation of
+        Manage on 'project'
+        """
+
+        # Build-up the full command
+        full_cmd = [self.manage_exe(), "-p", project]
+        for operation in operations:
+            full_cmd.extend(operation)
+
+        with self.mutex:
+            self.invocations += 1
+            self.operations += len(operations)
+
+        # What we show (for errors and for the usage table)
+        cmd_str = " ".join(shlex.quote(arg) for arg in full_cmd)
+
+        if context is None:
+            context = {"stage": "manage", "step": " ".join(full_cmd[3:])}
+
+        # Run it
+        out, _, returncode = atg_misc.run_cmd(
+            full_cmd, cwd, log_file_prefix=log_file_prefix, context=context
+        )
+
+        # Did we get a non-zero return code?
+        if returncode and check:
+
+            # string that suggests there's a licensing failure
+            license_string = "icens"
+
+            # What's our base message?
+            base_error = "Command '{:s}' failed".format(cmd_str)
+
+            # What's our suffix?
+            if license_string in out:
+                suffix = " -- missing license?"
+            else:
+                suffix = ""
+
+            # Raise an error
+            raise RuntimeError("{:s}{:s}".format(base_error, suffix))
+
+        return out, returncode
+
+    def command(self, project, operation, cwd):
+        """
+        Runs (or, inside 'batch()', queues) one operation
+        """
+        if self.queued is not None:
+            self.queued.append(operation)
+        else:
+            self.run(project, [operation], cwd)
+
+    def batch(self, project, cwd):
+        return ManageBatch(self, project, cwd)
+
+
+class ManageBatch(object):
+    """
+    Context manager that queues Manage operations and runs them on exit
+    """
+
+    def __init__(self, manage_cli, project, cwd):
+        self.manage_cli = manage_cli
+        self.project = project
+        self.cwd = cwd
+
+    def __enter__(self):
+        self.manage_cli.queued = []
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        queued = self.manage_cli.queued
+        self.manage_cli.queued = None
+
+        # Nothing runs if the batch was abandoned
+        if exc_type is not None or not queued:
+            return False
+
+        if self.manage_cli.coalesce:
+            self.manage_cli.run(self.project, queued, self.cwd)
+        else:
+            for operation in queued:
+                self.manage_cli.run(self.project, [operation], self.cwd)
+
+        return False
+
+
+def hash_folder(digest, folder):
+    """
+    Adds the names and contents of the files under 'folder' to 'digest'
+    """
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for fname in sorted(files):
+            path = os.path.join(root, fname)
+            digest.update(b"\0")
+            digest.update(os.path.relpath(path, folder).encode("utf-8"))
+            digest.update(b"\0")
+            with open(path, "rb") as path_fd:
+                for chunk in iter(lambda: path_fd.read(1 << 20), b""):
+                    digest.update(chunk)
+
+
+def skeleton_key(manage_vcm_path, compiler_node):
+    """
+    What the populated build folder depends on: the project file and where it
+    is (the build folder has absolute paths in it), its environment folder
+    (the environment scripts), the compiler node and the VectorCAST
+    installation
+    """
+    digest = hashlib.sha1()
+    with open(manage_vcm_path, "rb") as vcm_fd:
+        digest.update(vcm_fd.read())
+    manage_root_dir = os.path.splitext(manage_vcm_path)[0]
+    hash_folder(digest, os.path.join(manage_root_dir, "environment"))
+    for part in (
+        os.path.abspath(manage_vcm_path),
+        compiler_node or "",
+        os.path.expandvars("$VECTORCAST_DIR"),
+    ):
+        digest.update(b"\0")
+        digest.update(part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SkeletonCache(object):
+    """
+    Copies of populated (not yet built) Manage build folders, keyed on
+    'skeleton_key', so that an unchanged project needn't be re-populated
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key, "build")
+
+    def restore(self, key, build_folder):
+        """
+        Copies the cached skeleton (if any) to 'build_folder', which mustn't
+        exist yet
+        """
+        cached = self.path(key)
+        if not os.path.isdir(cached):
+            return False
+        if os.path.exists(build_folder):
+            raise RuntimeError(
+                "{:s} already exists, not restoring".format(build_folder)
+            )
+
+        # Copied aside first, so that a partial copy is never used
+        partial = "{:s}.partial.{:d}".format(build_folder, os.getpid())
+        shutil.copytree(cached, partial, symlinks=True)
+        os.rename(partial, build_folder)
+        return True
+
+    def store(self, key, build_folder):
+        """
+        Keeps a copy of 'build_folder' -- copied aside first, so that a
+        partial copy is never used
+        """
+        cached = self.path(key)
+        if os.path.isdir(cached):
+            return
+        partial = "{:s}.partial.{:d}".format(cached, os.getpid())
+        shutil.copytree(build_folder, partial, symlinks=True)
+        try:
+            os.rename(partial, cached)
+        except OSError:
+            # Someone else stored it first
+            shutil.rmtree(partial, ignore_errors=True)
+
+
+# Global Manage CLI
+manage_cli = ManageCli()
+
+# EOF
@@ -0,0 +1,149 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import heapq
+
+
+def popcount(mask):
+    """
+    Number of bits set in a coverage mask
+    """
+    return bin(mask).count("1")
+
+
+def coverage_masks(test_points):
+    """
+    Given a mapping from tests to the coverage points they hit, builds the
+    coverage matrix: one integer per test, with one bit per coverage point
+    """
+
+    # Give each coverage point a bit
+    bits = {}
+    for test in sorted(test_points):
+        for point in test_points[test]:
+            bits.setdefault(point, len(bits))
+
+    # How many bytes for a row of the matrix?
+    row_bytes = (len(bits) + 7) // 8
+
+    # Build each row as bytes, then convert it to an int in one go
+    masks = {}
+    for test, points in test_points.items():
+        row = bytearray(row_bytes)
+        for point in points:
+            bit = bits[point]
+            row[bit >> 3] |= 1 << (bit & 7)
+        masks[test] = int.from_bytes(bytes(row), "little")
+
+    return masks
+
+
+def greedy_cover(masks, candidates, kept=()):
+    """
+    Greedy set-cover: picks tests from 'candidates' until together with the
+    'kept' tests they cover everything that all of the tests cover
+
+    Uses lazy evaluation: the gain of a test can only go down as more is
+    covered, so a test is only re-scored when it reaches the top of the heap
+    """
+
+    # What do the tests we must keep already cover?
+    covered = 0
+    for test in kept:
+        covered |= masks.get(test, 0)
+
+    # What do we need to cover?
+    target = covered
+    for test in candidates:
+        target |= masks[test]
+
+    # Max-heap on gain (ties broken by the original order, to be stable)
+    heap = [
+        (-popcount(masks[test] & ~covered), index, test)
+        for index, test in enumerate(candidates)
+    ]
+    heapq.heapify(heap)
+
+    chosen = []
+    while covered != target and heap:
+        _, index, test = heapq.heappop(heap)
+
+        # What does this test add now?
+        gain = popcount(masks[test] & ~covered)
+        if gain == 0:
+            continue
+
+        # If something else could be better, re-score and try again
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, index, test))
+            continue
+
+        chosen.append(test)
+        covered |= masks[test]
+
+    return chosen
+
+
+def minimise(test_points, candidates, kept=()):
+    """
+    Finds the tests in 'candidates' to keep, and a report on what was removed
+    and how much coverage was retained
+    """
+    masks = coverage_masks(test_points)
+
+    # Tests we have no coverage for are never removed
+    kept = list(kept) + [test for test in candidates if test not in masks]
+    candidates = [test for test in candidates if test in masks]
+
+    chosen = greedy_cover(masks, candidates, kept)
+
+    # What did we cover before and after?
+    all_covered = 0
+    for mask in masks.values():
+        all_covered |= mask
+
+    retained = 0
+    for test in kept + chosen:
+        retained |= masks.get(test, 0)
+
+    chosen_set = set(chosen)
+    removed = [test for test in candidates if test not in chosen_set]
+
+    points_total = popcount(all_covered)
+    points_retained = popcount(retained)
+
+    report = {
+        "tests_before": len(kept) + len(candidates),
+        "tests_after": len(kept) + len(chosen),
+        "removed": removed,
+        "points_total": points_total,
+        "points_retained": points_retained,
+        "coverage_retained": (
+            100.0 * points_retained / points_total if points_total else 100.0
+        ),
+    }
+
+    return kept + chosen, report
+
+
+# EOF
@@ -22,21 +22,49 @@
 
 import wrapt
 import subprocess
+import hashlib
 import shlex
 import os
 import multiprocessing
 import monotonic
 import logging
+import itertools
+import threading
+import shutil
+import time
 import tqdm
 from multiprocessing.dummy import Pool as ThreadPool
 from contextlib import contextmanager
 
+import atg_execution.log_store as atg_log_store
+import atg_execution.resource_usage as atg_resource_usage
+import atg_execution.run_history as atg_run_history
+import atg_execution.tracing as atg_tracing
+
+try:
+    from resource import prlimit, RLIMIT_AS
+except ImportError:
+    # Only available on Linux
+    prlimit = None
+
 
 log = logging.getLogger("Incremental ATG")
 
 TRUNC_DOTS = "..."
 DO_NOT_DECORATE_METHODS = ["__repr__", "__str__", "__init__"]
 
+# Concurrency classes: stages that compile (and may run parallel make), stages
+# that run single-threaded PyEDG and stages that mostly do file I/O
+CONCURRENCY_COMPILE = "compile"
+CONCURRENCY_ATG = "atg"
+CONCURRENCY_IO = "io"
+
+# Unless told otherwise, I/O stages get this many workers per CPU-bound worker
+IO_WORKERS_FACTOR = 4
+
+# Per-thread state of pool workers
+worker_state = threading.local()
+
 be_verbose = False
 be_quiet = False
 
@@ -86,6 +114,15 @@ def str_trunc(text, headsize=16, tailsize=8):
     return ret
 
 
+def available_cpus():
+    """
+    The CPUs that this process may run on
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+
 def get_class_state(instance):
     class_name = instance.__class__.__name__
     if instance:
@@ -157,12 +194,111 @@ def parse_git_for_hashes(repo="."):
     return (head_sha, branch_sha)
 
 
+def exit_code(status):
+    """
+    Return code (as Popen gives it) of a wait status
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class RusagePopen(subprocess.Popen):
+    """
+    Popen that reaps its child with 'wait4', so that we get the child's
+    resource usage (CPU time, peak RSS, I/O, ...) for free
+
+    The child's peak RSS includes what it inherited from us when it was
+    forked, so it's never below our RSS (see inherited_rss_kb)
+    """
+
+    rusage = None
+
+    def wait(self, timeout=None):
+        # No 'wait4' (e.g., Windows), so no resource usage
+        if not hasattr(os, "wait4") or self.returncode is not None:
+            return super().wait(timeout)
+
+        if timeout is not None:
+            end = monotonic.monotonic() + timeout
+        delay = 0.0005
+
+        while True:
+            flags = 0 if timeout is None else os.WNOHANG
+            try:
+                pid, status, rusage = os.wait4(self.pid, flags)
+            except ChildProcessError:
+                # Same as Popen: someone else reaped our child
+                self.returncode = 0
+                return self.returncode
+
+            if pid == self.pid:
+                self.rusage = rusage
+                self.returncode = exit_code(status)
+                return self.returncode
+
+            # Still running, so poll until the timeout
+            remaining = end - monotonic.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
+
+
+# Peak RSS of a child that does nothing (None until measured)
+trivial_child_rss_kb = None
+
+
+def inherited_rss_kb():
+    """
+    Peak RSS that a child reports before it does anything (what it inherited
+    from us), measured once from a trivial child -- 0 if we can't tell
+    """
+    global trivial_child_rss_kb
+
+    if trivial_child_rss_kb is None:
+        true_exe = shutil.which("true")
+        rss_kb = 0
+        if true_exe is not None and hasattr(os, "wait4"):
+            with RusagePopen([true_exe]) as process:
+                process.wait()
+            if process.rusage is not None:
+                rss_kb = process.rusage.ru_maxrss
+        trivial_child_rss_kb = rss_kb
+
+    return trivial_child_rss_kb
+
+
 @log_entry_exit
-def run_cmd(cmd, cwd, environ=None, timeout=None, log_file_prefix=None, shell=True):
+def run_cmd(
+    cmd,
+    cwd,
+    environ=None,
+    timeout=None,
+    log_file_prefix=None,
+    shell=False,
+    context=None,
+    memory_limit_kb=None,
+):
+    """
+    Runs 'cmd' -- 'context' (a dictionary with any of the keys in
+    resource_usage.KEY_FIELDS) describes what the command is doing, for the
+    resource usage table
+
+    'cmd' is a list of arguments, run without a shell (so that subprocess
+    can use its vfork/posix_spawn fast path, and a timeout kills the tool
+    itself); a string is split as the shell would, unless 'shell' is set
+
+    If 'memory_limit_kb' is set, the address space of the child is capped at
+    that size
+    """
 
     if not environ:
         environ = os.environ.copy()
 
+    if isinstance(cmd, str) and not shell:
+        cmd = shlex.split(cmd)
+
     # What options to do we want to pass to subprocess?
     kwargs = {
         "stdout": subprocess.PIPE,
@@ -176,11 +312,35 @@ def run_cmd(cmd, cwd, environ=None, timeout=None, log_file_prefix=None, shell=Tr
     # Did we kill this process by a timeout?
     timeout_exceeded = False
 
+    # What are we running? (for the trace and the usage table)
+    executable = cmd.split(" ", 1)[0] if isinstance(cmd, str) else cmd[0]
+    tool = os.path.basename(executable)
+
     # Start a timer
     start = monotonic.monotonic()
 
-    # Start the process
-    with subprocess.Popen(cmd, **kwargs) as process:
+    # Start the process (timing it in the trace)
+    span = atg_tracing.span(tool, "subprocess", cwd=cwd)
+    with span as span_args, RusagePopen(cmd, **kwargs) as process:
+
+        # Pin our child, if our worker is pinned
+        cpus = getattr(worker_state, "cpus", None)
+        if cpus is not None:
+            try:
+                os.sched_setaffinity(process.pid, cpus)
+            except ProcessLookupError:
+                # Already finished
+                pass
+
+        # Cap the address space of our child
+        if memory_limit_kb and prlimit is not None:
+            limit = memory_limit_kb * 1024
+            try:
+                prlimit(process.pid, RLIMIT_AS, (limit, limit))
+            except ProcessLookupError:
+                # Already finished
+                pass
+
         try:
             # Communicate with timeout
             stdout, stderr = process.communicate(timeout=timeout)
@@ -196,17 +356,32 @@ def run_cmd(cmd, cwd, environ=None, timeout=None, log_file_prefix=None, shell=Tr
             # Record that we exceeded the timeout value
             timeout_exceeded = True
 
-    # End the clock
-    end = monotonic.monotonic()
+        # End the clock
+        end = monotonic.monotonic()
 
-    # Calculate the duration
-    elapsed_time = end - start
+        # Calculate the duration
+        elapsed_time = end - start
+
+        # What resources did the child use?
+        usage = atg_resource_usage.from_rusage(
+            process.rusage,
+            tool,
+            elapsed_time,
+            process.returncode,
+            timeout_exceeded,
+            context,
+        )
+        atg_resource_usage.usage_table.add(usage)
+
+        # Record the outcome in the trace
+        span_args.update(usage._asdict())
 
     if log_file_prefix:
         if "::" in log_file_prefix or len(log_file_prefix) > 100:
             root = os.path.dirname(log_file_prefix)
             suffix = os.path.basename(log_file_prefix).replace(":", "_")
-            suffix = hex(abs(hash(suffix)))
+            # Stable across runs (unlike hash(), which is randomised per process)
+            suffix = hashlib.sha1(suffix.encode("utf-8")).hexdigest()[:16]
             log_file_prefix = os.path.join(root, suffix)
 
         out_log_file = "{prefix}.out".format(prefix=log_file_prefix)
@@ -226,25 +401,84 @@ def run_cmd(cmd, cwd, environ=None, timeout=None, log_file_prefix=None, shell=Tr
         # Write the return code to the log
         modified_stdout += "\nReturn code: {retcode}\n".format(retcode=returncode)
 
-        with open(out_log_file, "w") as output_fd:
-            output_fd.write(modified_stdout)
+        # Write the resource usage to the log
+        modified_stdout += atg_resource_usage.footer(usage)
 
-        with open(err_log_file, "w") as err_fd:
-            err_fd.write(stderr)
+        # To their own files, or to the run's log store
+        atg_log_store.write_log(out_log_file, modified_stdout, context)
+        atg_log_store.write_log(err_log_file, stderr, context)
 
     return stdout, stderr, process.returncode
 
 
+def init_worker(slot_counter, pin_cpus):
+    """
+    Pool initialiser: gives the worker its slot and, if 'pin_cpus' is set,
+    the CPU that the children of this worker are pinned to
+    """
+    atg_tracing.tracer.assign_worker_slot(slot_counter)
+
+    if pin_cpus:
+        cpus = available_cpus()
+        slot = atg_tracing.tracer.worker_slot
+        worker_state.cpus = {cpus[(slot - 1) % len(cpus)]}
+    else:
+        worker_state.cpus = None
+
+
 def wrap_class_method(args):
     """
     You cannot pass a class method into pool.map -- so we use a helper function
     to call our really class method
     """
     func, args = args
-    func(*args)
+    with atg_tracing.span(
+        func.__name__, "work item", context=[str_trunc(a, 40, 40) for a in args]
+    ):
+        func(*args)
+
+
+class MemoryBudget(object):
+    """
+    Counting semaphore, in KiB, used to stop us from running more memory-hungry
+    jobs at once than the machine can hold
+    """
+
+    def __init__(self, budget_kb):
+
+        # How much memory can our jobs use, in total?
+        self.budget_kb = budget_kb
+
+        # How much is left?
+        self.available_kb = budget_kb
+
+        # To wait for other jobs to finish
+        self.condition = threading.Condition()
+
+    def acquire(self, amount_kb):
+        """
+        Waits until 'amount_kb' is available and reserves it -- returns the
+        amount actually reserved
+        """
+
+        # A job larger than the whole budget runs on its own
+        amount_kb = min(amount_kb, self.budget_kb)
 
+        with self.condition:
+            self.condition.wait_for(lambda: self.available_kb >= amount_kb)
+            self.available_kb -= amount_kb
 
-@for_all_methods(log_entry_exit, exclude_methods=["update_shared_state"])
+        return amount_kb
+
+    def release(self, amount_kb):
+        with self.condition:
+            self.available_kb += amount_kb
+            self.condition.notify_all()
+
+
+@for_all_methods(
+    log_entry_exit, exclude_methods=["update_shared_state", "memory_admission"]
+)
 class ParallelExecutor(object):
     """
     Helper class that makes it easy to write other classes that can do things
@@ -265,11 +499,97 @@ class ParallelExecutor(object):
         # Mutex to allow for threads to update class state
         self.mutex = multiprocessing.Lock()
 
-    def run_routine_parallel(self, routine, routine_contexts, steps_per_stage=1):
+        options = configuration.options
+
+        # Are we limiting how much memory our jobs use at once?
+        if options.memory_budget:
+            self.memory_budget = MemoryBudget(options.memory_budget * 1024)
+        else:
+            self.memory_budget = None
+
+        # What do we assume a job needs, if we've never seen it before?
+        self.memory_default_kb = options.memory_default * 1024
+
+        # What's the most memory that any one job can use?
+        if options.memory_limit:
+            self.memory_limit_kb = options.memory_limit * 1024
+        else:
+            self.memory_limit_kb = None
+
+        # How many workers does each concurrency class get?
+        self.class_workers = {
+            CONCURRENCY_COMPILE: options.workers_compile or options.workers,
+            CONCURRENCY_ATG: options.workers_atg or options.workers,
+            CONCURRENCY_IO: options.workers_io or options.workers * IO_WORKERS_FACTOR,
+        }
+
+        # Which concurrency classes have their children pinned to CPUs?
+        if options.pin_cpus:
+            self.pinned_classes = set(options.pin_cpus.split(","))
+        else:
+            self.pinned_classes = set()
+
+    def run_routine_parallel(
+        self,
+        routine,
+        routine_contexts,
+        steps_per_stage=1,
+        concurrency_class=CONCURRENCY_COMPILE,
+        total_steps=None,
+    ):
         """
         Given a routine and routine context, builds-up what is neccessary to
-        call the routine via a parallel pool
+        call the routine via a parallel pool, sized for its concurrency class
+
+        'total_steps' is the length of the progress bar, if it isn't one step
+        per stage per context
         """
+        workers = self.class_workers[concurrency_class]
+
+        # Where does this stage start in the usage table?
+        first_record = len(atg_resource_usage.usage_table.records)
+
+        start = monotonic.monotonic()
+
+        with atg_tracing.span(
+            routine.__name__,
+            "pool",
+            concurrency_class=concurrency_class,
+            workers=workers,
+        ):
+            self._run_routine_parallel(
+                routine,
+                routine_contexts,
+                steps_per_stage,
+                workers,
+                concurrency_class in self.pinned_classes,
+                total_steps,
+            )
+
+        # How did the children of this stage use the CPUs?
+        stage_summary = atg_resource_usage.usage_table.add_stage(
+            routine.__name__,
+            concurrency_class,
+            workers,
+            len(available_cpus()),
+            monotonic.monotonic() - start,
+            first_record,
+        )
+
+        print_msg(
+            "{stage:s}: {workers:d} {cls:s} workers, oversubscription "
+            "{over:.2f}, CPU utilisation {util:.0%}".format(
+                stage=stage_summary.stage,
+                workers=workers,
+                cls=concurrency_class,
+                over=stage_summary.oversubscription,
+                util=stage_summary.cpu_utilisation,
+            )
+        )
+
+    def _run_routine_parallel(
+        self, routine, routine_contexts, steps_per_stage, workers, pin_cpus, total_steps
+    ):
         #
         # What's the 'execution context' for subprocess?
         #
@@ -280,12 +600,16 @@ class ParallelExecutor(object):
         for routine_context in routine_contexts:
             execution_contexts.append([routine] + [list(routine_context)])
 
-        # Worker pooler
-        pool = ThreadPool(self.configuration.options.workers)
+        # Worker pooler (each worker gets a 'slot', for tracing and pinning)
+        pool = ThreadPool(
+            workers, initializer=init_worker, initargs=(itertools.count(1), pin_cpus)
+        )
 
         # Create a progress bar
         if self.display_progress_bar:
-            total = len(execution_contexts) * steps_per_stage
+            total = total_steps
+            if total is None:
+                total = len(execution_contexts) * steps_per_stage
             self.progress_bar = tqdm.tqdm(total=total)
 
         # Run the call method in parallel over the 'context'
@@ -310,6 +634,43 @@ class ParallelExecutor(object):
         finally:
             self.mutex.release()
 
+    @contextmanager
+    def memory_admission(self, stage, environment, unit="", routine=""):
+        """
+        Waits until the memory budget can hold the given job, based on the
+        peak RSS it had in earlier runs -- 'routine' may be a list of the
+        routines run together, which need as much as the largest of them
+        """
+        if self.memory_budget is None:
+            yield
+            return
+
+        if isinstance(routine, list):
+            observed = [
+                atg_run_history.history.peak_rss_kb(stage, environment, unit, name)
+                for name in routine
+            ]
+            observed = [kb for kb in observed if kb is not None]
+            expected_kb = max(observed) if observed else None
+        else:
+            expected_kb = atg_run_history.history.peak_rss_kb(
+                stage, environment, unit, routine
+            )
+        if expected_kb is None:
+            expected_kb = self.memory_default_kb
+        else:
+            # Recorded peaks include the RSS the child inherited from us,
+            # which isn't extra memory
+            expected_kb = max(expected_kb - inherited_rss_kb(), 0)
+
+        with atg_tracing.span("memory_admission", "wait", expected_kb=expected_kb):
+            reserved_kb = self.memory_budget.acquire(expected_kb)
+
+        try:
+            yield
+        finally:
+            self.memory_budget.release(reserved_kb)
+
     def move_progress_bar(self, count=1):
         with self.update_shared_state():
             self.progress_bar.update(count)
@@ -0,0 +1,113 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+from __future__ import (
+    absolute_import,
+    print_function,
+    unicode_literals,
+)
+
+import json
+import sys
+from vector.apps.DataAPI.unit_test_api import Api
+
+
+class TestCoverage(object):
+    """
+    Uses DataAPI to dump the coverage points (statements and branch outcomes)
+    hit by each test-case of an environment
+    """
+
+    def __init__(self, env_name, output_json):
+
+        # Environment we're processing
+        self.env_name = env_name
+
+        # Where we write the coverage to
+        self.output_json = output_json
+
+        # API object on our environment
+        self.api = Api(self.env_name)
+
+    def test_key(self, test):
+        """
+        Identifies a test in the same way as the .tst does
+        """
+        return "|".join(
+            [test.unit_display_name, test.function_display_name_ada, test.name]
+        )
+
+    def calculate_coverage(self):
+        """
+        For each test-case, the list of coverage points that it hits
+        """
+        coverage = {}
+
+        # Every test is listed, even if it hits nothing
+        tests = {}
+        for test in self.api.TestCase.all():
+            tests[test.id] = self.test_key(test)
+            coverage[tests[test.id]] = []
+
+        for unit in self.api.Unit.all():
+            for function in unit.functions:
+                for line in function.iterate_coverage():
+
+                    # Coverage points on this line
+                    point = "{:s}|{:s}|{:d}".format(
+                        unit.name, function.name, line.line_number
+                    )
+
+                    for result in line.results:
+                        test_key = tests.get(result.test_case_id)
+                        if test_key is None:
+                            continue
+
+                        metrics = result.metrics
+                        if metrics.covered_statements:
+                            coverage[test_key].append(point)
+                        if metrics.covered_branches_true:
+                            coverage[test_key].append(point + "|T")
+                        if metrics.covered_branches_false:
+                            coverage[test_key].append(point + "|F")
+
+        return coverage
+
+    def main(self):
+        """
+        Entry-point for the class
+        """
+        with open(self.output_json, "w") as output_fd:
+            json.dump(self.calculate_coverage(), output_fd)
+
+
+if __name__ == "__main__":
+
+    # Params
+    env_name = sys.argv[1]
+    output_json = sys.argv[2]
+
+    # Run it
+    TestCoverage(env_name, output_json).main()
+
+# EOF
@@ -0,0 +1,360 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import re
+import json
+import shlex
+import heapq
+import hashlib
+
+
+def read_edg_flags(env_path):
+    """
+    Given an environment build folder, obtains the EDG flags
+    """
+
+    # Initial return value
+    edg_flags = None
+
+    # Open up the CCAST_.CFG
+    lines = open(os.path.join(env_path, "..", "CCAST_.CFG")).readlines()
+
+    # Iterate over the lines
+    for line in lines:
+        # If we see the EDG flags line ...
+        if line.startswith("C_EDG_FLAGS:"):
+            # ... grab the flags
+            edg_flags = line.split(":", 1)[1].strip()
+
+            # Stop iterating
+            break
+
+    # We expect to have found our flags
+    assert edg_flags is not None
+
+    # We need to change VectorCAST's round-bracket syntax into "proper"
+    # env-var syntax
+    with_env_vars = re.sub("\$\(([^\)]*)\)", "${\g<1>}", edg_flags)
+
+    # We can now expand the variables
+    expanded_edg_flags = os.path.expandvars(with_env_vars)
+
+    # Return them
+    return expanded_edg_flags
+
+
+def unit_to_tu_path(env_path, unit_name):
+    """
+    Converts a unit name (full path to original source) into a TU name
+    inside of the environment
+    """
+
+    # Get the base name of our unit
+    unit_base = os.path.basename(unit_name)
+
+    # Strip off the suffix
+    base, suffix = os.path.splitext(unit_base)
+
+    # Create the TU name
+    tu_path = os.path.join(env_path, "{:s}.tu{:s}".format(base, suffix))
+
+    # Return it
+    return tu_path
+
+
+def unit_name(src_file):
+    """
+    Unit name of a source file
+    """
+    return os.path.splitext(os.path.basename(src_file))[0]
+
+
+def batch_name(routine_names):
+    """
+    Name of the outputs of a batch of routines (None for a single routine,
+    as its outputs are named after it)
+    """
+    if len(routine_names) == 1:
+        return None
+    batch_id = hashlib.sha1(",".join(routine_names).encode("utf-8")).hexdigest()
+    return "batch_{:s}".format(batch_id[:12])
+
+
+def batch_routines(routine_contexts, timeout_policy, batch_seconds, max_batch):
+    """
+    Groups the (env, src_file, routine) contexts of each unit into batches,
+    sized so that each batch is expected to take 'batch_seconds' (from the
+    history) and has at most 'max_batch' routines
+    """
+
+    # Routines we have no history for are assumed to be cheap -- if they are
+    # not, the batch fails and is bisected
+    unknown_seconds = batch_seconds / float(max_batch)
+
+    # For each (environment, source file), the batch being filled and the
+    # expected seconds of that batch
+    open_batches = {}
+
+    batches = []
+    for env_path, src_file, routine_name in routine_contexts:
+        expected = timeout_policy.expected_duration(
+            "atg", env_path, unit_name(src_file), routine_name
+        )
+        if expected is None:
+            expected = unknown_seconds
+
+        key = (env_path, src_file)
+        batch = open_batches.get(key)
+
+        # Start a new batch if this routine doesn't fit
+        if (
+            batch is None
+            or len(batch[0][2]) >= max_batch
+            or batch[1] + expected > batch_seconds
+        ):
+            batch = [(env_path, src_file, []), 0.0]
+            open_batches[key] = batch
+            batches.append(batch[0])
+
+        batch[0][2].append(routine_name)
+        batch[1] += expected
+
+    return batches
+
+
+class ExecutionPlan(object):
+    """
+    Resolves, up front, everything needed to run PyEDG: once per environment
+    (EDG flags, TU paths and environment variables) and once per routine (or
+    batch of routines) its command, environment variables, outputs and
+    dependencies
+
+    The plan can be saved as JSON, and its cost predicted from the history
+    """
+
+    def __init__(self, atg_work_dir=None):
+
+        # Where do the ATG artefacts go? (None for next to the environment)
+        self.atg_work_dir = atg_work_dir
+
+        # For each environment, what's common to all of its invocations
+        self.environments = {}
+
+        # Full process environments of each environment (not saved)
+        self.environs = {}
+
+        # The PyEDG invocations
+        self.invocations = []
+
+        # What's the path to PyEDG?
+        self.pyedg_path = os.path.expandvars(os.path.join("$VECTORCAST_DIR", "pyedg"))
+
+    def add_environment(self, env_path, src_files):
+        """
+        Resolves what's common to all of the invocations for an environment
+        """
+        if env_path in self.environments:
+            return
+
+        env_delta = {
+            # What PyEDG script are we going to run?
+            "VCAST_PYEDG_PATH": os.path.expandvars(
+                os.path.join(
+                    "$VECTORCAST_DIR",
+                    "python",
+                    "vector",
+                    "apps",
+                    "atg_utils",
+                    "run_atg.py",
+                )
+            ),
+            # Tell ATG to generate display attributes
+            "VCAST_ATG_BASELINING": "1",
+        }
+
+        self.environments[env_path] = {
+            "edg_flags": read_edg_flags(env_path),
+            "env_delta": env_delta,
+            "tu_paths": dict(
+                (src_file, unit_to_tu_path(env_path, src_file))
+                for src_file in src_files
+            ),
+        }
+
+        # Build-up our environment object (just the once)
+        environ = os.environ.copy()
+        environ.update(env_delta)
+        self.environs[env_path] = environ
+
+    def output_prefix(self, env_path, unit, routine_name):
+        """
+        Prefix of all of the ATG outputs for a routine (or a batch)
+        """
+
+        # What's the name of this environment?
+        env = os.path.basename(env_path)
+
+        # Where do we want the ATG artefacts to go?
+        if self.atg_work_dir is not None:
+            build_hash = os.path.basename(os.path.dirname(env_path))
+            atg_output_location = os.path.join(self.atg_work_dir, build_hash)
+        else:
+            atg_output_location = env_path
+
+        # What's the prefix of our all outputs?
+        output_prefix = os.path.join(
+            atg_output_location,
+            "{env:s}_{unit:s}_{routine:s}".format(
+                env=env, unit=unit, routine=routine_name
+            ),
+        )
+
+        if "::" in output_prefix or len(output_prefix) > 100:
+            root = os.path.dirname(output_prefix)
+            suffix = os.path.basename(output_prefix).replace(":", "_")
+            # Stable across runs (unlike hash(), which is randomised per process)
+            suffix = hashlib.sha1(suffix.encode("utf-8")).hexdigest()[:16]
+            output_prefix = os.path.join(root, suffix)
+
+        return output_prefix
+
+    def atg_invocation(self, env_path, src_file, routine_names, name=None):
+        """
+        The PyEDG invocation running ATG on 'routine_names' (of the unit
+        'src_file'), with its outputs named after 'name' (by default, the
+        routine)
+        """
+        environment = self.environments[env_path]
+
+        unit = unit_name(src_file)
+
+        # What's the prefix of our all outputs?
+        output_prefix = self.output_prefix(env_path, unit, name or routine_names[0])
+
+        # What does it write?
+        outputs = {
+            "log": "{:s}.log".format(output_prefix),
+            "tst": "{:s}.tst".format(output_prefix),
+            "pyedg_log_prefix": "{:s}_pyedg".format(output_prefix),
+            "prefix": output_prefix,
+        }
+
+        # What does it read?
+        tu_path = environment["tu_paths"][src_file]
+        dependencies = [tu_path, os.path.join(env_path, "..", "CCAST_.CFG")]
+
+        # Build-up our PyEDG command (split as the shell would have)
+        cmd = [self.pyedg_path] + shlex.split(environment["edg_flags"]) + [tu_path]
+
+        env_delta = {
+            # What's the ATG log?
+            "VCAST_ATG_LOG_FILE_NAME": outputs["log"],
+            # What's the routine to process?
+            "VCAST_ATG_RESTRICT_SUBPROGRAM": ",".join(routine_names),
+            # Where are we going to write our output?
+            "VCAST_PYEDG_ATG_OUTPUT_FILE": outputs["tst"],
+        }
+
+        return {
+            "stage": "atg",
+            "environment": env_path,
+            "src_file": src_file,
+            "unit": unit,
+            "routines": list(routine_names),
+            "cmd": cmd,
+            "cwd": env_path,
+            "env_delta": env_delta,
+            "outputs": outputs,
+            "dependencies": dependencies,
+        }
+
+    def environ(self, invocation):
+        """
+        Full process environment for an invocation
+        """
+        environ = dict(self.environs[invocation["environment"]])
+        environ.update(invocation["env_delta"])
+        return environ
+
+    def add_atg_contexts(self, routine_contexts):
+        """
+        Adds an invocation for each (env, src_file, routine names) context
+        """
+        for env_path, src_file, routine_names in routine_contexts:
+            self.invocations.append(
+                self.atg_invocation(
+                    env_path, src_file, routine_names, batch_name(routine_names)
+                )
+            )
+
+    def expected_cost(self, invocation, timeout_policy):
+        """
+        Expected seconds for an invocation, and whether we had to guess (in
+        which case, it is the timeout)
+        """
+        cost = 0
+        guessed = False
+        for routine_name in invocation["routines"]:
+            expected = timeout_policy.expected_duration(
+                "atg", invocation["environment"], invocation["unit"], routine_name
+            )
+            if expected is None:
+                expected = timeout_policy.timeout_for(
+                    "atg", invocation["environment"], invocation["unit"], routine_name
+                )
+                guessed = True
+            cost += expected
+        return cost, guessed
+
+    def predict(self, workers, timeout_policy):
+        """
+        Predicts the wall-clock seconds to run the plan on 'workers' workers,
+        scheduling the longest invocations first
+        """
+        costs = sorted(
+            [
+                self.expected_cost(invocation, timeout_policy)[0]
+                for invocation in self.invocations
+            ],
+            reverse=True,
+        )
+
+        # Each worker's finishing time
+        loads = [0.0] * max(workers, 1)
+        for cost in costs:
+            heapq.heapreplace(loads, loads[0] + cost)
+
+        return max(loads)
+
+    def save(self, plan_path):
+        with open(plan_path, "w") as plan_fd:
+            json.dump(
+                {"environments": self.environments, "invocations": self.invocations},
+                plan_fd,
+                indent=1,
+                sort_keys=True,
+            )
+
+
+# EOF
@@ -22,12 +22,25 @@
 
 import os
 import shutil
-import re
 import glob
+import json
+import monotonic
 
 import atg_execution.baseline_for_atg as baseline_for_atg
+import atg_execution.failure_cache as atg_failure_cache
+import atg_execution.journal as atg_journal
+import atg_execution.log_store as atg_log_store
+import atg_execution.manage_cli as atg_manage_cli
+import atg_execution.minimise as atg_minimise
 import atg_execution.misc as atg_misc
+import atg_execution.plan as atg_plan
+import atg_execution.publisher as atg_publisher
+import atg_execution.resource_usage as atg_resource_usage
+import atg_execution.run_history as atg_run_history
+import atg_execution.timeouts as atg_timeouts
+import atg_execution.tracing as atg_tracing
 import atg_execution.tst_editor as tst_editor
+import atg_execution.tst_validator as atg_tst_validator
 
 
 @atg_misc.for_all_methods(atg_misc.log_entry_exit)
@@ -49,15 +62,10 @@ class ProcessProject(atg_misc.ParallelExecutor):
         # Do we have a work directory?
         self.atg_work_dir = configuration.options.atg_work_dir
 
-        # If it is non-None
+        # If it is non-None, make it (the journal cleans it up, unless we're
+        # resuming)
         if self.atg_work_dir is not None:
-
-            #  Clean-up
-            if os.path.exists(self.atg_work_dir):
-                shutil.rmtree(self.atg_work_dir)
-
-            # Make it
-            os.mkdir(self.atg_work_dir)
+            atg_journal.journal.start()
 
         # The set of environments to run
         self.impacted_environments = impacted_environments
@@ -74,9 +82,74 @@ class ProcessProject(atg_misc.ParallelExecutor):
         # Number of seconds to perform ATG
         self.timeout = configuration.options.timeout
 
+        # How long do we really give each piece of work?
+        self.timeout_policy = atg_timeouts.TimeoutPolicy(configuration.options)
+
+        # Are we fitting the run into a time budget?
+        if configuration.options.deadline is not None:
+            self.time_budget = atg_timeouts.TimeBudget(
+                configuration.options.deadline, self.timeout_policy
+            )
+        else:
+            self.time_budget = None
+
+        # When must ATG be finished by? (None for no limit)
+        self.atg_deadline = None
+
+        # Mapping from environments to why routines were not run (if they
+        # were not)
+        self.routine_notes = {}
+
+        # Are we skipping routines already covered by the existing tests?
+        self.skip_covered = configuration.options.skip_covered
+
+        # Mapping from environments to their fully covered (unit, routine)s
+        self.covered_routines = {}
+
+        # Hashes of the TUs we've seen (TU paths to hashes)
+        self.tu_hashes = {}
+
+        # Routines skipped as they keep failing: (environment, unit, routine,
+        # cache entry)
+        self.failure_skips = []
+
+        # Do we keep the complete tests of routines that time-out?
+        self.salvage_partial = configuration.options.salvage_partial
+
+        # How many seconds of routines go in one PyEDG run? (None to run each
+        # routine on its own)
+        self.atg_batch_seconds = configuration.options.atg_batch_seconds
+
+        # How many routines at most go in one PyEDG run?
+        self.atg_max_batch = configuration.options.atg_max_batch
+
+        # Where do we save the execution plan? (None to not save it)
+        self.plan_file = configuration.options.plan_file
+
+        # Are we checking the generated tsts?
+        self.validate_tsts = configuration.options.validate_tsts
+
+        # Generated tsts that did not look valid
+        self.quarantined_tsts = []
+
+        # Are we dropping duplicate ATG tests before baselining?
+        self.dedup_tests = configuration.options.dedup_tests
+
+        # Mapping from environments to their dropped duplicate tests
+        self.duplicate_tests = {}
+
+        # Are we minimising the final test-suites?
+        self.minimise_tests = configuration.options.minimise_tests
+
+        # Mapping from environments to their minimisation reports
+        self.minimise_reports = {}
+
         # Should we disable failures?
         self.disable_failures = configuration.options.disable_failures
 
+        # Should the baseliner run its clicast commands from command files?
+        self.batch_clicast = configuration.options.batch_clicast
+
         # Number of baseling iterations to perform?
         self.baseline_iterations = configuration.options.baseline_iterations
 
@@ -96,177 +169,461 @@ class ProcessProject(atg_misc.ParallelExecutor):
         for env in self.impacted_environments:
             self.env_tsts[env] = {}
             self.merged_tsts[env] = {}
+            self.routine_notes[env] = {}
+            self.covered_routines[env] = set()
 
             # Make working directories for each env
             if self.atg_work_dir is not None:
                 env_name = os.path.basename(env)
                 env_hash = os.path.basename(os.path.dirname(env))
-                os.mkdir(os.path.join(self.atg_work_dir, env_hash))
+                env_work_dir = os.path.join(self.atg_work_dir, env_hash)
+                if not os.path.isdir(env_work_dir):
+                    os.mkdir(env_work_dir)
+
+        # What's needed to run PyEDG, resolved once per environment
+        self.plan = atg_plan.ExecutionPlan(self.atg_work_dir)
+        for env in self.impacted_environments:
+            self.plan.add_environment(env, self.envs_to_units[env])
 
         self.updated_files = set()
 
+        # Are we publishing each environment as soon as it is finished?
+        if configuration.store_updated_batch is not None:
+            self.publisher = atg_publisher.Publisher(
+                configuration.store_updated_batch,
+                configuration.options.publish_batch_files,
+                configuration.options.publish_batch_seconds,
+            )
+        else:
+            self.publisher = None
+
     def __repr__(self):
         return str({"merged_tsts": self.merged_tsts})
 
-    def get_edg_flags(self, env_path):
+    def tu_hash(self, tu_path):
         """
-        Given an environment build folder, obtains the EDG flags
+        Hash of the contents of a TU (each TU is only hashed once)
         """
+        with self.update_shared_state():
+            if tu_path in self.tu_hashes:
+                return self.tu_hashes[tu_path]
 
-        # Initial return value
-        edg_flags = None
-
-        # Open up the CCAST_.CFG
-        lines = open(os.path.join(env_path, "..", "CCAST_.CFG")).readlines()
-
-        # Iterate over the lines
-        for line in lines:
-            # If we see the EDG flags line ...
-            if line.startswith("C_EDG_FLAGS:"):
-                # ... grab the flags
-                edg_flags = line.split(":", 1)[1].strip()
+        tu_hash = atg_journal.file_hash(tu_path)
 
-                # Stop iterating
-                break
+        with self.update_shared_state():
+            self.tu_hashes[tu_path] = tu_hash
 
-        # We expect to have found our flags
-        assert edg_flags is not None
+        return tu_hash
 
-        # We need to change VectorCAST's round-bracket syntax into "proper"
-        # env-var syntax
-        with_env_vars = re.sub("\$\(([^\)]*)\)", "${\g<1>}", edg_flags)
+    def skip_failing_routine(self, env_path, unit, routine_name, inputs):
+        """
+        If ATG keeps failing on a routine's inputs, marks the routine as
+        skipped and returns True
+        """
+        failed = atg_failure_cache.failure_cache.skip(
+            env_path, unit, routine_name, inputs
+        )
+        if failed is None:
+            return False
 
-        # We can now expand the variables
-        expanded_edg_flags = os.path.expandvars(with_env_vars)
+        note = "skipped (failed {:d} times, last: {:s})".format(
+            failed["failures"], failed["outcome"]
+        )
+        with self.update_shared_state():
+            self.env_tsts[env_path][(unit, routine_name)] = None
+            self.routine_notes[env_path][(unit, routine_name)] = note
+            self.failure_skips.append((env_path, unit, routine_name, failed))
+        self.move_progress_bar()
 
-        # Return them
-        return expanded_edg_flags
+        return True
 
-    def unit_to_tu_path(self, env_path, unit_name):
+    def routine_done(
+        self, env_path, unit, routine_name, inputs, tst_file, outcome, note
+    ):
         """
-        Converts a unit name (full path to original source) into a TU name
-        inside of the environment
+        Records the result of ATG for a routine (keeping its tst out of the
+        merged tst if it doesn't look valid)
         """
 
-        # Get the base name of our unit
-        unit_base = os.path.basename(unit_name)
+        # Check the tst before it gets anywhere near baselining
+        if tst_file is not None and self.validate_tsts:
+            validator = atg_tst_validator.TstValidator(tst_file, unit, routine_name)
+            diagnostics = validator.validate()
+
+            if diagnostics:
+                quarantine_dir = os.path.join(os.path.dirname(tst_file), "quarantine")
+                quarantined = validator.quarantine(quarantine_dir)
 
-        # Strip off the suffix
-        base, suffix = os.path.splitext(unit_base)
+                atg_misc.print_warn(
+                    "Quarantined {:s} ({:d} problems, first: line {:d}: {:s})".format(
+                        quarantined, len(diagnostics), *diagnostics[0]
+                    )
+                )
 
-        # Create the TU name
-        tu_path = os.path.join(env_path, "{:s}.tu{:s}".format(base, suffix))
+                tst_file = None
+                outcome = "invalid tst"
+                note = "quarantined (invalid tst)"
 
-        # Return it
-        return tu_path
+                with self.update_shared_state():
+                    self.quarantined_tsts.append(quarantined)
+
+        # Remember the outcome, for the next run (unless the time budget cut it
+        # short, which says nothing about the routine)
+        atg_failure_cache.failure_cache.record(
+            env_path, unit, routine_name, inputs, outcome
+        )
 
-    def run_atg_one_routine(self, env_path, src_file, routine_name):
+        # We're about to update the shared state, so grab the lock
+        with self.update_shared_state():
+
+            # Update the shared state
+            self.env_tsts[env_path][(unit, routine_name)] = tst_file
+            if note is not None:
+                self.routine_notes[env_path][(unit, routine_name)] = note
+
+        # Record that we're done with this routine (if the time budget cut it
+        # short, a resumed run tries it again)
+        if outcome != atg_failure_cache.BUDGET_OUTCOME:
+            atg_journal.journal.record(
+                "atg",
+                (env_path, unit, routine_name),
+                artefacts={"tst": tst_file},
+                data=note,
+            )
+
+        # Update the progress bar
+        self.move_progress_bar()
+
+    def run_atg_one_routine(self, invocation, timeout_cap=None):
         """
-        Runs a single routine in an environment via ATG
+        Runs a single routine in an environment via ATG (given its planned
+        invocation), for at most 'timeout_cap' seconds (if given)
         """
 
-        # What's the name of this environment?
-        env = os.path.basename(env_path)
-
-        # What's the unit name for the current subprogram?
-        unit = os.path.splitext(os.path.basename(src_file))[0]
+        # What are we running?
+        env_path = invocation["environment"]
+        unit = invocation["unit"]
+        routine_name = invocation["routines"][0]
 
-        # Where do we want the ATG artefacts to go?
-        if self.atg_work_dir is not None:
-            build_hash = os.path.basename(os.path.dirname(env_path))
-            atg_output_location = os.path.join(self.atg_work_dir, build_hash)
-        else:
-            atg_output_location = env_path
+        # How long can this routine run for?
+        timeout = self.timeout_policy.timeout_for(
+            "atg", env_path, unit, routine_name, deadline=self.atg_deadline
+        )
 
-        # What's the prefix of our all outputs?
-        output_prefix = os.path.join(
-            atg_output_location,
-            "{env:s}_{unit:s}_{routine:s}".format(
-                env=env, unit=unit, routine=routine_name
-            ),
+        # Is the time budget giving it less than its own timeout?
+        budget_limited = timeout is not None and timeout < (
+            self.timeout_policy.timeout_for("atg", env_path, unit, routine_name)
         )
 
-        if "::" in output_prefix or len(output_prefix) > 100:
-            root = os.path.dirname(output_prefix)
-            suffix = os.path.basename(output_prefix).replace(":", "_")
-            suffix = hex(abs(hash(suffix)))
-            output_prefix = os.path.join(root, suffix)
+        if timeout is not None and timeout_cap is not None:
+            budget_limited = budget_limited and timeout < timeout_cap
+            timeout = min(timeout, timeout_cap)
+
+        # If we're out of time, we don't run the routine
+        if timeout is None:
+            with self.update_shared_state():
+                self.env_tsts[env_path][(unit, routine_name)] = None
+                self.routine_notes[env_path][
+                    (unit, routine_name)
+                ] = "skipped (time budget)"
+            self.move_progress_bar()
+            return
 
-        # Where is ATG going to write its log to?
-        log_file = "{:s}.log".format(output_prefix)
+        # Find the EDG flags
+        edg_flags = self.plan.environments[env_path]["edg_flags"]
+
+        # Find the TU path
+        tu_path = self.plan.environments[env_path]["tu_paths"][invocation["src_file"]]
+
+        # We expect the TU to exist and be a file
+        assert os.path.exists(tu_path) and os.path.isfile(tu_path)
+
+        # What are the inputs to ATG for this routine?
+        inputs = atg_failure_cache.fingerprint(
+            self.tu_hash(tu_path), edg_flags, routine_name
+        )
+
+        # If ATG keeps failing on these inputs, don't try again (yet)
+        if self.skip_failing_routine(env_path, unit, routine_name, inputs):
+            return
 
         # Where is ATG going to write its tst to?
-        tst_file = "{:s}.tst".format(output_prefix)
+        tst_file = invocation["outputs"]["tst"]
 
-        # Where to log the PyEDG output to?
-        pyedg_log_prefix = "{:s}_pyedg".format(output_prefix)
+        # Wait until we have the memory to run PyEDG
+        with self.memory_admission("atg", env_path, unit, routine_name):
 
-        # Build-up our environment object
-        environ = os.environ.copy()
+            # Start a timer (to tell if we timed-out)
+            start = monotonic.monotonic()
 
-        # What's the ATG log?
-        environ["VCAST_ATG_LOG_FILE_NAME"] = log_file
+            # What produced the logs?
+            context = {
+                "stage": "atg",
+                "environment": env_path,
+                "unit": unit,
+                "routine": routine_name,
+            }
+
+            # Run PyEDG and get the return code
+            _, _, returncode = atg_misc.run_cmd(
+                invocation["cmd"],
+                cwd=invocation["cwd"],
+                environ=self.plan.environ(invocation),
+                timeout=timeout,
+                log_file_prefix=invocation["outputs"]["pyedg_log_prefix"],
+                context=context,
+                memory_limit_kb=self.memory_limit_kb,
+            )
 
-        # What's the routine to process?
-        environ["VCAST_ATG_RESTRICT_SUBPROGRAM"] = routine_name
+            # Did we run out of time?
+            timed_out = monotonic.monotonic() - start >= timeout
 
-        # Where are we going to write our output?
-        environ["VCAST_PYEDG_ATG_OUTPUT_FILE"] = tst_file
+            # ATG's own log goes to the log store too, if there is one
+            if atg_log_store.log_store.enabled:
+                atg_log_store.log_store.ingest(invocation["outputs"]["log"], context)
 
-        # Tell ATG to generate display attributes
-        environ["VCAST_ATG_BASELINING"] = "1"
+        # Killed by the time budget, rather than by its own timeout? Then how
+        # long it ran says nothing about the routine
+        budget_killed = timed_out and budget_limited
+        if budget_killed:
+            usage = atg_resource_usage.usage_table.latest(context)
+            if usage is not None:
+                atg_run_history.history.ignore(usage)
 
-        # What PyEDG script are we going to run?
-        environ["VCAST_PYEDG_PATH"] = os.path.expandvars(
-            os.path.join(
-                "$VECTORCAST_DIR", "python", "vector", "apps", "atg_utils", "run_atg.py"
+        # If we're using 'strict return codes' and we have a return code, then
+        # that's a return code failure
+        rc_failure = self.strict_rc and returncode
+
+        # Anything to say about this routine in the merged tst?
+        note = None
+
+        if timed_out and self.salvage_partial and os.path.isfile(tst_file):
+            # Keep the tests that were complete when we timed-out
+            partial_tst = "{:s}_partial.tst".format(invocation["outputs"]["prefix"])
+            salvaged = tst_editor.TstFile(
+                input_file=tst_file, output_file=partial_tst
+            ).salvage()
+
+            if salvaged:
+                tst_file = partial_tst
+                note = "partial ({:d} tests salvaged after timeout)".format(salvaged)
+            else:
+                tst_file = None
+
+        # If we didn't have a 0 return code or we have no .tst, then we have no tst
+        elif rc_failure or not os.path.exists(tst_file) or not os.path.isfile(tst_file):
+            tst_file = None
+
+        # How did it go?
+        if tst_file is not None:
+            outcome = None
+        elif budget_killed:
+            outcome = atg_failure_cache.BUDGET_OUTCOME
+            note = "cut short (time budget)"
+        elif timed_out:
+            outcome = "timeout"
+        elif returncode:
+            outcome = "return code {:d}".format(returncode)
+        else:
+            outcome = "no tst"
+
+        # Record the result
+        self.routine_done(env_path, unit, routine_name, inputs, tst_file, outcome, note)
+
+    def run_atg_routines(self, env_path, src_file, routine_names, timeout_cap=None):
+        """
+        Runs each of the routines on its own
+        """
+        for routine_name in routine_names:
+            self.run_atg_one_routine(
+                self.plan.atg_invocation(env_path, src_file, [routine_name]),
+                timeout_cap,
             )
-        )
+
+    def run_atg_batch(self, invocation, timeout_cap=None):
+        """
+        Runs several routines of the same unit through one PyEDG (so the TU is
+        only parsed once), splitting the tst back into one per routine
+
+        If the batch fails, it is bisected, so that one bad routine doesn't
+        sink the others -- each half gets at most half of the batch's time
+        (so one routine that never finishes costs at most twice the batch's
+        timeout), and no more than 'timeout_cap' seconds (if given)
+        """
+
+        # What are we running?
+        env_path = invocation["environment"]
+        src_file = invocation["src_file"]
+        unit = invocation["unit"]
+        routine_names = invocation["routines"]
+
+        # A batch of one is just a routine
+        if len(routine_names) == 1:
+            self.run_atg_one_routine(invocation, timeout_cap)
+            return
+
+        # How long can this batch run for? (as long as its routines together)
+        timeouts = [
+            self.timeout_policy.timeout_for(
+                "atg", env_path, unit, routine_name, deadline=self.atg_deadline
+            )
+            for routine_name in routine_names
+        ]
+
+        # If we're running out of time, run them one-by-one
+        if None in timeouts:
+            self.run_atg_routines(env_path, src_file, routine_names, timeout_cap)
+            return
+
+        # ... but never past the deadline (each of them was clipped to it, but
+        # not their sum)
+        timeout = sum(timeouts)
+        budget_limited = False
+        if self.atg_deadline is not None:
+            remaining = self.atg_deadline - monotonic.monotonic()
+            if remaining < timeout:
+                timeout = remaining
+                budget_limited = True
+
+        if timeout_cap is not None:
+            budget_limited = budget_limited and timeout < timeout_cap
+            timeout = min(timeout, timeout_cap)
 
         # Find the EDG flags
-        edg_flags = self.get_edg_flags(env_path)
+        edg_flags = self.plan.environments[env_path]["edg_flags"]
 
         # Find the TU path
-        tu_path = self.unit_to_tu_path(env_path, src_file)
+        tu_path = self.plan.environments[env_path]["tu_paths"][src_file]
 
         # We expect the TU to exist and be a file
         assert os.path.exists(tu_path) and os.path.isfile(tu_path)
 
-        # What's the path to PyEDG?
-        pyedg_path = os.path.expandvars(os.path.join("$VECTORCAST_DIR", "pyedg"))
+        # What are the inputs to ATG for each routine?
+        tu_hash = self.tu_hash(tu_path)
+        inputs = {
+            routine_name: atg_failure_cache.fingerprint(
+                tu_hash, edg_flags, routine_name
+            )
+            for routine_name in routine_names
+        }
+
+        # Routines that keep failing don't get to go in a batch
+        batch = [
+            routine_name
+            for routine_name in routine_names
+            if not self.skip_failing_routine(
+                env_path, unit, routine_name, inputs[routine_name]
+            )
+        ]
+        if len(batch) <= 1:
+            self.run_atg_routines(env_path, src_file, batch, timeout_cap)
+            return
 
-        # Build-up our PyEDG command
-        cmd = "{pyedg_path:s} {edg_flags:s} {tu:s}".format(
-            pyedg_path=pyedg_path,
-            edg_flags=edg_flags,
-            tu=tu_path,
-        )
+        # If we dropped any routines, re-plan the batch
+        if batch != routine_names:
+            invocation = self.plan.atg_invocation(
+                env_path, src_file, batch, atg_plan.batch_name(batch)
+            )
 
-        # Run PyEDG and get the return code
-        _, _, returncode = atg_misc.run_cmd(
-            cmd,
-            cwd=env_path,
-            environ=environ,
-            timeout=self.timeout,
-            log_file_prefix=pyedg_log_prefix,
-        )
+        # Where is ATG going to write its tst to?
+        tst_file = invocation["outputs"]["tst"]
 
-        # If we're using 'strict return codes' and we have a return code, then
-        # that's a return code failure
-        rc_failure = self.strict_rc and returncode
+        # Wait until we have the memory to run PyEDG (for the hungriest routine)
+        with self.memory_admission("atg", env_path, unit, batch):
 
-        # If we didn't have a 0 return code or we have no .tst, then we have no tst
-        if rc_failure or not os.path.exists(tst_file) or not os.path.isfile(tst_file):
-            tst_file = None
+            # Start a timer (to tell if we timed-out)
+            start = monotonic.monotonic()
 
-        # We're about to update the shared state, so grab the lock
-        with self.update_shared_state():
+            # What produced the logs?
+            context = {
+                "stage": "atg_batch",
+                "environment": env_path,
+                "unit": unit,
+                "routine": ",".join(batch),
+            }
 
-            # Update the shared state
-            self.env_tsts[env_path][(unit, routine_name)] = tst_file
+            # Run PyEDG and get the return code
+            _, _, returncode = atg_misc.run_cmd(
+                invocation["cmd"],
+                cwd=invocation["cwd"],
+                environ=self.plan.environ(invocation),
+                timeout=timeout,
+                log_file_prefix=invocation["outputs"]["pyedg_log_prefix"],
+                context=context,
+                memory_limit_kb=self.memory_limit_kb,
+            )
 
-        # Update the progress bar
-        self.move_progress_bar()
+            # Did we run out of time?
+            timed_out = monotonic.monotonic() - start >= timeout
+
+            # ATG's own log goes to the log store too, if there is one
+            if atg_log_store.log_store.enabled:
+                atg_log_store.log_store.ingest(invocation["outputs"]["log"], context)
+
+        # Killed by the time budget? Then the routines were out of time, rather
+        # than failing (and how long the batch ran says nothing about them)
+        if timed_out and budget_limited:
+            usage = atg_resource_usage.usage_table.latest(context)
+            if usage is not None:
+                atg_run_history.history.ignore(usage)
+            for routine_name in batch:
+                self.routine_done(
+                    env_path,
+                    unit,
+                    routine_name,
+                    inputs[routine_name],
+                    None,
+                    atg_failure_cache.BUDGET_OUTCOME,
+                    "cut short (time budget)",
+                )
+            return
+
+        # Split the tst into one per routine
+        failed = timed_out or (self.strict_rc and returncode)
+        if not failed and os.path.isfile(tst_file):
+            routine_tsts = {
+                routine_name: "{:s}.tst".format(
+                    self.plan.output_prefix(env_path, unit, routine_name)
+                )
+                for routine_name in batch
+            }
+            unmatched = tst_editor.TstFile(input_file=tst_file, output_file=None).split(
+                routine_tsts
+            )
+
+            # If we can't tell which routine a test is for, the batch failed
+            failed = bool(unmatched)
+        else:
+            failed = True
+
+        # Bisect a failed batch
+        if failed:
+            middle = len(batch) // 2
+            for half in (batch[:middle], batch[middle:]):
+                self.run_atg_batch(
+                    self.plan.atg_invocation(
+                        env_path, src_file, half, atg_plan.batch_name(half)
+                    ),
+                    timeout / 2.0,
+                )
+            return
+
+        # Each routine learns from its share of the batch
+        usage = atg_resource_usage.usage_table.latest(context)
+        if usage is not None:
+            atg_run_history.history.record_batch(usage, "atg", batch)
+
+        # Record the results
+        for routine_name in batch:
+            self.routine_done(
+                env_path,
+                unit,
+                routine_name,
+                inputs[routine_name],
+                routine_tsts[routine_name],
+                None,
+                None,
+            )
 
     def run_atg(self):
         """
@@ -276,25 +633,168 @@ class ProcessProject(atg_misc.ParallelExecutor):
         # Product of environments with routines in that environment
         routine_contexts = []
 
+        # Routines we skip as they are already covered (and those that we
+        # have no history for)
+        covered_skipped = 0
+        covered_seconds_saved = 0
+        covered_unknown = 0
+
+        # Routines that were completed by an earlier run
+        resumed = 0
+
         # For each impacted environment ...
         for env in self.impacted_environments:
 
             # For each source file ...
             for src_file in self.envs_to_units[env]:
 
+                # What's the unit name?
+                unit = os.path.splitext(os.path.basename(src_file))[0]
+
                 # For each routine ...
                 for routine_name in self.envs_to_units[env][src_file]:
 
+                    # If the existing tests already cover this routine, skip it
+                    if (unit, routine_name) in self.covered_routines[env]:
+                        self.env_tsts[env][(unit, routine_name)] = None
+                        self.routine_notes[env][
+                            (unit, routine_name)
+                        ] = "skipped (covered by existing tests)"
+
+                        covered_skipped += 1
+                        expected = self.timeout_policy.expected_duration(
+                            "atg", env, unit, routine_name
+                        )
+                        if expected is None:
+                            covered_unknown += 1
+                        else:
+                            covered_seconds_saved += expected
+                        continue
+
+                    # If an earlier run already did this routine, re-use it
+                    done = atg_journal.journal.completed("atg", env, unit, routine_name)
+                    if done is not None:
+                        routine_key = (unit, routine_name)
+                        tst_file = atg_journal.journal.artefact(done, "tst")
+                        self.env_tsts[env][routine_key] = tst_file
+                        if done["data"] is not None:
+                            self.routine_notes[env][routine_key] = done["data"]
+                        resumed += 1
+                        continue
+
                     # Store this combination
                     routine_contexts.append((env, src_file, routine_name))
 
+        if self.skip_covered:
+            atg_misc.print_warn(
+                "{skipped:d} routines are covered by the existing tests and were "
+                "skipped (estimated {saved:.0f} seconds saved, {unknown:d} "
+                "routines had no history)".format(
+                    skipped=covered_skipped,
+                    saved=covered_seconds_saved,
+                    unknown=covered_unknown,
+                )
+            )
+
+        if resumed:
+            atg_misc.print_warn(
+                "{:d} routines were completed by an earlier run".format(resumed)
+            )
+
+        # If we're on a time budget, do the most valuable routines first and
+        # keep back enough time to baseline afterwards
+        if self.time_budget is not None:
+            routine_contexts = self.time_budget.prioritise(routine_contexts)
+            self.atg_deadline = self.time_budget.atg_deadline(
+                self.impacted_environments,
+                self.baseline_clicast_calls(),
+                self.class_workers[atg_misc.CONCURRENCY_COMPILE],
+            )
+
+        # How many routines are we running?
+        total_routines = len(routine_contexts)
+
         # What Python routine do we want to call?
-        routine = self.run_atg_one_routine
+        if self.atg_batch_seconds:
+            routine = self.run_atg_batch
+            batches = atg_plan.batch_routines(
+                routine_contexts,
+                self.timeout_policy,
+                self.atg_batch_seconds,
+                self.atg_max_batch,
+            )
+            atg_misc.print_msg(
+                "Batched {:d} routines into {:d} PyEDG runs".format(
+                    total_routines, len(batches)
+                )
+            )
+        else:
+            routine = self.run_atg_one_routine
+            batches = [
+                (env_path, src_file, [routine_name])
+                for env_path, src_file, routine_name in routine_contexts
+            ]
+
+        # Plan the PyEDG invocations
+        self.plan.add_atg_contexts(batches)
+        if self.plan_file:
+            self.plan.save(self.plan_file)
+
+        # Each worker runs an invocation from the plan
+        routine_contexts = [[invocation] for invocation in self.plan.invocations]
 
         atg_misc.print_msg("Generating baseline test-cases ...")
 
         # Run this routine in parallel given the provided contexts
-        self.run_routine_parallel(routine, routine_contexts)
+        self.run_routine_parallel(
+            routine,
+            routine_contexts,
+            concurrency_class=atg_misc.CONCURRENCY_ATG,
+            total_steps=total_routines,
+        )
+
+        # Let the user know if we ran out of time
+        skipped = sum(
+            [
+                list(notes.values()).count("skipped (time budget)")
+                for notes in self.routine_notes.values()
+            ]
+        )
+        cut_short = sum(
+            [
+                list(notes.values()).count("cut short (time budget)")
+                for notes in self.routine_notes.values()
+            ]
+        )
+        if skipped or cut_short:
+            atg_misc.print_warn(
+                "Time budget exhausted: {:d} routines were not processed, {:d} "
+                "were cut short".format(skipped, cut_short)
+            )
+
+        # Let the user know which tsts we threw away
+        if self.quarantined_tsts:
+            atg_misc.print_warn(
+                "{:d} generated tsts were invalid and were quarantined".format(
+                    len(self.quarantined_tsts)
+                )
+            )
+
+        # Let the user know which routines we didn't retry
+        if self.failure_skips:
+            atg_misc.print_warn(
+                "{:d} routines were skipped as ATG keeps failing on them".format(
+                    len(self.failure_skips)
+                )
+            )
+
+    def baseline_clicast_calls(self):
+        """
+        How many clicast calls does baselining one environment make?
+        """
+        # build + baseline, merged tst run/execute/expecteds/create, rebuild +
+        # run/execute/create, then per iteration strip + the same four again
+        return 2 + 4 + 4 + 5 * self.baseline_iterations
 
     def gen_fptrs_one_environment(self, env_path):
         """
@@ -324,26 +824,27 @@ class ProcessProject(atg_misc.ParallelExecutor):
         pyedg_log_prefix = "{:s}_env_modifier".format(output_prefix)
 
         # Build-up our vpython command
-        cmd = os.path.expandvars(
-            "{vpython:s} {fptr_script:s}".format(
-                vpython=os.path.join("$VECTORCAST_DIR", "vpython"),
-                fptr_script=os.path.join(
-                    "$VECTORCAST_DIR",
-                    "python",
-                    "vector",
-                    "apps",
-                    "atg_utils",
-                    "fptr_env_modifier.py",
-                ),
-            )
-        )
+        vectorcast_dir = os.path.expandvars("$VECTORCAST_DIR")
+        cmd = [
+            os.path.join(vectorcast_dir, "vpython"),
+            os.path.join(
+                vectorcast_dir,
+                "python",
+                "vector",
+                "apps",
+                "atg_utils",
+                "fptr_env_modifier.py",
+            ),
+        ]
 
         # Run PyEDG and get the return code
         out, _, returncode = atg_misc.run_cmd(
             cmd,
             cwd=workdir,
-            timeout=self.timeout,
+            timeout=self.timeout_policy.timeout_for("gen_fptrs", env_path),
             log_file_prefix=pyedg_log_prefix,
+            context={"stage": "gen_fptrs", "environment": env_path},
+            memory_limit_kb=self.memory_limit_kb,
         )
 
         if ".env modified." in out:
@@ -352,27 +853,147 @@ class ProcessProject(atg_misc.ParallelExecutor):
             shutil.rmtree(env_path)
 
             # Rebuild the environment
-            cmd = os.path.expandvars(
-                "{clicast:s} -l c environment script run {env:s}.env".format(
-                    clicast=os.path.expandvars(
-                        os.path.join("$VECTORCAST_DIR", "clicast")
-                    ),
-                    env=env,
-                )
-            )
+            cmd = [
+                os.path.join(vectorcast_dir, "clicast"),
+                "-l",
+                "c",
+                "environment",
+                "script",
+                "run",
+                "{:s}.env".format(env),
+            ]
 
             rebuild_log_prefix = "{:s}_rebuild".format(output_prefix)
 
             _, _, returncode = atg_misc.run_cmd(
                 cmd,
                 cwd=workdir,
-                timeout=self.timeout,
+                timeout=self.timeout_policy.timeout_for("gen_fptrs_rebuild", env_path),
                 log_file_prefix=rebuild_log_prefix,
+                context={"stage": "gen_fptrs_rebuild", "environment": env_path},
+                memory_limit_kb=self.memory_limit_kb,
             )
 
         # Update the progress bar
         self.move_progress_bar()
 
+    def find_covered_one_environment(self, env_path):
+        """
+        Runs the existing (non-ATG) tests of an environment and finds the
+        routines that they fully cover (statements and branches)
+        """
+
+        # What's the name of this environment?
+        env = os.path.basename(env_path)
+
+        # What's the working dir?
+        workdir = os.path.dirname(env_path)
+
+        # Where do we want the artefacts to go?
+        if self.atg_work_dir is not None:
+            build_hash = os.path.basename(os.path.dirname(env_path))
+            output_location = os.path.join(self.atg_work_dir, build_hash)
+        else:
+            output_location = workdir
+
+        # What's the prefix of our all outputs? (absolute, as the tools run in
+        # the build folder)
+        output_prefix = os.path.abspath(
+            os.path.join(output_location, "{:s}_coverage".format(env))
+        )
+
+        # Only keep the tests that were not generated by ATG
+        existing_tst = "{:s}_existing_no_atg.tst".format(output_prefix)
+        self.remove_atg_tests(self.existing_tst_path(env_path), existing_tst)
+
+        # If there are no tests, nothing is covered
+        if "TEST.NAME:" not in open(existing_tst).read():
+            self.move_progress_bar()
+            return
+
+        clicast = os.path.expandvars(os.path.join("$VECTORCAST_DIR", "clicast"))
+        vpython = os.path.expandvars(os.path.join("$VECTORCAST_DIR", "vpython"))
+        coverage_script = os.path.join(
+            os.path.dirname(__file__), "function_coverage.py"
+        )
+        coverage_json = "{:s}.json".format(output_prefix)
+
+        # Import the tests, run them and dump the coverage of each function
+        steps = [
+            ("import", [clicast, "-e", env, "test", "script", "run", existing_tst]),
+            (
+                "execute",
+                [clicast, "-e", env, "execute", "batch", "--update_coverage_data"],
+            ),
+            ("dump", [vpython, coverage_script, env, coverage_json]),
+        ]
+
+        with self.memory_admission("coverage", env_path):
+            for step, cmd in steps:
+                atg_misc.run_cmd(
+                    cmd,
+                    cwd=workdir,
+                    log_file_prefix="{:s}_{:s}".format(output_prefix, step),
+                    shell=False,
+                    context={
+                        "stage": "coverage",
+                        "environment": env_path,
+                        "step": step,
+                    },
+                    memory_limit_kb=self.memory_limit_kb,
+                )
+
+        # No coverage, no skipping
+        if not os.path.exists(coverage_json):
+            self.move_progress_bar()
+            return
+
+        coverage = json.load(open(coverage_json))
+
+        covered = set()
+        for unit, functions in coverage.items():
+            for function, metrics in functions.items():
+                # Without statements or branches, there's no coverage to go on
+                fully_covered = (
+                    metrics["statements"] + metrics["branches"] > 0
+                    and metrics["covered_statements"] >= metrics["statements"]
+                    and metrics["covered_branches"] >= metrics["branches"]
+                )
+                if fully_covered:
+                    covered.add((unit, function))
+
+        # We're about to update the shared state, so grab the lock
+        with self.update_shared_state():
+            self.covered_routines[env_path] = covered
+
+        # Record that we're done with this environment
+        atg_journal.journal.record(
+            "coverage", (env_path,), data=sorted(list(pair) for pair in covered)
+        )
+
+        # Update the progress bar
+        self.move_progress_bar()
+
+    def find_covered_routines(self):
+        """
+        Finds the routines already fully covered by the existing tests, in
+        parallel
+        """
+
+        # We want to process all environments (that an earlier run didn't)
+        routine_context = []
+        for env in self.impacted_environments:
+            done = atg_journal.journal.completed("coverage", env)
+            if done is not None:
+                self.covered_routines[env] = set(tuple(pair) for pair in done["data"])
+            else:
+                routine_context.append([env])
+
+        atg_misc.print_msg("Finding routines covered by the existing tests ...")
+
+        # Run this routine in parallel given the provided contexts
+        self.run_routine_parallel(self.find_covered_one_environment, routine_context)
+
     def gen_fptrs(self):
         """
         Generates function pointer mappings in parallel
@@ -407,6 +1028,12 @@ class ProcessProject(atg_misc.ParallelExecutor):
         # What's our output name?
         merged_tst = os.path.join(build_path, "{:s}_atg.tst".format(env_name))
 
+        # Mapping from test hashes to the first test with that hash
+        survivors = {}
+
+        # Mapping from dropped tests to the test that was kept instead
+        duplicates = {}
+
         # Open-up the merged .tst
         with open(merged_tst, "w") as merged_fd:
 
@@ -419,8 +1046,11 @@ class ProcessProject(atg_misc.ParallelExecutor):
                 # Unpack our elements
                 source_name, routine_name = generated_tst
 
-                # Did we succeed or not?
-                succeeded = "succeeded" if routine_tst is not None else "failed"
+                # Did we succeed or not? (or did we not even try?)
+                if generated_tst in self.routine_notes[env_path]:
+                    succeeded = self.routine_notes[env_path][generated_tst]
+                else:
+                    succeeded = "succeeded" if routine_tst is not None else "failed"
 
                 # Write-out a message
                 msg = "-- ATG {:s} for {:s} (in unit {:s}) --".format(
@@ -432,14 +1062,45 @@ class ProcessProject(atg_misc.ParallelExecutor):
                     merged_fd.write("{:s}\n".format(elem))
 
                 # If we succeed, copy the contents of the tst into our new file
-                if routine_tst is not None:
+                if routine_tst is None:
+                    continue
+
+                if not self.dedup_tests:
                     merged_fd.write(open(routine_tst).read())
+                    continue
+
+                # Copy only the tests we have not seen before
+                tst_edit_instance = tst_editor.TstFile(
+                    input_file=routine_tst, output_file=None
+                )
+                for test_id, lines in tst_edit_instance.blocks(routine_tst):
+                    # Tests that don't say what they are are kept as they are
+                    if test_id is not None and None not in test_id:
+                        test_hash = tst_editor.canonical_hash(lines)
+                        test_key = "|".join(test_id)
+
+                        if test_hash in survivors:
+                            duplicates[test_key] = survivors[test_hash]
+                            continue
+
+                        survivors[test_hash] = test_key
+
+                    merged_fd.writelines(lines)
+
+        # Record what we dropped
+        if self.dedup_tests:
+            duplicates_json = os.path.join(
+                build_path, "{:s}_atg_duplicates.json".format(env_name)
+            )
+            with open(duplicates_json, "w") as duplicates_fd:
+                json.dump(duplicates, duplicates_fd, indent=2, sort_keys=True)
 
         # We're about to update the shared state, so grab the lock
         with self.update_shared_state():
 
             # Update the shared state
             self.merged_tsts[env_path] = merged_tst
+            self.duplicate_tests[env_path] = duplicates
 
         # Update the progress bar
         self.move_progress_bar()
@@ -455,29 +1116,40 @@ class ProcessProject(atg_misc.ParallelExecutor):
         env_file = os.path.join(build_dir, "{:s}.env".format(env_name))
 
         baseliner = baseline_for_atg.Baseline(
-            env_file=env_file, verbose=False, disable_failures=self.disable_failures
-        )
-        baseliner.run(
-            run_atg=False,
-            atg_file=merged_tst_name,
-            max_iter=self.baseline_iterations,
-            copy_out_manage=False,
-            parallel_object=self,
+            env_file=env_file,
+            verbose=False,
+            disable_failures=self.disable_failures,
+            memory_limit_kb=self.memory_limit_kb,
+            batch_clicast=self.batch_clicast,
         )
 
+        # Wait until we have the memory to run clicast
+        with self.memory_admission("baseline", env_path):
+            baseliner.run(
+                run_atg=False,
+                atg_file=merged_tst_name,
+                max_iter=self.baseline_iterations,
+                copy_out_manage=False,
+                parallel_object=self,
+            )
+
         tests_generated = open(merged_tst_name).read().count("TEST.NAME:")
 
-    def prune_and_merge_one_environment(self, env_path):
+        # Record that we're done with this environment
+        atg_journal.journal.record(
+            "baseline",
+            (env_path,),
+            artefacts={"final": os.path.join(build_dir, baseline_for_atg.FILE_FINAL)},
+        )
+
+    def existing_tst_path(self, env_path):
         """
-        Given an environment path, baselines the environment
+        Given an environment path, finds the .tst stored for it in Manage
         """
         env_name = os.path.basename(env_path)
 
         build_dir = os.path.dirname(env_path)
 
-        merged_atg_file = os.path.join(build_dir, baseline_for_atg.FILE_FINAL)
-        assert os.path.exists(merged_atg_file)
-
         manage_build_dir = os.path.dirname(build_dir)
         assert os.path.basename(manage_build_dir) == "build"
 
@@ -497,9 +1169,15 @@ class ProcessProject(atg_misc.ParallelExecutor):
         )
         assert os.path.exists(existing_tst) and os.path.isfile(existing_tst)
 
-        no_atg_tst = os.path.join(build_dir, "no_atg.tst")
+        return existing_tst
+
+    def remove_atg_tests(self, input_tst, output_tst):
+        """
+        Writes the tests of 'input_tst' that were not generated by ATG to
+        'output_tst'
+        """
         tst_edit_instance = tst_editor.TstFile(
-            input_file=existing_tst, output_file=no_atg_tst
+            input_file=input_tst, output_file=output_tst
         )
         match_all_subprograms = ".*"
         match_atg_tests = "^TEST.NAME:.*ATG"
@@ -507,6 +1185,22 @@ class ProcessProject(atg_misc.ParallelExecutor):
             subprogram_regex=match_all_subprograms, re_pattern=match_atg_tests
         )
 
+    def prune_and_merge_one_environment(self, env_path):
+        """
+        Given an environment path, baselines the environment
+        """
+        env_name = os.path.basename(env_path)
+
+        build_dir = os.path.dirname(env_path)
+
+        merged_atg_file = os.path.join(build_dir, baseline_for_atg.FILE_FINAL)
+        assert os.path.exists(merged_atg_file)
+
+        existing_tst = self.existing_tst_path(env_path)
+
+        no_atg_tst = os.path.join(build_dir, "no_atg.tst")
+        self.remove_atg_tests(existing_tst, no_atg_tst)
+
         #
         # TODO: this tst has two header blocks in it?
         #
@@ -525,9 +1219,182 @@ class ProcessProject(atg_misc.ParallelExecutor):
         # Store the final tst
         self.updated_files.add(final_tst)
 
+        # Record that we're done with this environment
+        atg_journal.journal.record(
+            "prune_and_merge", (env_path,), artefacts={"final_tst": final_tst}
+        )
+
+        # Unless we're minimising it, this environment is finished
+        if not self.minimise_tests:
+            self.environment_finished(final_tst)
+
+        # Update the progress bar
+        self.move_progress_bar()
+
+    def environment_finished(self, final_tst):
+        """
+        Called once an environment's final tst will not change any more
+        """
+        if self.publisher is not None:
+            self.publisher.publish(final_tst)
+
+    def minimise_one_environment(self, env_path):
+        """
+        Given an environment path, removes the ATG tests that add no coverage
+        over the other tests in its final tst
+        """
+
+        # What's the name of this environment?
+        env = os.path.basename(env_path)
+
+        # What's the working dir?
+        workdir = os.path.dirname(env_path)
+
+        # Where do we want the artefacts to go?
+        if self.atg_work_dir is not None:
+            build_hash = os.path.basename(os.path.dirname(env_path))
+            output_location = os.path.join(self.atg_work_dir, build_hash)
+        else:
+            output_location = workdir
+
+        # What's the prefix of our all outputs?
+        output_prefix = os.path.join(output_location, "{:s}_minimise".format(env))
+
+        # The existing and ATG tests, as written by prune and merge
+        combined_atg_existing = os.path.join(workdir, "combined_atg_existing.tst")
+
+        clicast = os.path.expandvars(os.path.join("$VECTORCAST_DIR", "clicast"))
+        vpython = os.path.expandvars(os.path.join("$VECTORCAST_DIR", "vpython"))
+        coverage_script = os.path.join(
+            os.path.dirname(__file__), "per_test_coverage.py"
+        )
+        coverage_json = "{:s}.json".format(output_prefix)
+
+        # Clear out the tests left by baselining (so that the combined tests
+        # aren't duplicated or renamed on import), import all of the tests, run
+        # them and dump the coverage of each test
+        steps = [
+            ("delete", [clicast, "-e", env, "test", "delete"]),
+            (
+                "import",
+                [clicast, "-e", env, "test", "script", "run", combined_atg_existing],
+            ),
+            (
+                "execute",
+                [clicast, "-e", env, "execute", "batch", "--update_coverage_data"],
+            ),
+            ("dump", [vpython, coverage_script, env, coverage_json]),
+        ]
+
+        with self.memory_admission("minimise", env_path):
+            for step, cmd in steps:
+                atg_misc.run_cmd(
+                    cmd,
+                    cwd=workdir,
+                    log_file_prefix="{:s}_{:s}".format(output_prefix, step),
+                    shell=False,
+                    context={
+                        "stage": "minimise",
+                        "environment": env_path,
+                        "step": step,
+                    },
+                    memory_limit_kb=self.memory_limit_kb,
+                )
+
+        # Where does the final tst live?
+        final_tst = os.path.join(self.final_tst_path, env, "{:s}.tst".format(env))
+
+        # No coverage, nothing to minimise
+        if not os.path.exists(coverage_json):
+            self.environment_finished(final_tst)
+            self.move_progress_bar()
+            return
+
+        test_points = json.load(open(coverage_json))
+
+        # Which tests do we have, and which of them could we remove?
+        tst_edit_instance = tst_editor.TstFile(
+            input_file=combined_atg_existing, output_file=None
+        )
+        kept = []
+        candidates = []
+        for test_id, _ in tst_edit_instance.blocks(combined_atg_existing):
+            # Tests that don't say what they are are always kept (by 'keep')
+            if test_id is None or None in test_id:
+                continue
+            test_key = "|".join(test_id)
+            if "ATG" in test_id[2]:
+                candidates.append(test_key)
+            else:
+                kept.append(test_key)
+
+        to_keep, report = atg_minimise.minimise(test_points, candidates, kept)
+
+        # Write-out the subset
+        minimised_tst = os.path.join(workdir, "minimised.tst")
+        tst_editor.TstFile(
+            input_file=combined_atg_existing, output_file=minimised_tst
+        ).keep(set(tuple(test_key.split("|")) for test_key in to_keep))
+
+        shutil.copyfile(minimised_tst, final_tst)
+
+        # Write-out the report
+        report["environment"] = env_path
+        with open("{:s}_report.json".format(output_prefix), "w") as report_fd:
+            json.dump(report, report_fd, indent=2)
+
+        # We're about to update the shared state, so grab the lock
+        with self.update_shared_state():
+            self.minimise_reports[env_path] = report
+
+        # Record that we're done with this environment
+        atg_journal.journal.record(
+            "minimise", (env_path,), artefacts={"final_tst": final_tst}, data=report
+        )
+
+        # This environment is finished
+        self.environment_finished(final_tst)
+
         # Update the progress bar
         self.move_progress_bar()
 
+    def minimise_suites(self):
+        """
+        Minimises the final test-suites in parallel, keeping the smallest set
+        of ATG tests that preserves their coverage
+        """
+
+        # We want to process all environments (that an earlier run didn't)
+        routine_context = []
+        for env in self.env_tsts:
+            done = atg_journal.journal.completed("minimise", env)
+            if done is not None:
+                self.minimise_reports[env] = done["data"]
+                self.environment_finished(
+                    atg_journal.journal.artefact(done, "final_tst")
+                )
+            else:
+                routine_context.append([env])
+
+        atg_misc.print_msg("Minimising test-suites ...")
+
+        # Run this routine in parallel given the provided contexts
+        self.run_routine_parallel(self.minimise_one_environment, routine_context)
+
+        # Summarise what we removed
+        for env_path in sorted(self.minimise_reports):
+            report = self.minimise_reports[env_path]
+            atg_misc.print_msg(
+                "{:s}: kept {:d} of {:d} tests ({:d} removed), "
+                "{:.1f}% of coverage retained".format(
+                    os.path.basename(env_path),
+                    report["tests_after"],
+                    report["tests_before"],
+                    len(report["removed"]),
+                    report["coverage_retained"],
+                )
+            )
+
     def merge_atg_routine_tst(self):
         """
         Merges the routine-level tst files into one big file, with parallelism
@@ -546,7 +1413,16 @@ class ProcessProject(atg_misc.ParallelExecutor):
         atg_misc.print_msg("Merging all ATG test-cases ...")
 
         # Run this routine in parallel given the provided context
-        self.run_routine_parallel(routine, routine_context)
+        self.run_routine_parallel(
+            routine, routine_context, concurrency_class=atg_misc.CONCURRENCY_IO
+        )
+
+        if self.dedup_tests:
+            atg_misc.print_msg(
+                "Dropped {:d} duplicate ATG test-cases".format(
+                    sum(len(dropped) for dropped in self.duplicate_tests.values())
+                )
+            )
 
     def baseline(self):
         """
@@ -557,7 +1433,11 @@ class ProcessProject(atg_misc.ParallelExecutor):
         # We want to process each environment (needs to be in a list, to avoid
         # unpacking the environment path into a list of strings)
         #
-        routine_context = [[env] for env in self.env_tsts]
+        routine_context = [
+            [env]
+            for env in self.env_tsts
+            if atg_journal.journal.completed("baseline", env) is None
+        ]
 
         # What Python routine do we want to call?
         routine = self.baseline_one_environment
@@ -592,7 +1472,16 @@ class ProcessProject(atg_misc.ParallelExecutor):
         # We want to process each environment (needs to be in a list, to avoid
         # unpacking the environment path into a list of strings)
         #
-        routine_context = [[env] for env in self.env_tsts]
+        routine_context = []
+        for env in self.env_tsts:
+            done = atg_journal.journal.completed("prune_and_merge", env)
+            if done is not None:
+                final_tst = atg_journal.journal.artefact(done, "final_tst")
+                self.updated_files.add(final_tst)
+                if not self.minimise_tests:
+                    self.environment_finished(final_tst)
+            else:
+                routine_context.append([env])
 
         # What Python routine do we want to call?
         routine = self.prune_and_merge_one_environment
@@ -600,7 +1489,9 @@ class ProcessProject(atg_misc.ParallelExecutor):
         atg_misc.print_msg("Pruning test-cases ...")
 
         # Run this routine in parallel given the provided context
-        self.run_routine_parallel(routine, routine_context)
+        self.run_routine_parallel(
+            routine, routine_context, concurrency_class=atg_misc.CONCURRENCY_IO
+        )
 
     def store_envs(self):
         """
@@ -648,22 +1539,17 @@ class ProcessProject(atg_misc.ParallelExecutor):
                 preserved.append(to_keep)
                 shutil.copyfile(*to_keep)
 
-        # What's our command?
-        cmd = os.path.expandvars(
-            "{manage:s} -p {vcm_name:s} --apply-changes --force --verbose".format(
-                manage=os.path.expandvars(os.path.join("$VECTORCAST_DIR", "manage")),
-                vcm_name=vcm_name,
-            )
-        )
-
         # Where do we want the log to go?
         manage_log_file = os.path.join(manage_parent_folder, "apply_changes")
 
         # Run Manage
-        atg_misc.run_cmd(
-            cmd,
-            cwd=manage_parent_folder,
+        atg_manage_cli.manage_cli.run(
+            vcm_name,
+            [["--apply-changes", "--force", "--verbose"]],
+            manage_parent_folder,
             log_file_prefix=manage_log_file,
+            context={"stage": "store_envs"},
+            check=False,
         )
 
         # Restore the changed files
@@ -684,25 +1570,41 @@ class ProcessProject(atg_misc.ParallelExecutor):
         if self.configuration.options.gen_fptrs:
             # If we're generating function pointers, then we do this as a
             # standalone step
-            self.gen_fptrs()
+            with atg_tracing.span("gen_fptrs", "stage"):
+                self.gen_fptrs()
 
             # Store the updated environments
-            self.store_envs()
+            with atg_tracing.span("store_envs", "stage"):
+                self.store_envs()
 
             # Don't do anything else
             return
 
+        # Find what the existing tests already cover
+        if self.skip_covered:
+            with atg_tracing.span("find_covered_routines", "stage"):
+                self.find_covered_routines()
+
         # Run ATG
-        self.run_atg()
+        with atg_tracing.span("run_atg", "stage"):
+            self.run_atg()
 
         # Merge the seperate .tsts
-        self.merge_atg_routine_tst()
+        with atg_tracing.span("merge_atg_routine_tst", "stage"):
+            self.merge_atg_routine_tst()
 
         # Run baselining + stripping
-        self.baseline()
+        with atg_tracing.span("baseline", "stage"):
+            self.baseline()
 
         # Remove old ATG and merge with existing tests
-        self.prune_and_merge()
+        with atg_tracing.span("prune_and_merge", "stage"):
+            self.prune_and_merge()
+
+        # Only keep the ATG tests that add coverage
+        if self.minimise_tests:
+            with atg_tracing.span("minimise_suites", "stage"):
+                self.minimise_suites()
 
 
 # EOF
@@ -0,0 +1,185 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import threading
+import monotonic
+
+import atg_execution.misc as atg_misc
+
+
+@atg_misc.for_all_methods(
+    atg_misc.log_entry_exit, exclude_methods=["ready", "run", "hand_over"]
+)
+class Publisher(object):
+    """
+    Hands finished files to the 'store_updated_batch' hook from a background
+    thread, as they are finished, so that publishing overlaps the rest of the
+    run
+
+    Files are handed over in batches: once 'batch_files' are waiting, or the
+    oldest has waited 'batch_seconds'
+    """
+
+    def __init__(self, hook, batch_files=1, batch_seconds=60):
+
+        # Called with a set of files
+        self.hook = hook
+
+        # When do we hand over a batch?
+        self.batch_files = max(batch_files, 1)
+        self.batch_seconds = batch_seconds
+
+        # Files waiting to be handed over
+        self.pending = set()
+
+        # When did the oldest waiting file arrive?
+        self.oldest = None
+
+        # Have we been closed?
+        self.closed = False
+
+        # Files the hook failed on, and why (retried when we're closed)
+        self.failed = set()
+        self.errors = []
+
+        # Has the publishing thread finished?
+        self.finished = False
+
+        # Files that have been handed over
+        self.published = set()
+
+        # To wake the publishing thread
+        self.condition = threading.Condition()
+
+        self.thread = threading.Thread(target=self.run, name="publisher")
+        self.thread.daemon = True
+        self.thread.start()
+
+        publishers.append(self)
+
+    def __repr__(self):
+        return str({"pending": len(self.pending), "published": len(self.published)})
+
+    def publish(self, path):
+        """
+        Queues a finished file
+        """
+        with self.condition:
+            if not self.pending:
+                self.oldest = monotonic.monotonic()
+            self.pending.add(path)
+            self.condition.notify()
+
+    def ready(self):
+        """
+        Is a batch ready to go? (called with the condition held)
+        """
+        if not self.pending:
+            return False
+        if self.closed or len(self.pending) >= self.batch_files:
+            return True
+        return monotonic.monotonic() - self.oldest >= self.batch_seconds
+
+    def run(self):
+        """
+        Publishing thread
+        """
+        while True:
+            with self.condition:
+                while not self.ready() and not self.closed:
+                    if self.pending:
+                        waited = monotonic.monotonic() - self.oldest
+                        self.condition.wait(max(self.batch_seconds - waited, 0))
+                    else:
+                        self.condition.wait()
+
+                if not self.pending:
+                    # Closed, and nothing left
+                    return
+
+                batch = self.pending
+                self.pending = set()
+                self.oldest = None
+
+            self.hand_over(batch)
+
+    def hand_over(self, batch):
+        """
+        Calls the hook with 'batch', keeping the files if it fails
+        """
+        try:
+            self.hook(batch)
+            self.published |= batch
+            return True
+        except Exception as error:
+            atg_misc.print_warn("Publishing failed: {:s}".format(str(error)))
+            self.failed |= batch
+            self.errors.append(error)
+            return False
+
+    def close(self):
+        """
+        Hands over anything still waiting, and waits for the hook to finish --
+        files the hook failed on are retried once, and if they fail again, an
+        error is raised
+        """
+        if self.finished:
+            return
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+        self.thread.join()
+        self.finished = True
+
+        if not self.failed:
+            return
+
+        batch = self.failed
+        self.failed = set()
+        if not self.hand_over(batch):
+            raise RuntimeError(
+                "Could not publish {:d} files (first: {:s}): {:s}".format(
+                    len(self.failed), sorted(self.failed)[0], str(self.errors[-1])
+                )
+            )
+
+
+def close_all():
+    """
+    Publishes whatever the publishers still have (e.g., if the run went wrong
+    before they were closed), warning about what couldn't be
+    """
+    for publisher in publishers:
+        try:
+            publisher.close()
+        except Exception as error:
+            atg_misc.print_warn(str(error))
+
+
+# Every publisher created, so that they can be closed at exit
+publishers = []
+
+
+# EOF
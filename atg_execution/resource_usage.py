@@ -0,0 +1,243 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import csv
+import threading
+from collections import namedtuple
+
+# Columns identifying what a child process was doing
+KEY_FIELDS = ["stage", "environment", "unit", "routine", "step"]
+
+# Columns obtained from the rusage of the child process
+RUSAGE_FIELDS = [
+    "user_seconds",
+    "sys_seconds",
+    "max_rss_kb",
+    "block_in",
+    "block_out",
+    "voluntary_switches",
+    "involuntary_switches",
+]
+
+# Columns describing how the child process behaved
+USAGE_FIELDS = (
+    ["tool", "wall_seconds"] + RUSAGE_FIELDS + ["returncode", "timeout_exceeded"]
+)
+
+usage_record = namedtuple("usage_record", KEY_FIELDS + USAGE_FIELDS)
+
+stage_record = namedtuple(
+    "stage_record",
+    [
+        "stage",
+        "concurrency_class",
+        "workers",
+        "cpus",
+        "wall_seconds",
+        "children",
+        "child_cpu_seconds",
+        "running_children",
+        "busy_cpus",
+        "oversubscription",
+        "cpu_utilisation",
+    ],
+)
+
+
+def from_rusage(rusage, tool, wall_seconds, returncode, timeout_exceeded, context):
+    """
+    Builds a usage record from the rusage of a (reaped) child process
+
+    'rusage' may be None if the platform does not provide 'wait4', in which
+    case only the wall-clock information is available
+    """
+
+    if context is None:
+        context = {}
+
+    keys = {field: context.get(field, "") for field in KEY_FIELDS}
+
+    if rusage is None:
+        usage = dict.fromkeys(RUSAGE_FIELDS, None)
+    else:
+        usage = {
+            "user_seconds": rusage.ru_utime,
+            "sys_seconds": rusage.ru_stime,
+            "max_rss_kb": rusage.ru_maxrss,
+            "block_in": rusage.ru_inblock,
+            "block_out": rusage.ru_oublock,
+            "voluntary_switches": rusage.ru_nvcsw,
+            "involuntary_switches": rusage.ru_nivcsw,
+        }
+
+    return usage_record(
+        tool=tool,
+        wall_seconds=wall_seconds,
+        returncode=returncode,
+        timeout_exceeded=timeout_exceeded,
+        **keys,
+        **usage
+    )
+
+
+def footer(record):
+    """
+    Text appended to the '.out' log of a child process
+    """
+    if record.user_seconds is None:
+        return "\nResource usage: not available on this platform\n"
+
+    return (
+        "\nCPU seconds (user/sys): {user:.2f}/{sys:.2f}\n"
+        "\nPeak RSS (KiB): {rss:d}\n"
+        "\nBlock I/O operations (in/out): {bin:d}/{bout:d}\n"
+        "\nContext switches (voluntary/involuntary): {vcsw:d}/{ivcsw:d}\n"
+    ).format(
+        user=record.user_seconds,
+        sys=record.sys_seconds,
+        rss=record.max_rss_kb,
+        bin=record.block_in,
+        bout=record.block_out,
+        vcsw=record.voluntary_switches,
+        ivcsw=record.involuntary_switches,
+    )
+
+
+class ResourceUsageTable(object):
+    """
+    Collects the usage records of every child process started during a run
+    """
+
+    def __init__(self):
+
+        # The records, in completion order
+        self.records = []
+
+        # The summary of each parallel stage, in order
+        self.stages = []
+
+        # Mutex to allow for threads to add records
+        self.mutex = threading.Lock()
+
+    def add(self, record):
+        with self.mutex:
+            self.records.append(record)
+
+    def latest(self, context):
+        """
+        The most recent record for 'context' (None if there isn't one)
+        """
+        keys = tuple(context.get(field, "") for field in KEY_FIELDS)
+        with self.mutex:
+            for record in reversed(self.records):
+                if tuple(getattr(record, field) for field in KEY_FIELDS) == keys:
+                    return record
+        return None
+
+    def add_stage(
+        self, stage, concurrency_class, workers, cpus, wall_seconds, first_record
+    ):
+        """
+        Summarises how the children of a stage (the records from
+        'first_record' onwards) used the CPUs:
+
+            * running_children: average number of children running at once
+
+            * busy_cpus: average number of CPUs the children kept busy
+
+            * oversubscription: running children per CPU (above 1, children
+              were competing for CPUs)
+
+            * cpu_utilisation: busy CPUs per CPU
+        """
+        with self.mutex:
+            records = self.records[first_record:]
+
+        child_wall_seconds = sum([record.wall_seconds for record in records])
+        child_cpu_seconds = sum(
+            [
+                record.user_seconds + record.sys_seconds
+                for record in records
+                if record.user_seconds is not None
+            ]
+        )
+
+        # Avoid dividing by zero for (very) empty stages
+        wall_seconds = max(wall_seconds, 1e-6)
+
+        running_children = child_wall_seconds / wall_seconds
+        busy_cpus = child_cpu_seconds / wall_seconds
+
+        summary = stage_record(
+            stage=stage,
+            concurrency_class=concurrency_class,
+            workers=workers,
+            cpus=cpus,
+            wall_seconds=wall_seconds,
+            children=len(records),
+            child_cpu_seconds=child_cpu_seconds,
+            running_children=running_children,
+            busy_cpus=busy_cpus,
+            oversubscription=running_children / cpus,
+            cpu_utilisation=busy_cpus / cpus,
+        )
+
+        with self.mutex:
+            self.stages.append(summary)
+
+        return summary
+
+    def for_tool(self, tool):
+        """
+        All of the records for 'tool'
+        """
+        with self.mutex:
+            return [record for record in self.records if record.tool == tool]
+
+    def heaviest(self, tool, field, count=10):
+        """
+        The 'count' records for 'tool' with the largest 'field'
+        """
+        candidates = [
+            record
+            for record in self.for_tool(tool)
+            if getattr(record, field) is not None
+        ]
+
+        return sorted(candidates, key=lambda r: getattr(r, field), reverse=True)[:count]
+
+    def save_csv(self, csv_path):
+        with self.mutex:
+            records = list(self.records)
+
+        with open(csv_path, "w", newline="") as csv_fd:
+            writer = csv.writer(csv_fd)
+            writer.writerow(usage_record._fields)
+            writer.writerows(records)
+
+
+# The usage table for this process
+usage_table = ResourceUsageTable()
+
+
+# EOF
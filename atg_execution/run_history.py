@@ -0,0 +1,160 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import json
+import threading
+
+# How many samples do we keep per key?
+MAX_SAMPLES = 20
+
+
+def history_key(stage, environment, unit="", routine=""):
+    """
+    Key for a unit of work -- environments are keyed by name (and not by
+    their build folder), so that history survives a Manage rebuild
+    """
+    return "|".join([stage, os.path.basename(environment), unit, routine])
+
+
+class RunHistory(object):
+    """
+    Persists how subprocesses behaved (duration, peak RSS and outcome) across
+    runs, so that later runs can learn from earlier ones
+    """
+
+    def __init__(self):
+
+        # Where is the history stored? (None if it isn't)
+        self.history_path = None
+
+        # For each key, the most recent samples (oldest first)
+        self.samples = {}
+
+        # Usage records that aren't to be learnt from (by id)
+        self.ignored = set()
+
+        # Mutex to allow for threads to query/update the history
+        self.mutex = threading.Lock()
+
+    def load(self, history_path):
+        """
+        Loads the history (if any) from 'history_path'
+        """
+        self.history_path = history_path
+
+        if os.path.exists(history_path):
+            with open(history_path) as history_fd:
+                self.samples = json.load(history_fd)
+
+    def save(self):
+        if self.history_path is None:
+            return
+
+        with self.mutex:
+            with open(self.history_path, "w") as history_fd:
+                json.dump(self.samples, history_fd, indent=1, sort_keys=True)
+
+    def record(self, usage_records):
+        """
+        Adds the usage records (from resource_usage) of this run
+        """
+        with self.mutex:
+            for record in usage_records:
+                if id(record) in self.ignored:
+                    continue
+                key = history_key(
+                    record.stage, record.environment, record.unit, record.routine
+                )
+                samples = self.samples.setdefault(key, [])
+                samples.append(
+                    {
+                        "wall_seconds": record.wall_seconds,
+                        "max_rss_kb": record.max_rss_kb,
+                        "returncode": record.returncode,
+                        "timeout_exceeded": record.timeout_exceeded,
+                    }
+                )
+                del samples[:-MAX_SAMPLES]
+
+    def ignore(self, record):
+        """
+        Keeps a usage record of this run out of the history (e.g., a process
+        that was killed early for reasons of its own)
+        """
+        with self.mutex:
+            self.ignored.add(id(record))
+
+    def record_batch(self, record, stage, routines):
+        """
+        Attributes the usage record of several routines run together (e.g., by
+        one PyEDG) to each of them under 'stage': they share its wall-clock
+        time evenly, and its peak RSS
+        """
+        with self.mutex:
+            for routine in routines:
+                key = history_key(stage, record.environment, record.unit, routine)
+                samples = self.samples.setdefault(key, [])
+                samples.append(
+                    {
+                        "wall_seconds": record.wall_seconds / len(routines),
+                        "max_rss_kb": record.max_rss_kb,
+                        "returncode": record.returncode,
+                        "timeout_exceeded": record.timeout_exceeded,
+                    }
+                )
+                del samples[:-MAX_SAMPLES]
+
+    def get_samples(self, stage, environment, unit="", routine=""):
+        with self.mutex:
+            return list(
+                self.samples.get(history_key(stage, environment, unit, routine), [])
+            )
+
+    def durations(self, stage, environment, unit="", routine=""):
+        """
+        Wall-clock seconds of each sample for this unit of work (for a timed
+        out sample, that's how long we waited before killing it)
+        """
+        return [
+            sample["wall_seconds"]
+            for sample in self.get_samples(stage, environment, unit, routine)
+        ]
+
+    def peak_rss_kb(self, stage, environment, unit="", routine=""):
+        """
+        Largest peak RSS seen for this unit of work (None if never seen)
+        """
+        observed = [
+            sample["max_rss_kb"]
+            for sample in self.get_samples(stage, environment, unit, routine)
+            if sample["max_rss_kb"] is not None
+        ]
+        return max(observed) if observed else None
+
+
+# The history for this process
+history = RunHistory()
+
+
+# EOF
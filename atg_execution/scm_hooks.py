@@ -65,13 +65,24 @@ class GitImpactedObjectFinder(ImpactedObjectFinder):
         # Create our git class
         self.repo = git.Repo(repository_location)
 
+        # What git tracks (listed once)
+        self.all_files = None
+
     def __repr__(self):
         return str(self.repo)
 
     def _find_all_files(self):
-        g = git.Git(self.repository_location)
-        all_files = {fname.strip() for fname in g.ls_files().split("\n")}
-        return all_files
+        if self.all_files is None:
+            g = git.Git(self.repository_location)
+            self.all_files = {fname.strip() for fname in g.ls_files().split("\n")}
+        return self.all_files
+
+    def find_all_files(self):
+        """
+        All of the files git tracks, relative to the repository (e.g., for a
+        configuration's 'find_all_files')
+        """
+        return set(self._find_all_files())
 
     def _find_changed_files(self, current_id, new_id):
         """
@@ -0,0 +1,164 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import math
+import monotonic
+
+import atg_execution.run_history as atg_run_history
+
+# Never learn a timeout shorter than this (in seconds)
+MIN_LEARNED_TIMEOUT = 10
+
+# Share of the remaining time budget kept for the stages after ATG, when we
+# have no history to estimate them from
+DEFAULT_DOWNSTREAM_SHARE = 0.5
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a non-empty list
+    """
+    ordered = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+
+class TimeoutPolicy(object):
+    """
+    Decides how long a unit of work is given before it is killed: either the
+    fixed '--timeout', or (with '--adaptive_timeout') a timeout learned from
+    how long the same work took in earlier runs
+    """
+
+    def __init__(self, options):
+
+        # Timeout for work we know nothing about
+        self.default_timeout = options.timeout
+
+        # Are we learning timeouts?
+        self.adaptive = options.adaptive_timeout
+
+        # Which percentile of the earlier durations do we use?
+        self.percentile = options.timeout_percentile
+
+        # How much longer than that percentile do we wait?
+        self.slack = options.timeout_slack
+
+        # Upper bound on learned timeouts (None for no bound)
+        self.max_timeout = options.max_timeout
+
+    def timeout_for(self, stage, environment, unit="", routine="", deadline=None):
+        """
+        Timeout (in seconds) for the given unit of work -- if 'deadline' is
+        given, the timeout never goes past it, and None is returned if the
+        deadline has already passed
+        """
+        timeout = self.default_timeout
+
+        if self.adaptive:
+            durations = atg_run_history.history.durations(
+                stage, environment, unit, routine
+            )
+            if durations:
+                timeout = percentile(durations, self.percentile) * self.slack
+                timeout = max(timeout, MIN_LEARNED_TIMEOUT)
+                if self.max_timeout:
+                    timeout = min(timeout, self.max_timeout)
+
+        if deadline is not None:
+            remaining = deadline - monotonic.monotonic()
+            if remaining <= 0:
+                return None
+            timeout = min(timeout, remaining)
+
+        return timeout
+
+    def expected_duration(self, stage, environment, unit="", routine=""):
+        """
+        Mean duration of earlier runs of the given unit of work (None if it
+        has never been run)
+        """
+        durations = atg_run_history.history.durations(stage, environment, unit, routine)
+        if not durations:
+            return None
+        return sum(durations) / len(durations)
+
+
+class TimeBudget(object):
+    """
+    Spreads a wall-clock budget for the whole run over the ATG work, keeping
+    back enough of it for the stages that come after ATG
+    """
+
+    def __init__(self, deadline, timeout_policy):
+
+        # When must the run be finished by?
+        self.deadline = deadline
+
+        # To estimate how long work will take
+        self.timeout_policy = timeout_policy
+
+    def prioritise(self, routine_contexts):
+        """
+        Orders (env, src_file, routine) contexts so that as many routines as
+        possible finish: routines never seen before (likely new code) come
+        first, then the cheapest ones
+        """
+
+        def priority(routine_context):
+            env_path, src_file, routine_name = routine_context
+            unit = os.path.splitext(os.path.basename(src_file))[0]
+            expected = self.timeout_policy.expected_duration(
+                "atg", env_path, unit, routine_name
+            )
+            return (expected is not None, expected or 0)
+
+        return sorted(routine_contexts, key=priority)
+
+    def atg_deadline(self, environments, steps_per_environment, workers):
+        """
+        When must ATG be finished by, so that baselining the given
+        environments still fits in the budget?
+        """
+        remaining = self.deadline - monotonic.monotonic()
+
+        # How long did each clicast call of each environment's baselining take?
+        costs = []
+        for env_path in environments:
+            expected_step = self.timeout_policy.expected_duration("baseline", env_path)
+            if expected_step is None:
+                costs = None
+                break
+            costs.append(expected_step * steps_per_environment)
+
+        if costs:
+            # The environments are baselined in parallel
+            downstream = max(max(costs), sum(costs) / workers)
+        else:
+            downstream = remaining * DEFAULT_DOWNSTREAM_SHARE
+
+        return self.deadline - downstream
+
+
+# EOF
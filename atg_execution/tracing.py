@@ -0,0 +1,266 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import json
+import threading
+import monotonic
+from contextlib import contextmanager
+
+# Chrome trace-events use microseconds
+US_PER_SECOND = 1000000
+
+# Worker slot used for the main thread (i.e., anything outside of a pool)
+MAIN_SLOT = 0
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>ATG run timeline</title>
+<style>
+body { font-family: sans-serif; font-size: 12px; margin: 10px; }
+#chart { position: relative; border-top: 1px solid #ccc; }
+.row { position: relative; height: 18px; border-bottom: 1px solid #eee; }
+.label { position: absolute; left: 0; width: 90px; line-height: 18px; }
+.lane { position: absolute; left: 95px; right: 0; top: 0; bottom: 0; }
+.span { position: absolute; top: 2px; height: 14px; overflow: hidden;
+        white-space: nowrap; font-size: 10px; line-height: 14px;
+        box-sizing: border-box; border: 1px solid rgba(0, 0, 0, 0.3); }
+#legend span { display: inline-block; padding: 2px 6px; margin-right: 4px; }
+</style>
+</head>
+<body>
+<h3>ATG run timeline (__DURATION__ seconds)</h3>
+<div id="legend"></div>
+<div id="chart"></div>
+<script>
+var events = __EVENTS__;
+var colours = ["#8dd3c7", "#ffffb3", "#bebada", "#fb8072", "#80b1d3",
+               "#fdb462", "#b3de69", "#fccde5", "#d9d9d9", "#bc80bd"];
+var categories = {};
+var rows = {};
+var end = 1;
+events.forEach(function (e) {
+  if (!(e.cat in categories)) {
+    categories[e.cat] = colours[Object.keys(categories).length % colours.length];
+  }
+  // Nested spans on the same row get their own sub-row, based on depth
+  var key = e.tid + ":" + e.args.depth;
+  if (!(key in rows)) { rows[key] = []; }
+  rows[key].push(e);
+  end = Math.max(end, e.ts + e.dur);
+});
+var legend = document.getElementById("legend");
+Object.keys(categories).forEach(function (cat) {
+  var item = document.createElement("span");
+  item.style.background = categories[cat];
+  item.textContent = cat;
+  legend.appendChild(item);
+});
+var chart = document.getElementById("chart");
+Object.keys(rows).sort(function (a, b) {
+  var pa = a.split(":").map(Number), pb = b.split(":").map(Number);
+  return pa[0] - pb[0] || pa[1] - pb[1];
+}).forEach(function (key) {
+  var parts = key.split(":");
+  var row = document.createElement("div");
+  row.className = "row";
+  var label = document.createElement("div");
+  label.className = "label";
+  label.textContent = (parts[0] === "0" ? "main" : "worker " + parts[0]) +
+    (parts[1] === "0" ? "" : " +" + parts[1]);
+  row.appendChild(label);
+  var lane = document.createElement("div");
+  lane.className = "lane";
+  rows[key].forEach(function (e) {
+    var bar = document.createElement("div");
+    bar.className = "span";
+    bar.style.left = (100 * e.ts / end) + "%";
+    bar.style.width = Math.max(0.05, 100 * e.dur / end) + "%";
+    bar.style.background = categories[e.cat];
+    bar.textContent = e.name;
+    bar.title = e.name + " (" + (e.dur / 1e6).toFixed(2) + "s)\\n" +
+      JSON.stringify(e.args, null, 1);
+    lane.appendChild(bar);
+  });
+  row.appendChild(lane);
+  chart.appendChild(row);
+});
+</script>
+</body>
+</html>
+"""
+
+
+class Tracer(object):
+    """
+    Records (possibly nested) timed spans, tagged with the worker slot of the
+    thread that executed them
+    """
+
+    def __init__(self):
+
+        # Are we recording spans?
+        self.enabled = False
+
+        # The finished spans
+        self.events = []
+
+        # Mutex to allow for threads to record spans
+        self.mutex = threading.Lock()
+
+        # Per-thread state (worker slot and nesting depth)
+        self.local = threading.local()
+
+        # Time zero for our trace
+        self.origin = monotonic.monotonic()
+
+    def enable(self):
+        """
+        Starts recording spans (and resets the time origin)
+        """
+        self.enabled = True
+        self.events = []
+        self.origin = monotonic.monotonic()
+
+    def assign_worker_slot(self, slot_counter):
+        """
+        Pool initialiser: gives the calling worker thread the next slot
+        """
+        self.local.slot = next(slot_counter)
+
+    @property
+    def worker_slot(self):
+        return getattr(self.local, "slot", MAIN_SLOT)
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """
+        Times the body of the 'with' statement -- the yielded dictionary can
+        be used to attach extra arguments to the span
+        """
+        if not self.enabled:
+            yield args
+            return
+
+        # How deep are we nested on this thread?
+        depth = getattr(self.local, "depth", 0)
+        self.local.depth = depth + 1
+
+        start = monotonic.monotonic()
+        try:
+            yield args
+        finally:
+            end = monotonic.monotonic()
+            self.local.depth = depth
+
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": int((start - self.origin) * US_PER_SECOND),
+                "dur": int((end - start) * US_PER_SECOND),
+                "pid": os.getpid(),
+                "tid": self.worker_slot,
+                "args": dict(args, depth=depth),
+            }
+
+            with self.mutex:
+                self.events.append(event)
+
+    def thread_name_events(self):
+        """
+        Metadata events so that the trace viewer names our rows
+        """
+        slots = sorted({event["tid"] for event in self.events})
+        return [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": slot,
+                "args": {
+                    "name": "main" if slot == MAIN_SLOT else "worker {:d}".format(slot)
+                },
+            }
+            for slot in slots
+        ]
+
+    def save_chrome_trace(self, trace_path):
+        """
+        Writes the spans in Chrome's trace-event format (chrome://tracing,
+        Perfetto, Speedscope)
+        """
+        with self.mutex:
+            events = sorted(self.events, key=lambda event: event["ts"])
+
+        trace = {
+            "traceEvents": self.thread_name_events() + events,
+            "displayTimeUnit": "ms",
+        }
+
+        with open(trace_path, "w") as trace_fd:
+            json.dump(trace, trace_fd)
+
+    def save_html(self, html_path):
+        """
+        Writes a self-contained HTML Gantt chart of the spans
+        """
+        with self.mutex:
+            events = sorted(self.events, key=lambda event: event["ts"])
+
+        duration = max([event["ts"] + event["dur"] for event in events] + [0])
+
+        # Make sure no span name can close our script block
+        events_json = json.dumps(events).replace("</", "<\\/")
+
+        html = HTML_TEMPLATE.replace("__EVENTS__", events_json).replace(
+            "__DURATION__", "{:.2f}".format(duration / US_PER_SECOND)
+        )
+
+        with open(html_path, "w") as html_fd:
+            html_fd.write(html)
+
+    def save(self, trace_path):
+        """
+        Writes both the Chrome trace (to 'trace_path') and the HTML view (next
+        to it, with a '.html' suffix -- added to the name if it already has one)
+        """
+        html_path = "{:s}.html".format(os.path.splitext(trace_path)[0])
+        if html_path == trace_path:
+            html_path = "{:s}.html".format(trace_path)
+
+        self.save_chrome_trace(trace_path)
+        self.save_html(html_path)
+
+
+# The tracer for this process
+tracer = Tracer()
+
+
+def span(name, category, **args):
+    return tracer.span(name, category, **args)
+
+
+# EOF
@@ -20,11 +20,41 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import hashlib
 import sys
 import re
 
 import atg_execution.misc as atg_misc
 
+# Lines whose order within a test does not change what the test does
+UNORDERED_PREFIXES = ("TEST.VALUE:", "TEST.EXPECTED:", "TEST.ATTRIBUTES:")
+
+
+def canonical_hash(lines):
+    """
+    Hashes the body of a test, ignoring its name and the order of the lines
+    where the order does not matter (so that structurally identical tests
+    hash the same)
+    """
+    ordered = []
+    unordered = []
+
+    for line in lines:
+        line = line.strip()
+
+        # Blank lines and the name don't change the test
+        if not line or line.startswith("TEST.NAME:"):
+            continue
+
+        if line.startswith(UNORDERED_PREFIXES):
+            unordered.append(line)
+        else:
+            ordered.append(line)
+
+    canonical = "\n".join(ordered + sorted(unordered))
+
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
 
 @atg_misc.for_all_methods(atg_misc.log_entry_exit)
 class TstFile(object):
@@ -43,6 +73,126 @@ class TstFile(object):
         with open(self.out_path, "w") as output_file:
             self.process(self.in_path, output_file, subprogram_regex, re_pattern)
 
+    def keep(self, test_ids):
+        """
+        Writes-out only the tests whose (unit, subprogram, name) are in
+        'test_ids', along with anything that is not part of a test (or is a
+        test without a unit, subprogram or name)
+        """
+        with open(self.out_path, "w") as output_file:
+            for test_id, lines in self.blocks(self.in_path):
+                if test_id is None or None in test_id or test_id in test_ids:
+                    output_file.writelines(lines)
+
+    def split(self, subprogram_paths):
+        """
+        Writes each test to the file for its subprogram (given by the mapping
+        'subprogram_paths'), with whatever comes before the first test copied
+        to each of them
+
+        Returns the subprograms that had tests but are not in the mapping
+        """
+        header = []
+        tests = dict((subprogram, []) for subprogram in subprogram_paths)
+        unmatched = set()
+
+        for test_id, lines in self.blocks(self.in_path):
+            if test_id is None:
+                if not any(tests.values()):
+                    header.extend(lines)
+                continue
+
+            subprogram = test_id[1]
+            if subprogram in tests:
+                tests[subprogram].extend(lines)
+            else:
+                unmatched.add(subprogram)
+
+        for subprogram, path in subprogram_paths.items():
+            with open(path, "w") as output_file:
+                output_file.writelines(header)
+                output_file.writelines(tests[subprogram])
+
+        return unmatched
+
+    def salvage(self):
+        """
+        Writes-out the complete tests of a partially written tst (for example,
+        if ATG timed-out whilst writing it), returning how many there were
+
+        If the complete tests do not look valid, nothing is salvaged
+        """
+        complete = []
+        salvaged = 0
+
+        for test_id, lines in self.blocks(self.in_path):
+
+            # Stop at the first test that was not finished (which comes back
+            # without an id)
+            if test_id is None and lines[0].startswith(self.TEST_START_MARKER):
+                break
+
+            if test_id is not None:
+                # Each test needs to say what it's testing
+                if None in test_id:
+                    return 0
+                salvaged += 1
+
+            complete.extend(lines)
+
+        # If we have no tests, there's nothing to salvage
+        if salvaged:
+            with open(self.out_path, "w") as output_file:
+                output_file.writelines(complete)
+
+        return salvaged
+
+    def blocks(self, filepath):
+        """
+        Splits a tst into blocks, yielding (test_id, lines) for each one
+
+        test_id is (unit, subprogram, name) for a test, and None for the
+        lines between tests
+        """
+        with open(filepath, "r") as f:
+
+            current = []
+            in_test = False
+            unit = subprogram = name = None
+
+            for line in f:
+
+                if not in_test and line.startswith(self.TEST_START_MARKER):
+
+                    # Flush whatever came before this test
+                    if current:
+                        yield None, current
+
+                    in_test = True
+                    current = []
+                    name = None
+
+                current.append(line)
+
+                if line.startswith("TEST.UNIT:"):
+                    unit = line.split(":", 1)[1].strip()
+
+                elif line.startswith("TEST.SUBPROGRAM:"):
+                    subprogram = line.split(":", 1)[1].split("(", 1)[0].strip()
+
+                elif line.startswith("TEST.NAME:"):
+                    name = line.split(":", 1)[1].strip()
+
+                if in_test and line.strip() == self.TEST_END_MARKER:
+                    yield (unit, subprogram, name), current
+
+                    in_test = False
+                    current = []
+
+            # Anything left over (including an unterminated test)
+            if current:
+                yield None, current
+
     def process(self, filepath, output_file, subprogram_regex, re_pattern):
 
         content_matcher = re.compile(re_pattern)
@@ -0,0 +1,293 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import shutil
+
+# Directives that start a test
+TEST_START_DIRECTIVES = ("TEST.NEW", "TEST.REPLACE", "TEST.ADD")
+
+# Directive that ends a test
+TEST_END_DIRECTIVE = "TEST.END"
+
+# Directives we expect to see in a tst
+KNOWN_DIRECTIVES = set(
+    TEST_START_DIRECTIVES
+    + (
+        TEST_END_DIRECTIVE,
+        "TEST.ATTRIBUTES",
+        "TEST.COMPOUND_ONLY",
+        "TEST.EXPECTED",
+        "TEST.EXPECTED_GLOBALS_ORDERING",
+        "TEST.FLOW",
+        "TEST.IMPORT_FAILURES",
+        "TEST.NAME",
+        "TEST.NOTES",
+        "TEST.REQUIREMENT_KEY",
+        "TEST.SCRIPT_FEATURE",
+        "TEST.SLOT",
+        "TEST.STUB",
+        "TEST.SUBPROGRAM",
+        "TEST.UNIT",
+        "TEST.VALUE",
+        "TEST.VALUE_USER_CODE",
+        "TEST.EXPECTED_USER_CODE",
+        "TEST.STUB_VAL_USER_CODE",
+        "TEST.STUB_EXP_USER_CODE",
+    )
+)
+
+# Blocks whose contents are free-form, mapped to the directive ending them
+FREE_FORM_BLOCKS = {
+    "TEST.NOTES": "TEST.END_NOTES",
+    "TEST.FLOW": "TEST.END_FLOW",
+    "TEST.IMPORT_FAILURES": "TEST.END_IMPORT_FAILURES",
+    "TEST.VALUE_USER_CODE": "TEST.END_VALUE_USER_CODE",
+    "TEST.EXPECTED_USER_CODE": "TEST.END_EXPECTED_USER_CODE",
+    "TEST.STUB_VAL_USER_CODE": "TEST.END_STUB_VAL_USER_CODE",
+    "TEST.STUB_EXP_USER_CODE": "TEST.END_STUB_EXP_USER_CODE",
+}
+
+# Directives whose values reference a unit and subprogram
+KEYED_DIRECTIVES = ("TEST.VALUE", "TEST.EXPECTED")
+
+
+def directive_of(line):
+    """
+    Splits a tst line into its directive and value (directive is None if the
+    line isn't one)
+    """
+    if not line.startswith("TEST."):
+        return None, None
+    directive, _, value = line.partition(":")
+    return directive.strip(), value.strip()
+
+
+def subprogram_name(subprogram):
+    """
+    Name of a subprogram, without its parameters
+    """
+    return subprogram.split("(", 1)[0].strip()
+
+
+def split_key(value):
+    """
+    Splits the value of a TEST.VALUE/TEST.EXPECTED into the parts of its key
+    (unit, subprogram, ...) -- separators inside parameter lists, templates and
+    subscripts, and C++'s '::', don't count
+    """
+    parts = []
+    depth = 0
+    start = 0
+    index = 0
+    while index < len(value):
+        char = value[index]
+        if char in "(<[":
+            depth += 1
+        elif char in ")>]":
+            depth = max(depth - 1, 0)
+        elif depth == 0 and value.startswith("::", index):
+            index += 2
+            continue
+        elif depth == 0 and char == ":":
+            break
+        elif depth == 0 and char == ".":
+            parts.append(value[start:index])
+            start = index + 1
+        index += 1
+    parts.append(value[start:index])
+    return parts
+
+
+class TstValidator(object):
+    """
+    Quick structural checks of a generated tst, so that a bad file is caught
+    before it costs an environment build and execution in baselining
+    """
+
+    def __init__(self, tst_path, unit=None, subprogram=None):
+
+        # The tst we're checking
+        self.tst_path = tst_path
+
+        # Which unit and subprogram should its tests be for? (None for any)
+        self.unit = unit
+        self.subprogram = subprogram
+
+        # What we found wrong: (line number, message)
+        self.diagnostics = []
+
+    def problem(self, line_number, msg):
+        self.diagnostics.append((line_number, msg))
+
+    def check_key(self, line_number, directive, value, unit, subprogram):
+        """
+        A TEST.VALUE/TEST.EXPECTED key of the test's unit must be for the
+        test's subprogram (or a global)
+        """
+        parts = split_key(value)
+        key = ".".join(parts)
+
+        if len(parts) < 2 or not parts[0]:
+            self.problem(
+                line_number, "{:s} key '{:s}' has no unit".format(directive, key)
+            )
+            return
+
+        key_unit, key_subprogram = parts[0], parts[1]
+        if key_unit != unit or key_subprogram.startswith("<<"):
+            return
+
+        # Overloads are compared without their parameters
+        if subprogram is None:
+            return
+        if subprogram_name(key_subprogram) != subprogram_name(subprogram):
+            self.problem(
+                line_number,
+                "{:s} key '{:s}' is not for subprogram '{:s}'".format(
+                    directive, key, subprogram
+                ),
+            )
+
+    def validate(self):
+        """
+        Checks the tst, returning the diagnostics (empty if it looks fine)
+        """
+        in_test = False
+        free_form_end = None
+        unit = subprogram = None
+        name = None
+        start_line = None
+        tests = 0
+
+        with open(self.tst_path) as tst_fd:
+            for line_number, line in enumerate(tst_fd, 1):
+                line = line.rstrip("\n")
+
+                # Anything goes in notes, user code, ...
+                if free_form_end is not None:
+                    if directive_of(line.strip())[0] == free_form_end:
+                        free_form_end = None
+                    continue
+
+                directive, value = directive_of(line)
+                if directive is None:
+                    continue
+
+                if directive not in KNOWN_DIRECTIVES:
+                    self.problem(
+                        line_number, "unknown directive '{:s}'".format(directive)
+                    )
+                    continue
+
+                if directive in FREE_FORM_BLOCKS:
+                    free_form_end = FREE_FORM_BLOCKS[directive]
+
+                if directive == "TEST.UNIT":
+                    unit = value
+                    if self.unit is not None and unit != self.unit:
+                        self.problem(
+                            line_number,
+                            "unit '{:s}' is not '{:s}'".format(unit, self.unit),
+                        )
+
+                elif directive == "TEST.SUBPROGRAM":
+                    subprogram = subprogram_name(value)
+                    expected = self.subprogram
+                    if expected is not None and subprogram != subprogram_name(expected):
+                        self.problem(
+                            line_number,
+                            "subprogram '{:s}' is not '{:s}'".format(
+                                subprogram, self.subprogram
+                            ),
+                        )
+
+                elif directive in TEST_START_DIRECTIVES:
+                    if in_test:
+                        self.problem(
+                            line_number,
+                            "{:s} inside the test started on line {:d}".format(
+                                directive, start_line
+                            ),
+                        )
+                    if unit is None or subprogram is None:
+                        self.problem(line_number, "test has no unit and subprogram")
+                    in_test = True
+                    start_line = line_number
+                    name = None
+
+                elif directive == TEST_END_DIRECTIVE:
+                    if not in_test:
+                        self.problem(line_number, "TEST.END outside of a test")
+                    elif name is None:
+                        self.problem(start_line, "test has no TEST.NAME")
+                    in_test = False
+                    tests += 1
+
+                elif directive == "TEST.NAME":
+                    name = value
+
+                elif directive in KEYED_DIRECTIVES:
+                    if not in_test:
+                        self.problem(
+                            line_number,
+                            "{:s} outside of a test".format(directive),
+                        )
+                    else:
+                        self.check_key(line_number, directive, value, unit, subprogram)
+
+        if free_form_end is not None:
+            self.problem(line_number, "missing {:s}".format(free_form_end))
+
+        if in_test:
+            self.problem(
+                start_line, "test started on line {:d} never ends".format(start_line)
+            )
+        elif tests == 0:
+            self.problem(1, "no tests")
+
+        return self.diagnostics
+
+    def quarantine(self, quarantine_dir):
+        """
+        Moves the tst into 'quarantine_dir', next to a diagnosis of what was
+        wrong with it -- returns where it went
+        """
+        if not os.path.isdir(quarantine_dir):
+            os.makedirs(quarantine_dir, exist_ok=True)
+
+        quarantined = os.path.join(quarantine_dir, os.path.basename(self.tst_path))
+        shutil.move(self.tst_path, quarantined)
+
+        with open("{:s}.diagnosis".format(quarantined), "w") as diagnosis_fd:
+            for line_number, msg in self.diagnostics:
+                diagnosis_fd.write(
+                    "{:s}:{:d}: {:s}\n".format(
+                        os.path.basename(self.tst_path), line_number, msg
+                    )
+                )
+
+        return quarantined
+
+
+# EOF
@@ -25,14 +25,25 @@
 import os
 import sys
 import logging
+import monotonic
 import multiprocessing
 
 import atg_execution.build_manage as build_manage
 import atg_execution.debug_report as atg_debug_report
 import atg_execution.default_parser as default_parser
 import atg_execution.discover as atg_discover
+import atg_execution.failure_cache as atg_failure_cache
 import atg_execution.process_project as atg_processor
+import atg_execution.publisher as atg_publisher
+import atg_execution.journal as atg_journal
+import atg_execution.log_store as atg_log_store
+import atg_execution.manage_cli as atg_manage_cli
 import atg_execution.misc as atg_misc
+import atg_execution.plan as atg_plan
+import atg_execution.resource_usage as atg_resource_usage
+import atg_execution.run_history as atg_run_history
+import atg_execution.timeouts as atg_timeouts
+import atg_execution.tracing as atg_tracing
 import atg_execution.configuration as atg_config
 
 from multiprocessing_logging import install_mp_handler
@@ -61,6 +72,43 @@ def process_options(options):
     if not options.workers:
         options.workers = multiprocessing.cpu_count()
 
+    # Tracing
+    if options.trace_file:
+        atg_tracing.tracer.enable()
+
+    # One file for all of the logs?
+    if options.log_store:
+        atg_log_store.log_store.open(options.log_store)
+
+    # History of earlier runs
+    if options.history_file:
+        atg_run_history.history.load(options.history_file)
+
+    # Routines that ATG keeps failing on
+    if options.failure_cache_file:
+        atg_failure_cache.failure_cache.load(
+            options.failure_cache_file,
+            options.failure_threshold,
+            options.failure_ttl * 3600,
+        )
+
+    # Can Manage take several operations in one go?
+    atg_manage_cli.manage_cli.coalesce = options.manage_coalesce
+
+    # Journal the completed work, so that we can resume
+    if options.atg_work_dir:
+        atg_journal.journal.open(
+            options.atg_work_dir,
+            atg_journal.journal_header(options),
+            resume=options.resume,
+        )
+
+    # When must we be finished by?
+    if options.time_budget:
+        options.deadline = monotonic.monotonic() + options.time_budget
+    else:
+        options.deadline = None
+
 
 def load_configuration(options):
     configuration_module = run_path(options.config_py)
@@ -78,28 +126,103 @@ def atg_execution(options):
     """
 
     process_options(options)
-    configuration = load_configuration(options)
 
-    if configuration.find_unchanged_files is not None:
-        atg_misc.print_warn(
-            "Finding unchanged files was configured, discovering changed files"
+    try:
+        return run_phases(options)
+    finally:
+        # Write-out the trace, even if something went wrong
+        if options.trace_file:
+            atg_tracing.tracer.save(options.trace_file)
+
+        # Same for the resource usage
+        if options.resource_usage_file:
+            atg_resource_usage.usage_table.save_csv(options.resource_usage_file)
+
+        # Learn from this run
+        atg_run_history.history.record(atg_resource_usage.usage_table.records)
+        atg_run_history.history.save()
+
+        # Remember what failed
+        atg_failure_cache.failure_cache.save()
+
+        # Publish what was finished, even if something went wrong
+        atg_publisher.close_all()
+
+        # Everything's logged
+        atg_log_store.log_store.close()
+
+
+def plan_atg(options, environment_dependencies, impacted_envs):
+    """
+    Plans the PyEDG invocations for the impacted environments, and reports
+    what they are predicted to cost
+    """
+    timeout_policy = atg_timeouts.TimeoutPolicy(options)
+
+    # All of the routines of all of the impacted environments
+    routine_contexts = []
+    for env in sorted(impacted_envs):
+        units = environment_dependencies.envs_to_units[env]
+        for src_file in sorted(units):
+            for routine_name in sorted(units[src_file]):
+                routine_contexts.append((env, src_file, routine_name))
+
+    if options.atg_batch_seconds:
+        batches = atg_plan.batch_routines(
+            routine_contexts,
+            timeout_policy,
+            options.atg_batch_seconds,
+            options.atg_max_batch,
         )
-        unchanged_files = configuration.find_unchanged_files()
     else:
-        atg_misc.print_warn(
-            "Finding unchanged files was not configured, all files will be processed"
-        )
-        unchanged_files = set()
+        batches = [
+            (env, src_file, [routine_name])
+            for env, src_file, routine_name in routine_contexts
+        ]
+
+    plan = atg_plan.ExecutionPlan(options.atg_work_dir)
+    for env in sorted(impacted_envs):
+        plan.add_environment(env, environment_dependencies.envs_to_units[env])
+    plan.add_atg_contexts(batches)
+
+    if options.plan_file:
+        plan.save(options.plan_file)
+
+    workers = options.workers_atg or options.workers
+    atg_debug_report.plan_report(plan, timeout_policy, workers)
+
+
+def run_phases(options):
+    """
+    Runs each phase of ATG
+    """
+
+    with atg_tracing.span("load_configuration", "phase"):
+        configuration = load_configuration(options)
+
+    with atg_tracing.span("find_unchanged_files", "phase"):
+        if configuration.find_unchanged_files is not None:
+            atg_misc.print_warn(
+                "Finding unchanged files was configured, discovering changed files"
+            )
+            unchanged_files = configuration.find_unchanged_files()
+        else:
+            atg_misc.print_warn(
+                "Finding unchanged files was not configured, all files will be processed"
+            )
+            unchanged_files = set()
 
     # Create our Manage project
-    manage_builder = build_manage.ManageBuilder(configuration)
-    manage_builder.process()
+    with atg_tracing.span("build_manage", "phase"):
+        manage_builder = build_manage.ManageBuilder(configuration)
+        manage_builder.process()
 
     # Discover the environments (not neccessarily tied to Manage!)
-    environment_dependencies = atg_discover.DiscoverEnvironmentDependencies(
-        configuration, manage_builder
-    )
-    environment_dependencies.process()
+    with atg_tracing.span("discover", "phase"):
+        environment_dependencies = atg_discover.DiscoverEnvironmentDependencies(
+            configuration, manage_builder
+        )
+        environment_dependencies.process()
 
     # Our set of impacted environments
     impacted_envs = set()
@@ -125,16 +248,23 @@ def atg_execution(options):
     if options.report:
 
         # Generate the report
-        atg_debug_report.debug_report(
-            configuration,
-            unchanged_files,
-            manage_builder,
-            environment_dependencies,
-            impacted_envs,
-        )
+        with atg_tracing.span("debug_report", "phase"):
+            atg_debug_report.debug_report(
+                configuration,
+                unchanged_files,
+                manage_builder,
+                environment_dependencies,
+                impacted_envs,
+                report_format=options.report_format,
+                report_file=options.report_file,
+            )
 
     if options.dry_run:
 
+        # What would we have run, and how long would it take?
+        with atg_tracing.span("plan", "phase"):
+            plan_atg(options, environment_dependencies, impacted_envs)
+
         # Let the user know something has happened
         atg_misc.print_warn("Dry-run mode: analysis only, no tests generated")
 
@@ -142,15 +272,38 @@ def atg_execution(options):
         return 0
 
     # Create an incremental ATG object
-    ia = atg_processor.ProcessProject(
-        configuration, impacted_envs, environment_dependencies,
-    )
+    with atg_tracing.span("process_project", "phase"):
+        ia = atg_processor.ProcessProject(
+            configuration, impacted_envs, environment_dependencies,
+        )
 
-    # Process our environments
-    ia.process()
+        # Process our environments
+        ia.process()
 
     # Store files
-    configuration.store_updated_tests(ia.updated_files)
+    with atg_tracing.span("store_updated_tests", "phase"):
+
+        updated_files = ia.updated_files
+
+        # Publish whatever hasn't been published yet
+        if ia.publisher is not None:
+            ia.publisher.close()
+
+            # Only hand over what the publisher didn't
+            updated_files = updated_files - ia.publisher.published
+
+        configuration.store_updated_tests(updated_files)
+
+    if options.report:
+
+        # Which tools were the most expensive?
+        atg_debug_report.resource_report(atg_resource_usage.usage_table)
+
+        # Which routines did we not retry?
+        atg_debug_report.failure_report(ia.failure_skips)
+
+        # How often did we start Manage?
+        atg_debug_report.manage_report(atg_manage_cli.manage_cli)
 
     atg_misc.print_msg("Processing completed!")
 
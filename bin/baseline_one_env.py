@@ -15,12 +15,18 @@ sys.path.insert(0, str(parent_dir))
 from atg_execution.baseline_for_atg import Baseline
 
 
-def baseline(env_script):
+def baseline(env_script, batch_clicast=False):
     """
-    Baselines the given script 'env_script'
+    Baselines the given script 'env_script' (running clicast from command
+    files if 'batch_clicast')
     """
     os.environ["VCAST_ATG_BASELINING"] = "1"
-    bl = Baseline(env_file=str(env_script), verbose=True, disable_failures=False)
+    bl = Baseline(
+        env_file=str(env_script),
+        verbose=True,
+        disable_failures=False,
+        batch_clicast=batch_clicast,
+    )
 
     # If you don't want to iterate at all
     #
@@ -36,23 +42,29 @@ def main():
     Main to help run a baseliner
     """
 
+    # Run clicast from command files?
+    args = sys.argv[1:]
+    batch_clicast = "--batch_clicast" in args
+    if batch_clicast:
+        args.remove("--batch_clicast")
+
     # Correct number of args?
-    if len(sys.argv) != 2:
+    if len(args) != 1:
         this_script = pathlib.Path(__file__).name
         print("Incorrect arguments:")
         print("")
-        print(f"    {this_script} <env name>")
+        print(f"    {this_script} [--batch_clicast] <env name>")
         print("")
         return -1
 
     # Correct type of first arg?
-    env_script = pathlib.Path(sys.argv[1])
+    env_script = pathlib.Path(args[0])
     if (not env_script.exists()) or env_script.suffix != ".env":
         print(f"Provided env script {env_script} is not valid")
         return -1
 
     # Llets run!
-    return baseline(env_script)
+    return baseline(env_script, batch_clicast)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+# Standard includes
+import argparse
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+# Get our parent dir
+parent_dir = pathlib.Path(__file__).parent.parent.resolve()
+
+# Add it to the front of path
+sys.path.insert(0, str(parent_dir))
+
+# Grab the discovery helpers
+from atg_execution.build_manage import find_build_dirs, file_contains
+
+SUCCESS = "Environment built Successfully"
+
+
+def make_build_tree(root, envs, harness_files, log_kib):
+    """
+    A Manage-like build folder: 'envs' build directories, each with an
+    '.env', a CCAST_.CFG and a built environment of 'harness_files' files
+    """
+    log_line = "Compiling harness file ...\n"
+    log_body = log_line * (log_kib * 1024 // len(log_line))
+    for index in range(envs):
+        build_dir = os.path.join(root, "build", "group{:d}".format(index % 10))
+        build_dir = os.path.join(build_dir, "ENV{:d}".format(index))
+        env_dir = os.path.join(build_dir, "ENV{:d}".format(index))
+        os.makedirs(os.path.join(env_dir, "harness"))
+        open(os.path.join(build_dir, "ENV{:d}.env".format(index)), "w").close()
+        open(os.path.join(build_dir, "CCAST_.CFG"), "w").close()
+        for harness_index in range(harness_files):
+            harness_file = "S{:04d}.c".format(harness_index)
+            open(os.path.join(env_dir, "harness", harness_file), "w").close()
+        with open(os.path.join(env_dir, "environment_builder.log"), "w") as f:
+            f.write(log_body)
+            f.write(SUCCESS + "\n")
+
+
+def walk_discovery(build_folder):
+    """
+    The discovery as it was: every folder is walked
+    """
+    found = set()
+    for root, _, files in os.walk(build_folder):
+        for fname in files:
+            if fname.lower().endswith(".env"):
+                if os.path.exists(os.path.join(root, "CCAST_.CFG")):
+                    found.add((os.path.splitext(fname)[0], os.path.abspath(root)))
+    return found
+
+
+def scandir_discovery(build_folder):
+    found = set()
+    for root, env_files in find_build_dirs(build_folder):
+        for fname in env_files:
+            found.add((os.path.splitext(fname)[0], os.path.abspath(root)))
+    return found
+
+
+def builder_logs(environments):
+    return [
+        os.path.join(build_dir, env, "environment_builder.log")
+        for env, build_dir in sorted(environments)
+    ]
+
+
+def read_check(logs):
+    return all(SUCCESS in open(log).read() for log in logs)
+
+
+def tail_check(logs):
+    return all(file_contains(log, SUCCESS) for log in logs)
+
+
+def timed(name, routine, *args):
+    start = time.perf_counter()
+    result = routine(*args)
+    print("{:>20s}: {:7.3f}s".format(name, time.perf_counter() - start))
+    return result
+
+
+def main():
+    """
+    Times environment discovery and build checks on a synthetic build tree
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--envs", type=int, default=1000)
+    parser.add_argument("--harness_files", type=int, default=100)
+    parser.add_argument("--log_kib", type=int, default=256)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        make_build_tree(root, args.envs, args.harness_files, args.log_kib)
+        build_folder = os.path.join(root, "build")
+        print(
+            "{:d} environments, {:d} harness files each, {:d} KiB logs".format(
+                args.envs, args.harness_files, args.log_kib
+            )
+        )
+
+        walked = timed("os.walk", walk_discovery, build_folder)
+        scanned = timed("pruned scandir", scandir_discovery, build_folder)
+        assert walked == scanned and len(scanned) == args.envs
+
+        logs = builder_logs(scanned)
+        assert timed("read whole log", read_check, logs)
+        assert timed("read log tail", tail_check, logs)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# EOF
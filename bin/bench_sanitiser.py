@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+# Standard includes
+import argparse
+import pathlib
+import random
+import sys
+import time
+
+# Get our parent dir
+parent_dir = pathlib.Path(__file__).parent.parent.resolve()
+
+# Add it to the front of path
+sys.path.insert(0, str(parent_dir))
+
+# Grab the sanitiser
+from atg_execution.exception_extractor import LineSanitiser
+
+# What the last lines of ATG's exceptions look like
+TEMPLATES = [
+    "## ATGUnexpected: Region size exceeds limit ==> size={size} region=r{n}:s{n} limit=128 ==> tk_{n}:tk_struct",
+    "## ATGUnexpected: Cannot generate value line for ==> field_{n} ==> <obj at 0x{addr:x}>",
+    "## ATGUnexpected: Non-NULL pointer const used ==> ptr_{n} ==> 0x{addr:x}",
+    "## ATGUnexpected: Missing memory region ==> size={size} ==> region=heap:{n}",
+    "## ATGUnexpected: Invalid TEST.VALUE line (validation failed) ==> (key: k{n} value: <<malloc {n}>>)",
+    "## ATGUnexpected: Function pointer has no candidate function mapping ==> fp_{n}",
+    "## ATGUnexpected: Needs-Alloc handling crashed ==> 0x{addr:x}",
+    "## KeyError: 'field_{n}'",
+]
+
+
+def make_corpus(count, seed):
+    """
+    'count' synthetic exception lines
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        template = rng.choice(TEMPLATES)
+        corpus.append(
+            template.format(
+                size=rng.randint(-4096, 4096),
+                n=rng.randint(0, 50),
+                addr=rng.getrandbits(48),
+            )
+        )
+    return corpus
+
+
+def substring_proc(line):
+    """
+    The sanitiser as it was: a substring test per trigger
+    """
+    sanitiser = LineSanitiser(line)
+    for trigger, action_name in LineSanitiser.ACTIONS.items():
+        if trigger in sanitiser.line:
+            getattr(sanitiser, "action_" + action_name)()
+    return sanitiser.line
+
+
+def compiled_proc(line):
+    """
+    One search of the compiled triggers
+    """
+    sanitiser = LineSanitiser(line)
+    sanitiser.dispatch()
+    return sanitiser.line
+
+
+def normalised_proc(line):
+    """
+    The full sanitiser, volatile tokens included
+    """
+    return LineSanitiser(line).proc()
+
+
+def bench(name, proc, corpus):
+    start = time.perf_counter()
+    signatures = set(proc(line) for line in corpus)
+    elapsed = time.perf_counter() - start
+    rate = len(corpus) / elapsed
+    print(
+        f"{name:>10}: {elapsed:7.2f}s {rate:12,.0f} lines/s {len(signatures):10,} signatures"
+    )
+
+
+def main():
+    """
+    Times the exception sanitiser on a synthetic corpus
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--lines", type=int, default=2000000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.lines, args.seed)
+    print(f"{len(corpus):,} lines, {len(set(corpus)):,} distinct")
+
+    bench("substring", substring_proc, corpus)
+    bench("compiled", compiled_proc, corpus)
+    bench("normalised", normalised_proc, corpus)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# EOF
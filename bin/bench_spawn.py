@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# Standard includes
+import argparse
+import pathlib
+import shutil
+import sys
+import time
+
+# Get our parent dir
+parent_dir = pathlib.Path(__file__).parent.parent.resolve()
+
+# Add it to the front of path
+sys.path.insert(0, str(parent_dir))
+
+# Grab the command runner
+from atg_execution.misc import run_cmd
+
+
+def launch(count, cmd, shell):
+    """
+    Seconds to run 'cmd' 'count' times through run_cmd
+    """
+    start = time.perf_counter()
+    for _ in range(count):
+        run_cmd(cmd, cwd=".", shell=shell)
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    Times spawning a trivial binary through run_cmd, with and without a
+    shell
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--launches", type=int, default=2000)
+    parser.add_argument("--binary", default=shutil.which("true") or "/bin/true")
+    args = parser.parse_args()
+
+    print("{:d} launches of {:s}".format(args.launches, args.binary))
+
+    # The same command, as a shell string and as argv
+    with_shell = launch(args.launches, "{:s} --flag 'a b'".format(args.binary), True)
+    argv = launch(args.launches, [args.binary, "--flag", "a b"], False)
+
+    for name, seconds in (("shell=True", with_shell), ("argv", argv)):
+        print(
+            "{:>12s}: {:6.2f}s {:8.2f} ms/launch".format(
+                name, seconds, 1000.0 * seconds / args.launches
+            )
+        )
+    print("{:>12s}: {:6.2f}x".format("speed-up", with_shell / argv))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# EOF
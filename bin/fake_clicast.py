@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+# Standard includes
+import os
+import pathlib
+import shlex
+import shutil
+import sys
+
+#
+# A stand-in for clicast (and vpython), so that the baseliner can be run
+# without VectorCAST:
+#
+#     bin/fake_clicast.py --install <dir>
+#     VECTORCAST_DIR=<dir> bin/baseline_one_env.py <env>.env
+#
+# Environments are folders, and a test script run into an environment is what
+# 'test script create' gives back. Each invocation is appended to
+# $FAKE_CLICAST_LOG (if set), so that invocations can be counted
+#
+
+# What clicast echoes before each command of a command file
+COMMAND_ECHO = ">> "
+
+# What a new .tst looks like
+EMPTY_TST = "-- VectorCAST 20 (fake)\n-- Test Case Script\n"
+
+
+def env_tests(env):
+    return os.path.join(env, "tests.tst")
+
+
+def clicast_command(words, env):
+    """
+    Runs one clicast command ('words', without the options)
+    """
+
+    # clicast takes any abbreviation, in any case
+    command = [word.lower() for word in words]
+
+    def is_command(*prefixes):
+        return len(command) >= len(prefixes) and all(
+            word.startswith(prefix[:3]) and prefix.startswith(word)
+            for word, prefix in zip(command, prefixes)
+        )
+
+    if is_command("environment", "script", "run"):
+        env_name = os.path.splitext(os.path.basename(words[3]))[0]
+        os.makedirs(env_name)
+        with open(env_tests(env_name), "w") as tests_fd:
+            tests_fd.write(EMPTY_TST)
+        print("Environment built Successfully")
+
+    elif is_command("tools", "execute"):
+        with open(words[2]) as command_fd:
+            for line in command_fd:
+                line = line.strip()
+                if not line:
+                    continue
+                print(COMMAND_ECHO + line)
+                returncode = clicast(shlex.split(line))
+                if returncode:
+                    return returncode
+
+    elif env is None or not os.path.isdir(env):
+        print("Environment {} does not exist".format(env))
+        return 1
+
+    elif is_command("tools", "auto_baseline_test") or is_command(
+        "tools", "auto_atg_test"
+    ):
+        with open(words[2], "w") as tst_fd:
+            tst_fd.write(EMPTY_TST)
+
+    elif is_command("test", "script", "run"):
+        shutil.copyfile(words[3], env_tests(env))
+        print("Script run of {} complete".format(words[3]))
+
+    elif is_command("test", "script", "create"):
+        shutil.copyfile(env_tests(env), words[3])
+        print("Script {} created".format(words[3]))
+
+    elif is_command("test", "delete"):
+        with open(env_tests(env), "w") as tests_fd:
+            tests_fd.write(EMPTY_TST)
+        print("Test cases deleted from {}".format(env))
+
+    elif is_command("execute", "batch"):
+        print("Executing tests in {}".format(env))
+
+    elif is_command("test", "actuals_to_expected"):
+        print("Actuals copied to expected values in {}".format(env))
+
+    else:
+        print("Unknown command: {}".format(" ".join(words)))
+        return 1
+
+    return 0
+
+
+def clicast(argv):
+    """
+    Parses clicast's options, then runs the command
+    """
+    env = None
+    words = list(argv)
+    while words and words[0].startswith("-"):
+        option = words.pop(0)
+        if option == "-e":
+            env = words.pop(0)
+        elif option == "-l":
+            words.pop(0)
+    return clicast_command(words, env)
+
+
+def vpython(argv):
+    """
+    Stands in for strip_failures.py: nothing fails, so nothing is stripped
+    """
+    _, input_tst, output_tst = argv[:3]
+    shutil.copyfile(input_tst, output_tst)
+    return 0
+
+
+def install(folder):
+    """
+    Makes 'folder' look like a VectorCAST installation
+    """
+    os.makedirs(folder, exist_ok=True)
+    this_script = pathlib.Path(__file__).resolve()
+    for tool in ("clicast", "vpython"):
+        tool_path = os.path.join(folder, tool)
+        if os.path.lexists(tool_path):
+            os.remove(tool_path)
+        os.symlink(this_script, tool_path)
+    print("Set VECTORCAST_DIR={}".format(os.path.abspath(folder)))
+    return 0
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--install":
+        return install(sys.argv[2])
+
+    tool = os.path.basename(sys.argv[0])
+
+    invocation_log = os.environ.get("FAKE_CLICAST_LOG")
+    if invocation_log:
+        with open(invocation_log, "a") as log_fd:
+            log_fd.write(" ".join([tool] + sys.argv[1:]) + "\n")
+
+    if tool == "vpython":
+        return vpython(sys.argv[1:])
+    return clicast(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# EOF
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# Standard includes
+import argparse
+import datetime
+import pathlib
+import sys
+
+# Get our parent dir
+parent_dir = pathlib.Path(__file__).parent.parent.resolve()
+
+# Add it to the front of path
+sys.path.insert(0, str(parent_dir))
+
+# Grab the index
+from atg_execution.exception_index import ExceptionIndex
+from terminaltables import AsciiTable
+
+
+def run_title(run):
+    """
+    Column title for a run: its label, or when it started
+    """
+    run_id, started, label = run
+    if label:
+        return label
+    return datetime.datetime.fromtimestamp(started).strftime("%m-%d %H:%M")
+
+
+def environments(index, args):
+    rows = index.environments(args.query, last_runs=args.runs, raw=args.raw)
+    table = [["Environment", "Runs", "Tests", "Exceptions"]]
+    table.extend([list(row) for row in rows])
+    print(AsciiTable(table).table)
+
+
+def trend(index, args):
+    runs, trends = index.trend(
+        args.query, last_runs=args.runs, raw=args.raw, limit=args.limit
+    )
+    table = [["Last line"] + [run_title(run) for run in runs]]
+    for last_line, counts in trends:
+        if len(last_line) > args.width:
+            last_line = last_line[: args.width - 3] + "..."
+        table.append([last_line] + counts)
+    print(AsciiTable(table).table)
+
+
+def main():
+    """
+    Queries the exception index written by exception_extractor's --index
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("index", help="The SQLite exception index")
+    parser.add_argument(
+        "command",
+        choices=["environments", "trend"],
+        help="environments: which environments hit the exception; "
+        "trend: counts of each matching signature per run",
+    )
+    parser.add_argument("query", help="Text to find in the exceptions")
+    parser.add_argument(
+        "--runs", type=int, default=10, help="How many of the latest runs to look at"
+    )
+    parser.add_argument(
+        "--raw", action="store_true", help="The query is in FTS5 query syntax"
+    )
+    parser.add_argument(
+        "--limit", type=int, default=20, help="Most signatures to show for trend"
+    )
+    parser.add_argument(
+        "--width", type=int, default=80, help="Widest last line to show for trend"
+    )
+    args = parser.parse_args()
+
+    if not pathlib.Path(args.index).exists():
+        print(f"Index {args.index} does not exist")
+        return -1
+
+    index = ExceptionIndex(args.index)
+    try:
+        {"environments": environments, "trend": trend}[args.command](index, args)
+    finally:
+        index.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# EOF
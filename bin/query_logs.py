@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+# Standard includes
+import argparse
+import datetime
+import pathlib
+import re
+import sys
+
+# Get our parent dir
+parent_dir = pathlib.Path(__file__).parent.parent.resolve()
+
+# Add it to the front of path
+sys.path.insert(0, str(parent_dir))
+
+# Grab the log store
+from atg_execution.log_store import matches, read_entry, read_index
+from terminaltables import AsciiTable
+
+
+def list_logs(store, entries, args):
+    table = [["When", "Environment", "Routine", "Stage", "Log", "Size"]]
+    for entry in entries:
+        when = datetime.datetime.fromtimestamp(entry["time"])
+        table.append(
+            [
+                when.strftime("%m-%d %H:%M:%S"),
+                entry["environment"] or "",
+                entry["routine"] or "",
+                entry["stage"] or "",
+                entry["name"],
+                entry["size"],
+            ]
+        )
+    print(AsciiTable(table).table)
+
+
+def cat_logs(store, entries, args):
+    for entry in entries:
+        sys.stdout.write(read_entry(store, entry))
+
+
+def grep_logs(store, entries, args):
+    pattern = re.compile(args.pattern)
+    found = False
+    for entry in entries:
+        for line in read_entry(store, entry).splitlines():
+            if pattern.search(line):
+                print("{:s}:{:s}".format(entry["name"], line))
+                found = True
+    return found
+
+
+def main():
+    """
+    Lists, prints and searches the logs kept by --log_store
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("store", help="The log store")
+    parser.add_argument(
+        "command",
+        choices=["ls", "cat", "grep"],
+        help="ls: what logs are there; cat: print the logs; "
+        "grep: lines of the logs matching a pattern",
+    )
+    parser.add_argument("pattern", nargs="?", help="Regular expression for grep")
+    parser.add_argument("--env", help="Only logs of this environment")
+    parser.add_argument("--routine", help="Only logs of this routine")
+    parser.add_argument("--stage", help="Only logs of this stage (e.g., baseline)")
+    parser.add_argument("--name", help="Only logs whose name matches this glob")
+    args = parser.parse_args()
+
+    if args.command == "grep" and args.pattern is None:
+        parser.error("grep needs a pattern")
+
+    if not pathlib.Path(args.store).exists():
+        print(f"Log store {args.store} does not exist")
+        return -1
+
+    entries = [
+        entry
+        for entry in read_index(args.store)
+        if matches(entry, args.env, args.routine, args.stage, args.name)
+    ]
+
+    commands = {"ls": list_logs, "cat": cat_logs, "grep": grep_logs}
+    if commands[args.command](args.store, entries, args) is False:
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# EOF
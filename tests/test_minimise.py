@@ -0,0 +1,145 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import json
+import threading
+
+import atg_execution.misc as atg_misc
+import atg_execution.process_project as atg_processor
+
+# Tests of an environment, as written by prune and merge
+COMBINED_TST = """\
+-- VectorCAST 20
+TEST.UNIT:u
+TEST.SUBPROGRAM:f
+TEST.NEW
+TEST.NAME:existing
+TEST.END
+TEST.UNIT:u
+TEST.SUBPROGRAM:f
+TEST.NEW
+TEST.NAME:ATG-TEST-1
+TEST.END
+TEST.UNIT:u
+TEST.SUBPROGRAM:f
+TEST.NEW
+TEST.NAME:ATG-TEST-2
+TEST.END
+"""
+
+# What each test covers
+TEST_POINTS = {
+    "u|f|existing": ["s1", "s2"],
+    "u|f|ATG-TEST-1": ["s1"],
+    "u|f|ATG-TEST-2": ["s2", "s3"],
+}
+
+
+class FakeClicast(object):
+    """
+    Stands in for run_cmd: an environment holds the tests imported since
+    they were last deleted
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.tests = ["existing (from baselining)"]
+
+    def __call__(self, cmd, cwd=None, log_file_prefix=None, context=None, **kwargs):
+        step = context["step"]
+        self.steps.append(step)
+        if step == "delete":
+            self.tests = []
+        elif step == "import":
+            self.tests.extend(["existing", "ATG-TEST-1", "ATG-TEST-2"])
+        elif step == "dump":
+            # Duplicated tests would be imported under new names
+            assert len(self.tests) == len(set(self.tests)) == len(TEST_POINTS)
+            with open(cmd[-1], "w") as coverage_fd:
+                json.dump(TEST_POINTS, coverage_fd)
+        return "", "", 0
+
+
+def make_processor(final_tst_path):
+    """
+    Just enough of a ProcessProject to minimise an environment
+    """
+    processor = object.__new__(atg_processor.ProcessProject)
+    processor.atg_work_dir = None
+    processor.final_tst_path = final_tst_path
+    processor.memory_budget = None
+    processor.memory_limit_kb = None
+    processor.mutex = threading.Lock()
+    processor.merged_tsts = {}
+    processor.minimise_reports = {}
+    processor.finished = []
+    processor.environment_finished = processor.finished.append
+    processor.move_progress_bar = lambda: None
+    return processor
+
+
+def test_minimise_clears_the_environment(tmp_path, monkeypatch):
+    env_path = tmp_path / "build" / "ENV"
+    env_path.mkdir(parents=True)
+    (tmp_path / "build" / "combined_atg_existing.tst").write_text(COMBINED_TST)
+    (tmp_path / "final" / "ENV").mkdir(parents=True)
+
+    clicast = FakeClicast()
+    monkeypatch.setattr(atg_misc, "run_cmd", clicast)
+
+    processor = make_processor(str(tmp_path / "final"))
+    processor.minimise_one_environment(str(env_path))
+
+    assert clicast.steps == ["delete", "import", "execute", "dump"]
+
+    # ATG-TEST-1 adds nothing over the existing test
+    final_tst = tmp_path / "final" / "ENV" / "ENV.tst"
+    names = [
+        line.split(":", 1)[1]
+        for line in final_tst.read_text().splitlines()
+        if line.startswith("TEST.NAME:")
+    ]
+    assert names == ["existing", "ATG-TEST-2"]
+    assert processor.finished == [str(final_tst)]
+
+
+
+def test_minimise_keeps_tests_without_names(tmp_path, monkeypatch):
+    env_path = tmp_path / "build" / "ENV"
+    env_path.mkdir(parents=True)
+    nameless = "TEST.UNIT:u\nTEST.SUBPROGRAM:f\nTEST.NEW\nTEST.END\n"
+    (tmp_path / "build" / "combined_atg_existing.tst").write_text(
+        COMBINED_TST + nameless
+    )
+    (tmp_path / "final" / "ENV").mkdir(parents=True)
+
+    monkeypatch.setattr(atg_misc, "run_cmd", FakeClicast())
+
+    processor = make_processor(str(tmp_path / "final"))
+    processor.minimise_one_environment(str(env_path))
+
+    final_tst = tmp_path / "final" / "ENV" / "ENV.tst"
+    assert final_tst.read_text().endswith(nameless)
+
+
+# EOF
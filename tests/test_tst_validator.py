@@ -0,0 +1,81 @@
+# The MIT License
+#
+# Copyright (c) 2020 Vector Informatik, GmbH. http://vector.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import pytest
+
+from atg_execution.tst_validator import TstValidator, split_key
+
+# A test of an overloaded C++ routine, as ATG writes it
+OVERLOADED_TST = """\
+-- VectorCAST 20
+TEST.UNIT:u
+TEST.SUBPROGRAM:ns::C::f(int, ns::T)
+TEST.NEW
+TEST.NAME:f.001
+TEST.VALUE:u.ns::C::f(int, ns::T).x:1
+TEST.VALUE:u.<<GLOBAL>>.g:2
+TEST.EXPECTED:u.ns::C::f(int, ns::T).return:3
+TEST.END
+"""
+
+
+def validate(tmp_path, contents, unit, subprogram):
+    tst_path = tmp_path / "routine.tst"
+    tst_path.write_text(contents)
+    return TstValidator(str(tst_path), unit, subprogram).validate()
+
+
+@pytest.mark.parametrize("routine", ["ns::C::f(int, ns::T)", "ns::C::f"])
+def test_overloaded_routine(tmp_path, routine):
+    assert validate(tmp_path, OVERLOADED_TST, "u", routine) == []
+
+
+def test_other_routine(tmp_path):
+    diagnostics = validate(tmp_path, OVERLOADED_TST, "u", "ns::C::g(int)")
+    assert [msg for _, msg in diagnostics] == [
+        "subprogram 'ns::C::f' is not 'ns::C::g(int)'"
+    ]
+
+
+def test_key_of_other_routine(tmp_path):
+    contents = OVERLOADED_TST.replace("TEST.VALUE:u.ns::C::f(", "TEST.VALUE:u.g(")
+    diagnostics = validate(tmp_path, contents, "u", "ns::C::f(int, ns::T)")
+    assert [msg for _, msg in diagnostics] == [
+        "TEST.VALUE key 'u.g(int, ns::T).x' is not for subprogram 'ns::C::f'"
+    ]
+
+
+def test_no_tests(tmp_path):
+    diagnostics = validate(tmp_path, "-- VectorCAST 20\n", "u", "ns::C::f")
+    assert [msg for _, msg in diagnostics] == ["no tests"]
+
+
+def test_split_key():
+    assert split_key("u.f(a.b, c::d).x[1].y:<<malloc 2>>") == [
+        "u",
+        "f(a.b, c::d)",
+        "x[1]",
+        "y",
+    ]
+
+
+# EOF